@@ -1,13 +1,34 @@
 # app.py
 
-from flask import Flask, render_template, request
-from utils.address_cleaner import clean_address_fields
+import io
+import os
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from dotenv import load_dotenv
 
+# Load .env before the utils modules read their configuration
 load_dotenv()
 
+from utils.address_cleaner import clean_address_fields, clean_address_batch, is_address
+from utils.bulk_clean import clean_stream, READERS, DEFAULT_CHUNK_SIZE
+from utils import graph_driver
+from utils.graph_backend import GRAPH_BACKEND
+from utils.result_cache import result_cache
+from utils.anomaly_store import get_anomaly_store
+from utils.alias_index import get_alias_index
+from utils.update_worker import get_update_worker
+from utils.event_log import get_event_log
+from utils.llm_client import get_llm
+from utils.metrics import registry
+
 app = Flask(__name__)
 
+# One pooled Neo4j driver per worker process, closed on shutdown
+# The embedded in-memory backend never talks to Neo4j
+if GRAPH_BACKEND == 'neo4j':
+    graph_driver.init_app(app)
+
+MAX_BATCH_SIZE = int(os.getenv("JANITOR_MAX_BATCH_SIZE", "5000"))
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     cleaned_data = None
@@ -33,6 +54,97 @@ def index():
     
     return render_template('index.html', cleaned_data=cleaned_data)
 
+@app.route('/api/clean', methods=['POST'])
+def clean():
+    payload = request.get_json(silent=True)
+    if not is_address(payload):
+        return jsonify({'error': 'Expected a JSON {city, state, country} object with string fields.'}), 400
+    city, state, country = (payload.get(field) or '' for field in ('city', 'state', 'country'))
+    cleaned_address = clean_address_fields(city, state, country)
+    return jsonify({'original_city': city, 'original_state': state, 'original_country': country, **cleaned_address})
+
+@app.route('/api/clean/batch', methods=['POST'])
+def clean_batch():
+    # Accept either a bare list of addresses or {"addresses": [...]}
+    payload = request.get_json(silent=True)
+    addresses = payload.get('addresses') if isinstance(payload, dict) else payload
+    if not isinstance(addresses, list) or not all(is_address(a) for a in addresses):
+        return jsonify({'error': 'Expected a JSON list of {city, state, country} objects with string fields.'}), 400
+    if len(addresses) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Batch size exceeds the limit of {MAX_BATCH_SIZE} addresses.'}), 413
+
+    cleaned_addresses = clean_address_batch(addresses)
+    results = [
+        {
+            'original_city': address.get('city'),
+            'original_state': address.get('state'),
+            'original_country': address.get('country'),
+            **cleaned_address
+        }
+        for address, cleaned_address in zip(addresses, cleaned_addresses)
+    ]
+    return jsonify({'results': results})
+
+@app.route('/api/clean/stream', methods=['POST'])
+def clean_upload_stream():
+    # Infer the format from ?format=, then the Content-Type, defaulting to CSV
+    input_format = request.args.get('format')
+    if not input_format:
+        input_format = 'jsonl' if 'json' in (request.content_type or '') else 'csv'
+    if input_format not in READERS:
+        return jsonify({'error': f"Unsupported format '{input_format}', expected csv or jsonl."}), 400
+    chunk_size = request.args.get('chunk_size', DEFAULT_CHUNK_SIZE, type=int)
+    if not chunk_size or not 0 < chunk_size <= MAX_BATCH_SIZE:
+        return jsonify({'error': f'chunk_size must be between 1 and {MAX_BATCH_SIZE}.'}), 400
+    flag_anomalies = request.args.get('flag_anomalies', '').lower() in ('1', 'true', 'yes')
+
+    # Read the request body line by line rather than buffering the upload
+    lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    output = clean_stream(lines, input_format, chunk_size=chunk_size, flag_anomalies=flag_anomalies)
+    mimetype = 'application/x-ndjson' if input_format == 'jsonl' else 'text/csv'
+    return Response(stream_with_context(output), mimetype=mimetype)
+
+@app.route('/api/driver/stats')
+def driver_stats():
+    return jsonify(graph_driver.pool_stats())
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/api/anomalies/stats')
+def anomaly_stats():
+    return jsonify(get_anomaly_store().stats())
+
+@app.route('/api/aliases/stats')
+def alias_stats():
+    return jsonify(get_alias_index().stats())
+
+@app.route('/api/events/stats')
+def event_stats():
+    event_log = get_event_log()
+    return jsonify(event_log.stats() if event_log is not None else {'enabled': False})
+
+@app.route('/api/llm/stats')
+def llm_stats():
+    return jsonify(get_llm().stats())
+
+@app.route('/api/updates/status')
+def update_status():
+    # ?key=<normalized anomaly key> returns a single job, otherwise the queue summary
+    key = request.args.get('key')
+    if key is None:
+        return jsonify(get_update_worker().status())
+    job = get_update_worker().job_status(key)
+    if job is None:
+        return jsonify({'error': f"No update job for '{key}'."}), 404
+    return jsonify(job)
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus text format; counters are per worker process
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/documentation')
 def documentation():
     return render_template('documentation.html')
@@ -0,0 +1,130 @@
+# asgi.py
+#
+# Async serving mode. The JSON cleaning endpoints run on the event loop, using
+# the async Neo4j driver and AsyncOpenAI, so one worker holds many in-flight
+# lookups and LLM calls and clean requests don't queue behind anomalies.
+# Every other route is served by the Flask app in app.py on a thread pool.
+#
+#   gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+#   uvicorn asgi:app --workers 4
+
+import os
+import json
+import asyncio
+from a2wsgi import WSGIMiddleware
+
+from app import app as flask_app, MAX_BATCH_SIZE
+from utils.address_cleaner import clean_address_fields_async, clean_address_batch_async, is_address
+from utils.graph_driver import close_async_driver, close_driver
+from utils import update_worker, warmup
+from utils.log import get_logger
+
+logger = get_logger('asgi')
+
+# Threads serving the Flask routes (the HTML form, streaming uploads, stats)
+WSGI_THREADS = int(os.getenv("JANITOR_WSGI_THREADS", "10"))
+
+# How long shutdown waits for queued CeeyMore update jobs
+UPDATE_SHUTDOWN_TIMEOUT = float(os.getenv("JANITOR_UPDATE_SHUTDOWN_TIMEOUT", "30"))
+
+wsgi_app = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+
+
+async def _read_json(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    try:
+        return json.loads(body or b'null')
+    except ValueError:
+        return None
+
+
+async def _send_json(send, payload, status=200):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def clean(payload):
+    """
+    POST /api/clean with {city, state, country}; same response as /api/clean in app.py.
+    """
+    if not is_address(payload):
+        return {'error': 'Expected a JSON {city, state, country} object with string fields.'}, 400
+    city, state, country = (payload.get(field) or '' for field in ('city', 'state', 'country'))
+    cleaned_address = await clean_address_fields_async(city, state, country)
+    return {'original_city': city, 'original_state': state, 'original_country': country, **cleaned_address}, 200
+
+
+async def clean_batch(payload):
+    """
+    POST /api/clean/batch; same request and response as /api/clean/batch in app.py.
+    """
+    addresses = payload.get('addresses') if isinstance(payload, dict) else payload
+    if not isinstance(addresses, list) or not all(is_address(a) for a in addresses):
+        return {'error': 'Expected a JSON list of {city, state, country} objects with string fields.'}, 400
+    if len(addresses) > MAX_BATCH_SIZE:
+        return {'error': f'Batch size exceeds the limit of {MAX_BATCH_SIZE} addresses.'}, 413
+
+    cleaned_addresses = await clean_address_batch_async(addresses)
+    results = [
+        {
+            'original_city': address.get('city'),
+            'original_state': address.get('state'),
+            'original_country': address.get('country'),
+            **cleaned_address
+        }
+        for address, cleaned_address in zip(addresses, cleaned_addresses)
+    ]
+    return {'results': results}, 200
+
+
+ROUTES = {
+    '/api/clean': clean,
+    '/api/clean/batch': clean_batch,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Also covers plain uvicorn, which has no post_worker_init; under
+            # gunicorn everything is already built and this returns quickly
+            if warmup.WARMUP:
+                await asyncio.to_thread(warmup.warm_up)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Let queued CeeyMore update jobs finish before the pools go away
+            if update_worker._update_worker is not None:
+                await asyncio.to_thread(update_worker._update_worker.shutdown, UPDATE_SHUTDOWN_TIMEOUT)
+            await close_async_driver()
+            close_driver()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    handler = ROUTES.get(scope['path']) if scope['type'] == 'http' else None
+    if handler is None:
+        return await wsgi_app(scope, receive, send)
+    if scope['method'] != 'POST':
+        return await _send_json(send, {'error': 'Method not allowed.'}, 405)
+
+    try:
+        payload, status = await handler(await _read_json(receive))
+    except Exception:
+        logger.exception("Error handling %s", scope['path'])
+        payload, status = {'error': 'Internal server error.'}, 500
+    await _send_json(send, payload, status)
@@ -0,0 +1,111 @@
+# bench/corpus.py
+#
+# Replay corpora: JSON Lines with one address request per line,
+#   {"city": ..., "state": ..., "country": ..., "kind": ..., "expected": {"city", "state", "country"}}
+# where "kind" and "expected" are optional. The event log (utils/event_log.py)
+# has the same city/state/country fields, so its files, rotated and gzipped
+# ones included, can be replayed as they are.
+
+import glob
+import gzip
+import json
+import random
+from utils.gazetteer import get_gazetteer
+from utils.graph_backend import load_cities
+
+KINDS = ('clean', 'case', 'code', 'typo', 'anomalous')
+
+
+def read_corpus(path):
+    """
+    Read a replay corpus. `path` may be a glob pattern, read oldest rotated
+    file first, and .gz files are decompressed. Only 'clean' events are kept
+    from event logs.
+    """
+    paths = sorted(glob.glob(path), key=lambda name: (-_rotation(name), name)) or [path]
+    entries = []
+    for name in paths:
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(name, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if entry.get('event', 'clean') == 'clean':
+                        entries.append(entry)
+    return entries
+
+
+def _rotation(name):
+    # events.jsonl.3.gz -> 3, events.jsonl -> 0
+    suffix = name[:-len('.gz')] if name.endswith('.gz') else name
+    number = suffix.rpartition('.')[2]
+    return int(number) if number.isdigit() else 0
+
+
+def write_corpus(entries, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def _typo(value, rng):
+    """
+    Apply one deletion, transposition or substitution to a word of 4+ letters.
+    """
+    if len(value) < 4:
+        return value
+    i = rng.randrange(1, len(value) - 1)
+    operation = rng.choice(('delete', 'swap', 'replace'))
+    if operation == 'delete':
+        return value[:i] + value[i + 1:]
+    if operation == 'swap':
+        return value[:i - 1] + value[i] + value[i - 1] + value[i + 1:]
+    return value[:i] + rng.choice('aeiou') + value[i + 1:]
+
+
+def generate_corpus(size, seed=0, weights=(0.5, 0.15, 0.1, 0.15, 0.1)):
+    """
+    Build a deterministic corpus from import/cities.csv.
+
+    Args:
+        size (int): Number of requests.
+        seed (int): Random seed.
+        weights (tuple): Relative frequency of each kind in KINDS:
+            clean      - canonical names
+            case       - canonical names in odd casing and spacing
+            code       - ISO3 country code and admin1 code for the state
+            typo       - a one-character typo in the city or state
+            anomalous  - a city that isn't in the reference data
+
+    Returns:
+        list: Corpus entries with the expected cleaned output.
+    """
+    rng = random.Random(seed)
+    gazetteer = get_gazetteer()
+    iso3 = {}
+    for key, iso_code in gazetteer.country_index.items():
+        if len(key) == 3 and key.upper() != iso_code:
+            iso3.setdefault(iso_code, key.upper())
+    cities = load_cities()
+
+    entries = []
+    for _ in range(size):
+        city, admin_code = rng.choice(cities)
+        state = gazetteer.states[admin_code]
+        country = gazetteer.countries[state['iso_code']]
+        expected = {'city': city, 'state': state['state_name'], 'country': country['country_name']}
+        entry = {'city': city, 'state': state['state_name'], 'country': country['country_name']}
+        kind = rng.choices(KINDS, weights=weights)[0]
+        if kind == 'case':
+            entry = {field: f"  {value.upper() if rng.random() < 0.5 else value.lower()} " for field, value in entry.items()}
+        elif kind == 'code':
+            entry['country'] = iso3.get(country['iso_code'], country['iso_code'])
+            entry['state'] = admin_code.partition('.')[2]
+        elif kind == 'typo':
+            field = rng.choice(('city', 'state'))
+            entry[field] = _typo(entry[field], rng)
+        elif kind == 'anomalous':
+            entry['city'] = f"{rng.choice(('Nw', 'Qx', 'Zz'))}{rng.randrange(1000)}"
+            expected = {'city': entry['city'].title(), 'state': state['state_name'], 'country': country['country_name']}
+        entries.append({**entry, 'kind': kind, 'expected': expected})
+    return entries
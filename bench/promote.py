@@ -0,0 +1,280 @@
+# bench/promote.py
+#
+# Gate for the address_cleaner.py rewrites CeeyMore generates into
+# temp_updates/code_update.py. The candidate and the live module are each
+# loaded in a fresh, resource-limited subprocess and replayed against the
+# same regression corpus on the stubbed graph and LLM (see bench/run.py).
+# Promotion is refused if the candidate fails, is less accurate, or
+# regresses p95 latency or graph queries per request beyond the budget.
+#
+#   python -m bench.promote                                  # evaluate temp_updates/code_update.py
+#   python -m bench.promote path/to/candidate.py --corpus regression.jsonl -o report.json
+#   python -m bench.promote --apply                          # replace utils/address_cleaner.py if it passes
+#
+# Only the cleaner module is evaluated; kg_update.py writes to the graph and
+# is not run here.
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+try:
+    import resource
+except ImportError:  # not available on Windows; run without limits
+    resource = None
+
+from .run import STAGES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIVE_MODULE = os.path.join(ROOT, 'utils', 'address_cleaner.py')
+CANDIDATE_MODULE = os.path.join(ROOT, 'temp_updates', 'code_update.py')
+
+# Budgets: allowed fractional regression of p95 request latency and of graph
+# queries per request, and allowed absolute accuracy drop
+PROMOTE_MAX_P95_REGRESSION = float(os.getenv("JANITOR_PROMOTE_MAX_P95_REGRESSION", "0.10"))
+PROMOTE_MAX_QUERY_REGRESSION = float(os.getenv("JANITOR_PROMOTE_MAX_QUERY_REGRESSION", "0.0"))
+PROMOTE_MAX_ACCURACY_DROP = float(os.getenv("JANITOR_PROMOTE_MAX_ACCURACY_DROP", "0.0"))
+# Per-run limits for the subprocess
+PROMOTE_TIMEOUT = float(os.getenv("JANITOR_PROMOTE_TIMEOUT", "300"))
+PROMOTE_MEMORY_MB = int(os.getenv("JANITOR_PROMOTE_MEMORY_MB", "2048"))
+
+# Loads the module at argv[1] as utils.address_cleaner, then runs bench.run
+# with the remaining arguments. The environment is isolated first because
+# utils reads its configuration at import time.
+PROBE = """
+import sys, tempfile, importlib.util
+from bench.run import isolate_environment, main
+isolate_environment(tempfile.mkdtemp(prefix='janitor-promote-'))
+import utils
+spec = importlib.util.spec_from_file_location('utils.address_cleaner', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+sys.modules['utils.address_cleaner'] = module
+spec.loader.exec_module(module)
+utils.address_cleaner = module
+main(sys.argv[2:])
+"""
+
+
+def _sandbox_env():
+    """
+    The subprocess environment: no real credentials, and Neo4j and OpenAI
+    pointed at a closed local port, so a candidate that bypasses the stubs
+    fails instead of reaching a real service.
+    """
+    env = {name: value for name, value in os.environ.items()
+           if not name.startswith(('NEO4J_', 'OPENAI_', 'JANITOR_'))}
+    env.update({
+        'PYTHONPATH': ROOT,
+        'PYTHONDONTWRITEBYTECODE': '1',
+        'NEO4J_URI': 'bolt://127.0.0.1:9',
+        'NEO4J_USER': 'sandbox',
+        'NEO4J_PASSWORD': 'sandbox',
+        'OPENAI_API_KEY': 'sandbox',
+        'OPENAI_BASE_URL': 'http://127.0.0.1:9',
+        'JANITOR_EVENT_LOG': '',
+    })
+    return env
+
+
+def _limit_resources(timeout, memory_mb):
+    def limit():
+        if resource is None:
+            return
+        cpu = int(timeout) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+        if memory_mb:
+            memory = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    return limit if resource is not None else None
+
+
+def evaluate(module_path, bench_args, timeout=PROMOTE_TIMEOUT, memory_mb=PROMOTE_MEMORY_MB):
+    """
+    Replay the corpus through one cleaner module in a sandboxed subprocess.
+
+    Args:
+        module_path (str): The address_cleaner.py to load.
+        bench_args (list): bench.run arguments (corpus, mode, latencies).
+
+    Returns:
+        dict: bench.run's results, or {'error': ...} if the run failed or timed out.
+    """
+    workdir = tempfile.mkdtemp(prefix='janitor-promote-')
+    output = os.path.join(workdir, 'results.json')
+    try:
+        completed = subprocess.run(
+            [sys.executable, '-c', PROBE, os.path.abspath(module_path), *bench_args, '-o', output],
+            cwd=workdir, env=_sandbox_env(), capture_output=True, text=True, timeout=timeout,
+            preexec_fn=_limit_resources(timeout, memory_mb),
+        )
+        results = None
+        if completed.returncode == 0 and os.path.exists(output):
+            with open(output, 'r', encoding='utf-8') as f:
+                results = json.load(f)
+    except subprocess.TimeoutExpired:
+        return {'error': f"timed out after {timeout:.0f}s"}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if results is None:
+        lines = (completed.stderr or completed.stdout).strip().splitlines()
+        return {'error': f"exited with status {completed.returncode}", 'stderr': lines[-20:]}
+    return results
+
+
+def best_of(runs):
+    """
+    Merge repeated runs, keeping each stage's lowest p95, so scheduler noise
+    in one run doesn't decide the gate. Counts and accuracy come from the
+    first run; they don't vary between runs of the same corpus.
+    """
+    errors = [run for run in runs if 'error' in run]
+    if errors:
+        return errors[0]
+    merged = dict(runs[0])
+    merged['stages'] = {
+        stage: min((run['stages'][stage] for run in runs), key=lambda summary: summary['p95_ms'])
+        for stage in runs[0]['stages']
+    }
+    return merged
+
+
+def _delta(before, after):
+    return (after - before) / before if before else (1.0 if after else 0.0)
+
+
+def gate(live, candidate, max_p95_regression=PROMOTE_MAX_P95_REGRESSION,
+         max_query_regression=PROMOTE_MAX_QUERY_REGRESSION, max_accuracy_drop=PROMOTE_MAX_ACCURACY_DROP):
+    """
+    Compare a candidate's results against the live module's for one mode.
+
+    Returns:
+        list: Reasons to refuse promotion; empty if the candidate passes.
+    """
+    if 'error' in live:
+        return [f"the live module failed the benchmark ({live['error']}); fix that before comparing"]
+    if 'error' in candidate:
+        return [f"candidate {candidate['error']}"]
+
+    reasons = []
+    if live['accuracy'] is not None:
+        if candidate['accuracy'] is None or live['accuracy'] - candidate['accuracy'] > max_accuracy_drop:
+            reasons.append(f"accuracy {live['accuracy']} -> {candidate['accuracy']}")
+    p95 = _delta(live['stages']['total']['p95_ms'], candidate['stages']['total']['p95_ms'])
+    if p95 > max_p95_regression:
+        reasons.append(f"p95 latency {live['stages']['total']['p95_ms']:.3f}ms -> "
+                       f"{candidate['stages']['total']['p95_ms']:.3f}ms ({p95:+.1%})")
+    queries = _delta(live['graph_queries_per_request'], candidate['graph_queries_per_request'])
+    if queries > max_query_regression:
+        reasons.append(f"graph queries per request {live['graph_queries_per_request']} -> "
+                       f"{candidate['graph_queries_per_request']} ({queries:+.1%})")
+    # Escalations rather than LLM calls: background update generation makes the call count vary between runs
+    if candidate['anomalies'] > live['anomalies']:
+        reasons.append(f"escalations to CeeyMore {live['anomalies']} -> {candidate['anomalies']}")
+    return reasons
+
+
+def report(mode, live, candidate, reasons):
+    print(f"\n== {mode} ==")
+    if 'error' not in live and 'error' not in candidate:
+        print(f"{'stage':<10}{'live p95':>12}{'candidate p95':>16}{'delta':>10}")
+        for stage in STAGES:
+            before = live['stages'].get(stage, {}).get('p95_ms', 0.0)
+            after = candidate['stages'].get(stage, {}).get('p95_ms', 0.0)
+            print(f"{stage:<10}{before:>12.3f}{after:>16.3f}{_delta(before, after):>+10.1%}")
+        for name in ('accuracy', 'graph_queries_per_request', 'llm_calls', 'anomalies'):
+            print(f"{name:<27}{live[name]!s:>12}{candidate[name]!s:>12}")
+    for run, label in ((live, 'live'), (candidate, 'candidate')):
+        if 'error' in run:
+            print(f"{label}: {run['error']}")
+            for line in run.get('stderr', []):
+                print(f"  {line}")
+    print('PASS' if not reasons else 'REFUSED: ' + '; '.join(reasons))
+
+
+def promote(candidate_path, live_path=LIVE_MODULE):
+    """
+    Replace the live module with the candidate, keeping the old one in
+    temp_updates/ next to the candidate.
+
+    Returns:
+        str: Where the previous live module was saved.
+    """
+    backup = os.path.join(os.path.dirname(os.path.abspath(candidate_path)),
+                          f"address_cleaner.{time.strftime('%Y%m%d-%H%M%S')}.py")
+    shutil.copy2(live_path, backup)
+    # Copy next to the live module and rename over it, so importers never see a partial file
+    temp_path = f"{live_path}.{os.getpid()}.tmp"
+    shutil.copyfile(candidate_path, temp_path)
+    os.replace(temp_path, live_path)
+    return backup
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a generated address_cleaner.py against the live one and gate its promotion.")
+    parser.add_argument('candidate', nargs='?', default=CANDIDATE_MODULE, help=f"Candidate module (default: {CANDIDATE_MODULE}).")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--corpus', help="Regression corpus (JSONL, globs and .gz accepted; see bench/corpus.py).")
+    source.add_argument('--generate', type=int, default=500, metavar='N', help="Generate an N-request corpus (default: 500).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modes', default='single,batch', help="Comma-separated bench.run modes to gate on.")
+    parser.add_argument('--graph-latency', type=float, default=1.0, help="Injected latency per graph query, in ms.")
+    parser.add_argument('--llm-latency', type=float, default=50.0, help="Injected latency per LLM call, in ms.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per module and mode; the best p95 of each is compared.")
+    parser.add_argument('--timeout', type=float, default=PROMOTE_TIMEOUT, help="Seconds allowed per run.")
+    parser.add_argument('--max-p95-regression', type=float, default=PROMOTE_MAX_P95_REGRESSION)
+    parser.add_argument('--max-query-regression', type=float, default=PROMOTE_MAX_QUERY_REGRESSION)
+    parser.add_argument('--max-accuracy-drop', type=float, default=PROMOTE_MAX_ACCURACY_DROP)
+    parser.add_argument('-o', '--output', help="Write the full report JSON to this path.")
+    parser.add_argument('--apply', action='store_true', help="Replace utils/address_cleaner.py if the candidate passes.")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.candidate):
+        parser.error(f"No candidate module at {args.candidate}.")
+    try:
+        with open(args.candidate, 'r', encoding='utf-8') as f:
+            compile(f.read(), args.candidate, 'exec')
+    except SyntaxError as e:
+        print(f"REFUSED: candidate does not compile: {e}")
+        sys.exit(1)
+
+    source = ['--corpus', os.path.abspath(args.corpus)] if args.corpus else ['--generate', str(args.generate), '--seed', str(args.seed)]
+    common = [*source, '--graph', 'stub', '--graph-latency', str(args.graph_latency), '--llm-latency', str(args.llm_latency)]
+
+    results = {'candidate': os.path.abspath(args.candidate), 'modes': {}}
+    refused = False
+    for mode in args.modes.split(','):
+        bench_args = [*common, '--mode', mode]
+        # Alternate the two modules so drift in machine load hits both alike
+        live_runs, candidate_runs = [], []
+        for _ in range(args.repeat):
+            live_runs.append(evaluate(LIVE_MODULE, bench_args, args.timeout))
+            candidate_runs.append(evaluate(args.candidate, bench_args, args.timeout))
+            if 'error' in candidate_runs[-1] or 'error' in live_runs[-1]:
+                break
+        live, candidate = best_of(live_runs), best_of(candidate_runs)
+        reasons = gate(live, candidate, args.max_p95_regression, args.max_query_regression, args.max_accuracy_drop)
+        report(mode, live, candidate, reasons)
+        results['modes'][mode] = {'live': live, 'candidate': candidate, 'reasons': reasons}
+        refused = refused or bool(reasons)
+
+    results['promoted'] = False
+    if not refused and args.apply:
+        results['backup'] = promote(args.candidate)
+        results['promoted'] = True
+        print(f"\nPromoted {args.candidate} to {LIVE_MODULE} (previous version saved as {results['backup']}).")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if refused:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
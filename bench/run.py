@@ -0,0 +1,322 @@
+# bench/run.py
+#
+# Replays a corpus through clean_address_fields (or clean_address_batch)
+# against local graph and LLM stand-ins and reports per-stage latency.
+# --graph stub replays the Neo4j backend's Cypher against a stub driver;
+# --graph memory uses the embedded in-memory backend instead. --mode async
+# replays through the async request path with --concurrency requests in flight.
+#
+#   python -m bench.run --generate 2000 --graph-latency 2 --llm-latency 800 -o bench/results/baseline.json
+#   python -m bench.run --generate 2000 --graph-latency 2 --llm-latency 800 --baseline bench/results/baseline.json
+#   python -m bench.run --corpus 'temp_updates/events.jsonl*'    # replay production traffic
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import platform
+import threading
+from functools import wraps
+from collections import defaultdict
+
+STAGES = ('joint', 'country', 'state', 'city', 'anomaly', 'total')
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class StageTimer:
+    """
+    Collects wall-clock durations (seconds) per stage.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    def wrap(self, stage, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_async(self, stage, func):
+        @wraps(func)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self):
+        summary = {}
+        for stage in STAGES:
+            values = sorted(self.samples.get(stage, []))
+            summary[stage] = {
+                'count': len(values),
+                'mean_ms': round(1000 * sum(values) / len(values), 3) if values else 0.0,
+                'p50_ms': round(1000 * percentile(values, 0.50), 3),
+                'p95_ms': round(1000 * percentile(values, 0.95), 3),
+                'p99_ms': round(1000 * percentile(values, 0.99), 3),
+            }
+        return summary
+
+
+def isolate_environment(workdir):
+    """
+    Point every on-disk store at a scratch directory and disable the result
+    cache, so each run measures the cleaner itself. Must run before utils is
+    imported, since its modules read configuration at import time.
+    """
+    defaults = {
+        'NEO4J_URI': 'bolt://localhost:7687',
+        'NEO4J_USER': 'bench',
+        'NEO4J_PASSWORD': 'bench',
+        'OPENAI_API_KEY': 'bench',
+        'JANITOR_CACHE_BACKEND': 'none',
+        'JANITOR_TEMP_UPDATES_DIR': workdir,
+        'JANITOR_ANOMALY_STORE_PATH': os.path.join(workdir, 'anomaly_store.sqlite3'),
+        'JANITOR_LOCK_DIR': os.path.join(workdir, 'locks'),
+        'JANITOR_GRAPH_VERSION_FILE': os.path.join(workdir, 'graph_version'),
+        'JANITOR_EVENT_LOG': os.path.join(workdir, 'events.jsonl'),
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+
+def install_stubs(timer, mode, graph_latency, llm_latency, answers, llm_error_rate=0.0, graph_backend='stub'):
+    """
+    Swap the graph backend (or the shared Neo4j driver behind it) and the
+    OpenAI client for local stand-ins and wrap each cleaning stage with a timer.
+
+    Returns:
+        tuple: (StubGraphDriver or None, StubOpenAI)
+    """
+    from utils import graph_driver, address_cleaner, ceeymore
+    from utils.graph_backend import set_graph_backend, MemoryBackend, Neo4jBackend
+    from .stubs import StubGraphDriver, StubAsyncGraphDriver, StubOpenAI, StubAsyncOpenAI
+
+    if graph_backend == 'memory':
+        graph = None
+        set_graph_backend(MemoryBackend())
+    else:
+        graph = StubGraphDriver(latency=graph_latency)
+        graph_driver._driver = graph
+        graph_driver._driver_pid = os.getpid()
+        graph_driver._async_driver = StubAsyncGraphDriver(graph)
+        graph_driver._async_driver_pid = os.getpid()
+        set_graph_backend(Neo4jBackend())
+    llm = StubOpenAI(latency=llm_latency, answers=answers, error_rate=llm_error_rate)
+    ceeymore.client = llm
+    ceeymore.async_client = StubAsyncOpenAI(llm)
+
+    for stage, name in (('joint', 'resolve_address'), ('country', 'get_country_code'), ('state', 'validate_state'),
+                        ('city', 'validate_city'), ('joint', 'resolve_addresses'), ('country', 'get_country_codes'),
+                        ('state', 'validate_states'), ('city', 'validate_cities')):
+        # A generated module under evaluation (see bench/promote.py) may not have every stage
+        if hasattr(address_cleaner, name):
+            setattr(address_cleaner, name, timer.wrap(stage, getattr(address_cleaner, name)))
+    # handle_anomalies calls handle_anomaly, so only time the entry point for this mode
+    if mode == 'batch':
+        ceeymore.CeeyMore.handle_anomalies = timer.wrap('anomaly', ceeymore.CeeyMore.handle_anomalies)
+    elif mode == 'async':
+        ceeymore.CeeyMore.handle_anomaly_async = timer.wrap_async('anomaly', ceeymore.CeeyMore.handle_anomaly_async)
+    else:
+        ceeymore.CeeyMore.handle_anomaly = timer.wrap('anomaly', ceeymore.CeeyMore.handle_anomaly)
+    return graph, llm
+
+
+async def replay_async(corpus, timer, concurrency):
+    """
+    Clean every entry through clean_address_fields_async, at most
+    `concurrency` at a time.
+    """
+    from utils import address_cleaner
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def clean(entry):
+        async with semaphore:
+            start = time.perf_counter()
+            output = await address_cleaner.clean_address_fields_async(entry['city'], entry['state'], entry['country'])
+            timer.record('total', time.perf_counter() - start)
+            return output
+
+    return await asyncio.gather(*(clean(entry) for entry in corpus))
+
+
+def run(corpus, mode='single', batch_size=100, graph_latency=0.0, llm_latency=0.0, llm_error_rate=0.0, graph_backend='stub',
+        concurrency=100):
+    """
+    Replay a corpus and return the results dict written by --output.
+    """
+    from .stubs import StubOpenAI
+
+    answers = {
+        StubOpenAI.key(entry['city'], entry['state'], entry['country']): entry['expected']
+        for entry in corpus if entry.get('expected')
+    }
+    timer = StageTimer()
+    graph, llm = install_stubs(timer, mode, graph_latency, llm_latency, answers, llm_error_rate, graph_backend)
+
+    from utils import address_cleaner
+    from utils.update_worker import get_update_worker
+
+    outputs = []
+    start = time.perf_counter()
+    if mode == 'batch':
+        for offset in range(0, len(corpus), batch_size):
+            chunk = corpus[offset:offset + batch_size]
+            batch_start = time.perf_counter()
+            outputs.extend(address_cleaner.clean_address_batch(chunk))
+            timer.record('total', time.perf_counter() - batch_start)
+    elif mode == 'async':
+        outputs = asyncio.run(replay_async(corpus, timer, concurrency))
+    else:
+        for entry in corpus:
+            request_start = time.perf_counter()
+            outputs.append(address_cleaner.clean_address_fields(entry['city'], entry['state'], entry['country']))
+            timer.record('total', time.perf_counter() - request_start)
+    elapsed = time.perf_counter() - start
+    request_llm_calls = llm.calls
+    graph_queries = graph.queries if graph else 0
+
+    # Let background update generation finish so it doesn't leak into the next run
+    get_update_worker().shutdown(timeout=60)
+
+    correct = 0
+    scored = 0
+    for entry, output in zip(corpus, outputs):
+        expected = entry.get('expected')
+        if not expected:
+            continue
+        scored += 1
+        correct += (output['corrected_city'], output['corrected_state'], output['corrected_country']) == \
+            (expected['city'], expected['state'], expected['country'])
+
+    return {
+        'config': {
+            'mode': mode,
+            'batch_size': batch_size if mode == 'batch' else None,
+            'concurrency': concurrency if mode == 'async' else None,
+            'graph': graph_backend,
+            'requests': len(corpus),
+            'graph_latency_ms': graph_latency * 1000,
+            'llm_latency_ms': llm_latency * 1000,
+            'llm_error_rate': llm_error_rate,
+            'python': platform.python_version(),
+        },
+        'elapsed_s': round(elapsed, 4),
+        'throughput_rps': round(len(corpus) / elapsed, 2) if elapsed else 0.0,
+        'graph_queries': graph_queries,
+        'graph_queries_per_request': round(graph_queries / len(corpus), 3) if corpus else 0.0,
+        'llm_calls': request_llm_calls,
+        'anomalies': sum(1 for output in outputs if output.get('anomaly')),
+        'accuracy': round(correct / scored, 4) if scored else None,
+        'stages': timer.summary(),
+    }
+
+
+def compare(results, baseline, max_regression):
+    """
+    Print stage-by-stage deltas against a baseline.
+
+    Returns:
+        bool: True if no p95 latency or throughput regressed by more than max_regression.
+    """
+    ok = True
+    for name, value in results['config'].items():
+        if name != 'python' and baseline['config'].get(name) != value:
+            print(f"Warning: baseline was run with {name}={baseline['config'].get(name)!r}, this run uses {value!r}.")
+    print(f"{'stage':<10}{'baseline p95':>14}{'current p95':>14}{'delta':>10}")
+    for stage in STAGES:
+        before = baseline['stages'].get(stage, {}).get('p95_ms', 0.0)
+        after = results['stages'].get(stage, {}).get('p95_ms', 0.0)
+        delta = (after - before) / before if before else 0.0
+        flag = ''
+        if before and delta > max_regression:
+            flag = '  REGRESSION'
+            ok = False
+        print(f"{stage:<10}{before:>14.3f}{after:>14.3f}{delta:>+10.1%}{flag}")
+
+    before, after = baseline['throughput_rps'], results['throughput_rps']
+    delta = (after - before) / before if before else 0.0
+    flag = ''
+    if before and -delta > max_regression:
+        flag = '  REGRESSION'
+        ok = False
+    print(f"{'rps':<10}{before:>14.2f}{after:>14.2f}{delta:>+10.1%}{flag}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the address cleaner against stubbed Neo4j and OpenAI backends.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--corpus', help="JSONL corpus of {city, state, country[, expected]} requests.")
+    source.add_argument('--generate', type=int, metavar='N', help="Generate an N-request corpus from import/cities.csv.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for --generate.")
+    parser.add_argument('--save-corpus', help="Write the generated corpus to this path.")
+    parser.add_argument('--mode', choices=('single', 'batch', 'async'), default='single')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=100, help="Requests in flight with --mode async.")
+    parser.add_argument('--graph', choices=('stub', 'memory'), default='stub',
+                        help="Stub Neo4j driver with injected latency, or the embedded in-memory backend.")
+    parser.add_argument('--graph-latency', type=float, default=1.0, help="Injected latency per graph query, in ms.")
+    parser.add_argument('--llm-latency', type=float, default=500.0, help="Injected latency per LLM call, in ms.")
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help="Fraction of LLM calls that raise.")
+    parser.add_argument('-o', '--output', help="Write results JSON to this path.")
+    parser.add_argument('--baseline', help="Compare against a previous results JSON.")
+    parser.add_argument('--max-regression', type=float, default=0.10, help="Allowed p95/throughput regression (fraction).")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='janitor-bench-')
+    isolate_environment(workdir)
+    from .corpus import read_corpus, write_corpus, generate_corpus
+
+    if args.corpus:
+        corpus = read_corpus(args.corpus)
+    else:
+        corpus = generate_corpus(args.generate, seed=args.seed)
+        if args.save_corpus:
+            write_corpus(corpus, args.save_corpus)
+
+    # Generated updates go to JANITOR_TEMP_UPDATES_DIR, the scratch directory
+    results = run(corpus, mode=args.mode, batch_size=args.batch_size,
+                  graph_latency=args.graph_latency / 1000, llm_latency=args.llm_latency / 1000,
+                  llm_error_rate=args.llm_error_rate, graph_backend=args.graph, concurrency=args.concurrency)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# bench/startup.py
+#
+# Measures what a fresh worker pays before it can serve: the time to import
+# the app (or any module) in a new interpreter, which heavy dependencies that
+# import pulls in, and optionally how long utils.warmup takes afterwards.
+#
+#   python -m bench.startup
+#   python -m bench.startup --module utils.address_cleaner --repeat 10 --warmup
+#   python -m bench.startup -o bench/results/startup.json --baseline bench/results/startup_baseline.json
+
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from .run import isolate_environment, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies that should only be imported once something needs them
+HEAVY_MODULES = ('openai', 'neo4j', 'requests', 'pycountry')
+
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+result = {'import_s': time.perf_counter() - start}
+result['heavy_modules'] = [name for name in sys.argv[3].split(',') if name in sys.modules]
+if sys.argv[2] == '1':
+    from utils.warmup import warm_up
+    start = time.perf_counter()
+    result['warmup_steps'] = warm_up()
+    result['warmup_s'] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+
+def measure(module='app', repeat=5, warmup=False):
+    """
+    Import `module` in `repeat` fresh interpreters and return the results dict
+    written by --output.
+    """
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE, module, '1' if warmup else '0', ','.join(HEAVY_MODULES)],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    imports = sorted(sample['import_s'] for sample in samples)
+    results = {
+        'config': {
+            'module': module,
+            'repeat': repeat,
+            'graph': os.environ.get('JANITOR_GRAPH_BACKEND', 'neo4j'),
+            'python': platform.python_version(),
+        },
+        'import_ms': {
+            'min': round(1000 * imports[0], 3),
+            'p50': round(1000 * percentile(imports, 0.50), 3),
+            'max': round(1000 * imports[-1], 3),
+        },
+        'heavy_modules': samples[-1]['heavy_modules'],
+    }
+    if warmup:
+        warmups = sorted(sample['warmup_s'] for sample in samples)
+        results['warmup_ms'] = {
+            'p50': round(1000 * percentile(warmups, 0.50), 3),
+            'steps': {
+                name: round(1000 * seconds, 3) if seconds is not None else None
+                for name, seconds in samples[-1]['warmup_steps'].items()
+            },
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark worker import time in fresh interpreters.")
+    parser.add_argument('--module', default='app', help="Module to import (default: app).")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--graph', choices=('neo4j', 'memory'), default='memory',
+                        help="Graph backend selected during the run (warm-up opens a connection with neo4j).")
+    parser.add_argument('--warmup', action='store_true', help="Also time utils.warmup.warm_up() after the import.")
+    parser.add_argument('-o', '--output', help="Write results JSON to this path.")
+    parser.add_argument('--baseline', help="Compare p50 import time against a previous results JSON.")
+    parser.add_argument('--max-regression', type=float, default=0.10, help="Allowed p50 import time regression (fraction).")
+    args = parser.parse_args(argv)
+
+    os.environ['JANITOR_GRAPH_BACKEND'] = args.graph
+    isolate_environment(tempfile.mkdtemp(prefix='janitor-startup-'))
+    results = measure(args.module, args.repeat, args.warmup)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        before, after = baseline['import_ms']['p50'], results['import_ms']['p50']
+        delta = (after - before) / before if before else 0.0
+        print(f"import p50: {before:.1f}ms -> {after:.1f}ms ({delta:+.1%})")
+        if before and delta > args.max_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+# bench/stubs.py
+#
+# Local stand-ins for the Neo4j driver and the OpenAI client, so the cleaner
+# can be replayed without network access and with controlled latency.
+
+import json
+import time
+import random
+import asyncio
+import difflib
+import threading
+from utils.gazetteer import get_gazetteer
+from utils.graph_backend import load_cities
+from utils.fuzzy import normalize
+
+###########################################################################################################################
+
+class StubResult(list):
+    def single(self):
+        return self[0] if self else None
+
+    def consume(self):
+        pass
+
+
+class StubSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def run(self, query, parameters=None, **kwargs):
+        return self.driver.run(query, {**(parameters or {}), **kwargs})
+
+    def execute_write(self, func, *args, **kwargs):
+        return func(self, *args, **kwargs)
+
+
+class StubGraphDriver:
+    """
+    Answers the Cypher queries issued by utils/graph_backend.Neo4jBackend from the
+    reference CSVs, sleeping `latency` seconds per query to mimic a round trip.
+
+    Queries are recognised by the index, property and clause names they use,
+    so new query shapes need a matching handler here.
+    """
+
+    def __init__(self, latency=0.0, cities=None):
+        self.latency = latency
+        self.gazetteer = get_gazetteer()
+        self.cities = cities if cities is not None else load_cities()
+        self.queries = 0
+        self.lock = threading.Lock()
+
+    def session(self, **kwargs):
+        return StubSession(self)
+
+    def close(self):
+        pass
+
+    def verify_connectivity(self):
+        pass
+
+    # -- data access -------------------------------------------------------
+
+    def _country(self, iso_code):
+        country = self.gazetteer.countries.get(iso_code)
+        return {'country_name': country['country_name'], 'iso_code': iso_code} if country else None
+
+    def _states(self, country_code):
+        return [state for state in self.gazetteer.states.values() if state['iso_code'] == country_code]
+
+    def _cities(self, admin_code=None, country_code=None):
+        if admin_code:
+            return [name for name, code in self.cities if code == admin_code]
+        return [name for name, code in self.cities if code.partition('.')[0] == country_code]
+
+    @staticmethod
+    def _closest(name, candidates):
+        matches = difflib.get_close_matches((name or '').lower(), [c.lower() for c in candidates], n=1, cutoff=0.6)
+        if not matches:
+            return None
+        return next(c for c in candidates if c.lower() == matches[0])
+
+    # -- per-row handlers, keyed on what each query looks up ---------------
+
+    def _country_exact(self, row):
+        for iso_code, country in self.gazetteer.countries.items():
+            if normalize(country['country_name']) == row.get('name_key'):
+                return self._country(iso_code)
+        return None
+
+    def _country_fuzzy(self, row):
+        names = {c['country_name']: iso for iso, c in self.gazetteer.countries.items()}
+        match = self._closest(row.get('country_name'), list(names))
+        return self._country(names[match]) if match else None
+
+    def _state_exact(self, row):
+        for state in self._states(row.get('country_code')):
+            if normalize(state['state_name']) == row.get('name_key'):
+                return {'state_name': state['state_name'], 'admin_code': state['admin_code']}
+        return None
+
+    def _state_fuzzy(self, row):
+        states = {s['state_name']: s['admin_code'] for s in self._states(row.get('country_code'))}
+        match = self._closest(row.get('state_name'), list(states))
+        return {'state_name': match, 'admin_code': states[match]} if match else None
+
+    def _city_exact(self, row):
+        for city in self._cities(row.get('admin_code'), row.get('country_code')):
+            if normalize(city) == row.get('name_key'):
+                return {'city_name': city}
+        return None
+
+    def _city_fuzzy(self, row):
+        match = self._closest(row.get('city_name'), self._cities(row.get('admin_code'), row.get('country_code')))
+        return {'city_name': match} if match else None
+
+    def _address_paths(self, row):
+        names = sorted({name for name, _ in self.cities})
+        matches = {name for name in names if normalize(name) == row['city_key']}
+        query = row['city_query'].replace('~', '').replace('\\', '')
+        matches.update(difflib.get_close_matches(query, names, n=10, cutoff=0.6))
+        paths = []
+        for name, admin_code in self.cities:
+            state = self.gazetteer.states.get(admin_code)
+            if name in matches and state:
+                paths.append({
+                    'city_name': name, 'admin_code': admin_code, 'state_name': state['state_name'],
+                    'iso_code': state['iso_code'], 'country_name': self.gazetteer.countries[state['iso_code']]['country_name'],
+                })
+        return {'paths': paths}
+
+    def _handler(self, query):
+        if 'AS paths' in query:
+            return self._address_paths
+        if 'countryNameIndex' in query:
+            return self._country_fuzzy
+        if 'stateNameIndex' in query:
+            return self._state_fuzzy
+        if 'cityNameIndex' in query:
+            return self._city_fuzzy
+        if '(c:Country { name_key' in query:
+            return self._country_exact
+        if '(s:State { name_key' in query:
+            return self._state_exact
+        if '(city:City { name_key' in query:
+            return self._city_exact
+        raise NotImplementedError(f"StubGraphDriver can't answer query:\n{query}")
+
+    def run(self, query, params):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.answer(query, params)
+
+    def answer(self, query, params):
+        with self.lock:
+            self.queries += 1
+
+        # The alias index loads and writes Alias nodes; the stub graph keeps none
+        if 'MATCH (a:Alias)' in query or 'MERGE (a:Alias' in query:
+            return StubResult()
+
+        # Scope name loads used by the local fuzzy engine
+        if 'collect(DISTINCT city.city_name)' in query:
+            return StubResult({
+                'idx': row['idx'],
+                'city_names': self._cities(row['code'] if row['kind'] == 'admin' else None, row['code'])
+            } for row in params['rows'])
+        if 'RETURN DISTINCT city.city_name' in query:
+            if 'admin1_code: $code' in query:
+                names = self._cities(admin_code=params['code'])
+            else:
+                names = self._cities(country_code=params['code'])
+            return StubResult({'city_name': name} for name in names)
+
+        handler = self._handler(query)
+        # City queries are scoped by state only when they match on the admin1 code
+        scoped_by_state = 'admin1_code: $admin_code' in query or 'admin1_code: row.admin_code' in query
+        rows = params['rows'] if 'UNWIND $rows' in query else [params]
+        records = StubResult()
+        for row in rows:
+            record = handler(row if scoped_by_state else dict(row, admin_code=None))
+            if record:
+                records.append({'idx': row['idx'], **record} if 'idx' in row else record)
+        return records
+
+
+class StubAsyncResult:
+    def __init__(self, records):
+        self.records = records
+
+    async def single(self):
+        return self.records.single()
+
+
+class StubAsyncSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def run(self, query, parameters=None, **kwargs):
+        if self.driver.latency:
+            await asyncio.sleep(self.driver.latency)
+        return StubAsyncResult(self.driver.answer(query, {**(parameters or {}), **kwargs}))
+
+
+class StubAsyncGraphDriver:
+    """
+    neo4j.AsyncDriver counterpart of a StubGraphDriver, sharing its data,
+    latency and query count.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def session(self, **kwargs):
+        return StubAsyncSession(self.driver)
+
+    async def close(self):
+        pass
+
+###########################################################################################################################
+
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+class _Choice:
+    def __init__(self, content):
+        self.message = _Message(content)
+
+
+class _Usage:
+    def __init__(self, prompt_tokens, completion_tokens):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.total_tokens = prompt_tokens + completion_tokens
+
+
+class _Response:
+    def __init__(self, content, prompt):
+        self.choices = [_Choice(content)]
+        # Roughly four characters per token
+        self.usage = _Usage(len(prompt) // 4, len(content) // 4)
+
+
+class StubOpenAI:
+    """
+    Stand-in for openai.OpenAI with the chat.completions.create interface.
+
+    Anomaly prompts are answered from `answers` (normalized input triple ->
+    cleaned dict) or by title-casing the inputs; update-generation prompts get
+    a short placeholder script. `latency` seconds are slept per call (or the
+    call times out, if that is beyond its `timeout`) and `error_rate` of calls
+    raise, to exercise utils/llm_client.py's deadlines, retries and circuit
+    breaker. Both can be changed between calls.
+    """
+
+    def __init__(self, latency=0.0, answers=None, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.answers = answers or {}
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.chat = self
+        self.completions = self
+
+    @staticmethod
+    def key(city, state, country):
+        return tuple(' '.join((value or '').split()).casefold() for value in (city, state, country))
+
+    def _answer(self, city, state, country):
+        answer = self.answers.get(self.key(city, state, country))
+        return answer or {'city': city.title(), 'state': state.title(), 'country': country.title()}
+
+    def _start_call(self):
+        """
+        Count a call and decide whether it fails.
+        """
+        with self.lock:
+            self.calls += 1
+            return self.error_rate and self.random.random() < self.error_rate
+
+    def create(self, model=None, messages=None, timeout=None, **kwargs):
+        fail = self._start_call()
+        if self.latency:
+            # Honour the per-request timeout like the OpenAI client does
+            if timeout is not None and self.latency > timeout:
+                time.sleep(timeout)
+                raise TimeoutError("StubOpenAI request timed out")
+            time.sleep(self.latency)
+        if fail:
+            raise RuntimeError("StubOpenAI injected error")
+        return self.respond(messages)
+
+    def respond(self, messages):
+        prompt = messages[-1]['content']
+        if 'Records:' in prompt:
+            # Batched anomaly prompt from utils/llm_batcher.py
+            start = prompt.index('[', prompt.index('Records:'))
+            records, _ = json.JSONDecoder().raw_decode(prompt[start:])
+            content = json.dumps([
+                {'id': record['id'], **self._answer(record['city'], record['state'], record['country'])}
+                for record in records
+            ])
+        elif messages[0]['role'] == 'system' and '"functions"' in messages[0]['content']:
+            # Code update generation in patch mode: no changes
+            content = json.dumps({'imports': [], 'functions': []})
+        elif messages[0]['role'] == 'system':
+            # Knowledge graph / full-file code update generation
+            content = "```python\n# Generated by StubOpenAI\n```"
+        else:
+            fields = {}
+            for line in prompt.splitlines():
+                line = line.strip()
+                for label in ('City', 'State', 'Country'):
+                    prefix = f"- {label}: '"
+                    if line.startswith(prefix) and label not in fields:
+                        fields[label] = line[len(prefix):-1]
+            content = json.dumps(self._answer(fields.get('City', ''), fields.get('State', ''), fields.get('Country', '')))
+        return _Response(content, prompt)
+
+
+class StubAsyncOpenAI:
+    """
+    openai.AsyncOpenAI counterpart of a StubOpenAI, sharing its answers,
+    latency, error rate and call count.
+    """
+
+    def __init__(self, stub):
+        self.stub = stub
+        self.chat = self
+        self.completions = self
+
+    async def create(self, model=None, messages=None, timeout=None, **kwargs):
+        fail = self.stub._start_call()
+        if self.stub.latency:
+            await asyncio.sleep(self.stub.latency)
+        if fail:
+            raise RuntimeError("StubOpenAI injected error")
+        return self.stub.respond(messages)
@@ -0,0 +1,27 @@
+# gunicorn.conf.py
+#
+# Picked up automatically by `gunicorn app:app` (see Procfile), and by
+# `gunicorn asgi:app -k uvicorn.workers.UvicornWorker` in the async serving mode.
+
+from utils import graph_driver
+from utils import update_worker
+from utils import warmup
+
+
+def post_fork(server, worker):
+    # Never inherit a driver (and its sockets) from the master process
+    graph_driver.close_driver()
+
+
+def post_worker_init(worker):
+    # Clients and indexes are otherwise built on first use; with JANITOR_WARMUP
+    # set, build them (and open the worker's pool) before it accepts traffic
+    if warmup.WARMUP:
+        warmup.warm_up()
+
+
+def worker_exit(server, worker):
+    # Let queued CeeyMore update jobs finish before the pool goes away
+    if update_worker._update_worker is not None:
+        update_worker._update_worker.shutdown(timeout=worker.cfg.graceful_timeout)
+    graph_driver.close_driver()
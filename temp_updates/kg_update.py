@@ -1,25 +1,27 @@
+# Generated knowledge graph update. It imports from utils, so run it from the
+# repository root as a module (or with the repository root on PYTHONPATH):
+#
+#   python -m temp_updates.kg_update
+
 import os
 import requests
-from neo4j import GraphDatabase
-
-# Neo4j connection details
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USER = os.getenv("NEO4J_USER")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+from utils.fuzzy import normalize
+from utils.result_cache import bump_graph_version
+from utils.kg_loader import BatchWriter
+from utils.graph_driver import close_driver
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+GEONAMES_USERNAME = os.getenv("GEONAMES_USERNAME", "your_geonames_username")  # Replace with your GeoNames username
 
-# Function to fetch city coordinates from GeoNames API
+# Function to fetch populated places, with their first-level admin codes, from the GeoNames API
 def fetch_city_coordinates():
     # GeoNames API endpoint
-    url = "http://api.geonames.org/citiesJSON"
+    url = "http://api.geonames.org/searchJSON"
     params = {
-        'north': 90,
-        'south': -90,
-        'east': 180,
-        'west': -180,
+        'featureClass': 'P',
+        'orderby': 'population',
+        'style': 'MEDIUM',
         'lang': 'en',
-        'username': 'your_geonames_username',  # Replace with your GeoNames username
+        'username': GEONAMES_USERNAME,
         'maxRows': 1000
     }
     response = requests.get(url, params=params)
@@ -27,26 +29,36 @@ def fetch_city_coordinates():
 
 # Function to update the Neo4j knowledge graph
 def update_knowledge_graph(cities):
-    with driver.session() as session:
-        for city in cities:
-            city_name = city.get('name')
-            latitude = city.get('lat')
-            longitude = city.get('lng')
-            country_name = city.get('countryName')
+    # Cities are keyed like utils.kg_loader.MERGE_CITIES: city_id is admin1_code + '|' + city_name,
+    # with admin1_code as in import/states.csv ('US.TX')
+    rows = [{
+        'admin1_code': f"{city['countryCode']}.{city['adminCode1']}",
+        'city_name': city['name'],
+        'name_key': normalize(city['name']),
+        'latitude': float(city['lat']),
+        'longitude': float(city['lng']),
+    } for city in cities if city.get('name') and city.get('countryCode') and city.get('adminCode1')]
 
-            # Create or update city and coordinate nodes and relationships
-            session.run("""
-                MERGE (c:City {name: $city_name})
-                MERGE (co:Coordinates {latitude: $latitude, longitude: $longitude})
-                MERGE (c)-[:HAS_COORDINATES]->(co)
-                MERGE (country:Country {name: $country_name})
-                MERGE (c)-[:IN_COUNTRY]->(country)
-            """, city_name=city_name, latitude=latitude, longitude=longitude, country_name=country_name)
+    # Create or update city and coordinate nodes and relationships, one transaction per chunk;
+    # cities in a state the graph doesn't have are skipped
+    BatchWriter().write("""
+        MATCH (s:State { admin1_code: row.admin1_code })
+        MERGE (c:City { city_id: row.admin1_code + '|' + row.city_name })
+        ON CREATE SET c.city_name = row.city_name, c.name_key = row.name_key
+        MERGE (c)-[:IN_STATE]->(s)
+        MERGE (co:Coordinates { latitude: row.latitude, longitude: row.longitude })
+        MERGE (c)-[:HAS_COORDINATES]->(co)
+    """, rows)
 
 # Main function to execute the process
 def main():
     cities = fetch_city_coordinates()
-    update_knowledge_graph(cities)
+    try:
+        update_knowledge_graph(cities)
+    finally:
+        close_driver()
+    # Invalidate the Janitor's cached results now that the graph has changed
+    bump_graph_version()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,13 @@
+# tests/conftest.py
+#
+# utils reads its configuration at import time, so point every on-disk store
+# at a scratch directory and use the in-memory graph backend before any test
+# module imports it.
+
+import os
+import tempfile
+
+from bench.run import isolate_environment
+
+isolate_environment(tempfile.mkdtemp(prefix='janitor-tests-'))
+os.environ.setdefault('JANITOR_GRAPH_BACKEND', 'memory')
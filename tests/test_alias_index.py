@@ -0,0 +1,78 @@
+# tests/test_alias_index.py
+
+import pytest
+
+from utils import alias_index
+from utils.address_cleaner import validate_city
+from utils.alias_index import AliasIndex, reference_aliases
+from utils.anomaly_store import AnomalyStore
+
+
+class CountingGraph:
+    def __init__(self, graph):
+        self.graph = graph
+        self.queries = 0
+
+    def find_city(self, *args, **kwargs):
+        self.queries += 1
+        return self.graph.find_city(*args, **kwargs)
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    counting = CountingGraph(alias_index.get_graph_backend())
+    monkeypatch.setattr(alias_index, 'get_graph_backend', lambda: counting)
+    return counting
+
+
+LA = ({'city_input': 'LA', 'state_input': 'Calif', 'country_input': 'USA'},
+      {'city': 'Los Angeles', 'state': 'California', 'country': 'United States'})
+
+
+@pytest.fixture
+def index():
+    return AliasIndex()
+
+
+def test_reference_aliases_have_no_cities():
+    assert not [row for row in reference_aliases() if row['kind'] == 'city']
+
+
+@pytest.mark.parametrize('city, country, admin_code', [
+    ('Canberra', 'AU', 'AU.04'),       # Queensland
+    ('Washington', 'US', 'US.TX'),
+])
+def test_capital_is_not_valid_in_another_state(city, country, admin_code):
+    _, is_valid, _ = validate_city(city, country, admin_code)
+    assert not is_valid
+
+
+def test_learned_city_alias_is_scoped_to_its_state(index):
+    index.learn(*LA)
+    assert index.find_city('LA', 'US', 'US.CA') == 'Los Angeles'
+    assert index.find_city('LA', 'US') == 'Los Angeles'
+    assert index.find_city('LA', 'US', 'US.TX') is None
+
+
+def test_canonicalize_uses_aliases_from_anywhere_in_the_country(index):
+    index.learn(*LA)
+    assert index.canonicalize('LA', 'Texas', 'USA') == ('Los Angeles', 'Texas', 'United States')
+
+
+def test_replay_uses_the_stored_aliases(tmp_path, graph):
+    store = AnomalyStore(str(tmp_path / 'store.sqlite3'))
+    store.put(*LA, aliases=AliasIndex().alias_rows(*LA))
+    graph.queries = 0
+    index = AliasIndex(anomaly_store=store)
+    assert graph.queries == 0
+    assert index.find_city('LA', 'US', 'US.CA') == 'Los Angeles'
+
+
+def test_replay_saves_the_aliases_of_older_resolutions(tmp_path, graph):
+    store = AnomalyStore(str(tmp_path / 'store.sqlite3'))
+    store.put(*LA)
+    AliasIndex(anomaly_store=store)
+    assert graph.queries == 1
+    index = AliasIndex(anomaly_store=store)
+    assert graph.queries == 1
+    assert index.find_city('LA', 'US', 'US.CA') == 'Los Angeles'
@@ -0,0 +1,27 @@
+# tests/test_anomaly_store.py
+
+from utils.anomaly_store import AnomalyStore
+
+ANOMALY = {'city_input': 'Bombay', 'state_input': 'MH', 'country_input': 'IN'}
+CLEANED = {'city': 'Mumbai', 'state': 'Maharashtra', 'country': 'India'}
+
+
+def hit_count(store):
+    return store._connection().execute("SELECT hit_count FROM anomaly_resolutions").fetchone()[0]
+
+
+def test_hits_are_written_in_batches(tmp_path):
+    store = AnomalyStore(str(tmp_path / 'store.sqlite3'), hit_flush_interval=3600)
+    store.put(ANOMALY, CLEANED)
+    assert store.get(ANOMALY) == CLEANED
+    assert store.get(ANOMALY) == CLEANED
+    assert hit_count(store) == 0
+    store.flush_hits()
+    assert hit_count(store) == 2
+
+
+def test_hits_are_flushed_after_the_interval(tmp_path):
+    store = AnomalyStore(str(tmp_path / 'store.sqlite3'), hit_flush_interval=0)
+    store.put(ANOMALY, CLEANED)
+    store.get(ANOMALY)
+    assert hit_count(store) == 1
@@ -0,0 +1,112 @@
+# tests/test_ceeymore_batching.py
+
+import uuid
+from contextlib import contextmanager
+
+import pytest
+
+from bench.stubs import StubOpenAI
+from utils import ceeymore, llm_client
+from utils.llm_batcher import AnomalyBatcher
+from utils.llm_client import LLMCaller, CircuitBreaker
+
+
+class UnparseableOpenAI(StubOpenAI):
+    def respond(self, messages):
+        response = super().respond(messages)
+        response.choices[0].message.content = 'not json'
+        return response
+
+
+class NoUpdates:
+    def submit(self, *args, **kwargs):
+        return 'queued'
+
+
+@pytest.fixture
+def batching(monkeypatch):
+    """
+    Batching on, with update generation switched off, so the stub's call
+    count is the anomaly resolution calls alone.
+    """
+    def install(stub, llm=None):
+        monkeypatch.setattr(ceeymore, 'client', stub)
+        monkeypatch.setattr(ceeymore, 'get_update_worker', NoUpdates)
+        monkeypatch.setattr(llm_client, '_llm', llm or LLMCaller(breaker=CircuitBreaker(failures=100), base_delay=0))
+        batcher = AnomalyBatcher(stub, fallback=lambda anomaly_data: ceeymore.CeeyMore().analyze_and_clean_data(anomaly_data),
+                                 max_batch=8, window=0.01)
+        monkeypatch.setattr(ceeymore, '_batcher', batcher)
+        return stub
+    return install
+
+
+def anomalies(count):
+    # Unique per test, so nothing is answered from the shared anomaly store
+    tag = uuid.uuid4().hex[:8]
+    return [{'city_input': f'city{i}{tag}', 'state_input': 'state', 'country_input': 'country'} for i in range(count)]
+
+
+def test_group_is_resolved_with_one_call(batching):
+    stub = batching(StubOpenAI())
+    group = anomalies(3)
+    results = ceeymore.CeeyMore().handle_anomalies(group + group[:1])
+    assert stub.calls == 1
+    assert [result['city'] for result in results] == [a['city_input'].title() for a in group + group[:1]]
+
+
+def test_resolved_group_is_answered_from_the_store(batching):
+    stub = batching(StubOpenAI())
+    group = anomalies(3)
+    ceeymore.CeeyMore().handle_anomalies(group)
+    store = ceeymore.CeeyMore().anomaly_store
+    hits = store.hits
+    ceeymore.CeeyMore().handle_anomalies(group)
+    assert stub.calls == 1
+    # One store lookup per anomaly
+    assert store.hits == hits + 3
+
+
+def test_locks_are_held_one_chunk_at_a_time(batching, monkeypatch):
+    held = []
+    most = 0
+
+    @contextmanager
+    def counting_lock(name):
+        nonlocal most
+        held.append(name)
+        most = max(most, len(held))
+        try:
+            yield
+        finally:
+            held.remove(name)
+
+    monkeypatch.setattr(ceeymore, 'file_lock', counting_lock)
+    stub = batching(StubOpenAI())
+    results = ceeymore.CeeyMore().handle_anomalies(anomalies(20))
+    assert all(results)
+    assert most == 8
+    assert stub.calls == 3
+
+
+def test_unparseable_batch_falls_back_once_per_item(batching):
+    stub = batching(UnparseableOpenAI())
+    results = ceeymore.CeeyMore().handle_anomalies(anomalies(3))
+    assert results == [None, None, None]
+    # One batch call plus one fallback per item, and no second round
+    assert stub.calls == 4
+
+
+def test_batch_timeout_skips_per_item_fallback(batching):
+    stub = batching(StubOpenAI(latency=0.2), llm=LLMCaller(timeout=0.05, max_retries=0, breaker=CircuitBreaker(failures=100)))
+    results = ceeymore.CeeyMore().handle_anomalies(anomalies(3))
+    assert results == [None, None, None]
+    assert stub.calls == 1
+
+
+def test_open_circuit_makes_no_calls(batching):
+    breaker = CircuitBreaker(failures=1, cooldown=60)
+    breaker.record_failure()
+    stub = batching(StubOpenAI(), llm=LLMCaller(breaker=breaker))
+    results = ceeymore.CeeyMore().handle_anomalies(anomalies(3))
+    assert results == [None, None, None]
+    assert stub.calls == 0
@@ -0,0 +1,115 @@
+# tests/test_code_patch.py
+
+import json
+
+import pytest
+
+from utils.code_patch import outline, parse_patch, apply_patch, PatchError
+
+SOURCE = '''import os
+from functools import wraps
+
+LIMIT = int(os.getenv("LIMIT", "3"))
+
+
+def timed(func):
+    """Time a call."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+    return wrapper
+
+
+@timed
+def lookup(name):
+    """Look a name up."""
+    return name.title()
+
+
+def finish(name):
+    return lookup(name)[:LIMIT]
+'''
+
+
+def patch(*functions, imports=()):
+    return {'imports': list(imports), 'functions': [{'name': name, 'source': source} for name, source in functions]}
+
+
+def definitions(source):
+    namespace = {}
+    exec(compile(source, 'patched', 'exec'), namespace)
+    return namespace
+
+
+def test_empty_patch_leaves_the_source_unchanged():
+    assert apply_patch(SOURCE, patch()) == SOURCE
+
+
+def test_replacement_keeps_decorators_left_out_of_the_patch():
+    patched = apply_patch(SOURCE, patch(('lookup', 'def lookup(name):\n    return name.upper()\n')))
+    assert '@timed\ndef lookup(name):\n    return name.upper()' in patched
+    assert definitions(patched)['finish']('paris') == 'PAR'
+
+
+def test_replacement_may_restate_decorators():
+    patched = apply_patch(SOURCE, patch(('lookup', '@timed\ndef lookup(name):\n    return name.lower()\n')))
+    assert patched.count('@timed') == 1
+
+
+def test_replacement_losing_a_decorator_is_rejected():
+    with pytest.raises(PatchError, match='decorators'):
+        apply_patch(SOURCE, patch(('lookup', '@staticmethod\ndef lookup(name):\n    return name\n')))
+
+
+def test_new_functions_and_imports_are_added():
+    patched = apply_patch(SOURCE, patch(
+        ('from_coordinates', 'def from_coordinates(lat, lon):\n    return math.floor(lat)\n'),
+        imports=['import math', 'import math', 'import os'],
+    ))
+    assert patched.count('import math\n') == 1
+    assert patched.count('import os\n') == 1
+    # After the module's own imports, before anything else
+    assert patched.index('import math') < patched.index('LIMIT =')
+    assert definitions(patched)['from_coordinates'](1.5, 2) == 1
+
+
+def test_imports_land_after_the_last_import_when_earlier_lines_change():
+    source = 'def first():\n    pass\n\nimport os\n\nVALUE = 1\n'
+    patched = apply_patch(source, patch(('first', 'def first():\n    x = 1\n    y = 2\n    return x + y\n'),
+                                        imports=['import math']))
+    assert 'import os\nimport math\n' in patched
+
+
+@pytest.mark.parametrize('functions, message', [
+    ([('lookup', 'def other(name):\n    pass\n')], 'exactly one top-level definition'),
+    ([('lookup', 'def lookup(name):\n    pass\n\ndef extra():\n    pass\n')], 'exactly one top-level definition'),
+    ([('lookup', 'def lookup(name:\n')], 'does not parse'),
+    ([('lookup', 'def lookup(name):\n    pass\n'), ('lookup', 'def lookup(name):\n    pass\n')], 'more than once'),
+])
+def test_invalid_functions_are_rejected(functions, message):
+    with pytest.raises(PatchError, match=message):
+        apply_patch(SOURCE, patch(*functions))
+
+
+def test_non_import_lines_are_rejected():
+    with pytest.raises(PatchError, match='not an import'):
+        apply_patch(SOURCE, patch(imports=['LIMIT = 10']))
+
+
+def test_parse_patch_accepts_surrounding_text():
+    text = 'Here is the patch:\n' + json.dumps(patch(('finish', 'def finish(name):\n    return name\n')))
+    assert parse_patch(text)['functions'][0]['name'] == 'finish'
+
+
+@pytest.mark.parametrize('text', ['no json here', '{"functions": "finish"}', '{"functions": [{"name": "finish"}]}', '{"imports": [1]}'])
+def test_parse_patch_rejects_malformed_answers(text):
+    with pytest.raises(PatchError):
+        parse_patch(text)
+
+
+def test_outline_shows_relevant_functions_in_full():
+    view = outline(SOURCE, relevant={'finish'})
+    assert 'import os\nfrom functools import wraps\nLIMIT =' in view
+    assert '@timed\ndef lookup(name):\n    """Look a name up."""\n    ...' in view
+    assert 'return lookup(name)[:LIMIT]' in view
+    assert 'return name.title()' not in view
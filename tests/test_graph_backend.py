@@ -0,0 +1,13 @@
+# tests/test_graph_backend.py
+
+from utils.graph_backend import Neo4jBackend
+
+
+def test_fulltext_query_escapes_lucene_syntax():
+    assert Neo4jBackend._fulltext_query('Winston-Salem (NC)') == r'Winston\-Salem~ \(NC\)~'
+    assert Neo4jBackend._fulltext_query('a:b*') == r'a\:b\*~'
+
+
+def test_blank_names_are_not_searched():
+    rows = [{'idx': i, 'query': Neo4jBackend._fulltext_query(name)} for i, name in enumerate(['Paris', '', '  ', None])]
+    assert [row['idx'] for row in Neo4jBackend._searchable(rows)] == [0]
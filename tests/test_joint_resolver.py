@@ -0,0 +1,19 @@
+# tests/test_joint_resolver.py
+
+import pytest
+
+from utils.address_cleaner import resolve_address, resolve_addresses
+
+
+@pytest.mark.parametrize('address', [
+    ('Mumbai', 'Gujarat', 'India'),          # a real state, but not Mumbai's
+    ('Mumbai', 'Maharashtra', 'Pakistan'),   # a real country, but not Mumbai's
+])
+def test_valid_field_is_not_overridden(address):
+    assert resolve_address(*address) is None
+    assert resolve_addresses([address]) == {address: None}
+
+
+def test_misspelled_fields_are_corrected():
+    match = resolve_address('Mumbay', 'Maharastra', 'India')
+    assert (match['city_name'], match['state_name'], match['iso_code']) == ('Mumbai', 'Maharashtra', 'IN')
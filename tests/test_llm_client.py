@@ -0,0 +1,142 @@
+# tests/test_llm_client.py
+
+import asyncio
+
+import pytest
+
+from utils.llm_client import LLMCaller, CircuitBreaker, LLMUnavailable, CircuitOpen, CLOSED, HALF_OPEN, OPEN
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def failing(error):
+    calls = []
+
+    def create(timeout=None, **request):
+        calls.append(timeout)
+        raise error
+    create.calls = calls
+    return create
+
+
+def ok(timeout=None, **request):
+    return 'response'
+
+
+def caller(**kwargs):
+    kwargs.setdefault('breaker', CircuitBreaker(failures=2, cooldown=0.05))
+    kwargs.setdefault('base_delay', 0)
+    kwargs.setdefault('seed', 0)
+    return LLMCaller(**kwargs)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    llm = caller(max_retries=0)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            llm.call('test', failing(RuntimeError('down')))
+    assert llm.breaker.state == OPEN
+    assert not llm.available()
+    with pytest.raises(CircuitOpen):
+        llm.call('test', ok)
+
+
+def test_half_open_probe_success_closes_circuit():
+    llm = caller(max_retries=0, breaker=CircuitBreaker(failures=1, cooldown=0))
+    with pytest.raises(RuntimeError):
+        llm.call('test', failing(RuntimeError('down')))
+    assert llm.breaker.state == OPEN
+    assert llm.call('test', ok) == 'response'
+    assert llm.breaker.state == CLOSED
+
+
+def test_half_open_probe_failure_reopens_circuit():
+    breaker = CircuitBreaker(failures=1, cooldown=0)
+    llm = caller(max_retries=0, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            llm.call('test', failing(RuntimeError('down')))
+    assert breaker.state == OPEN
+    assert breaker.counters['opened'] == 2
+
+
+def test_cancelled_probe_does_not_close_circuit():
+    breaker = CircuitBreaker(failures=1, cooldown=0)
+    llm = caller(max_retries=0, breaker=breaker)
+    with pytest.raises(RuntimeError):
+        llm.call('test', failing(RuntimeError('down')))
+
+    async def slow(timeout=None, **request):
+        await asyncio.sleep(1)
+
+    async def cancel_probe():
+        task = asyncio.create_task(llm.call_async('test', slow))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert breaker.state == HALF_OPEN
+    assert not breaker.probing
+    assert llm.stats()['ok'] == 0
+
+
+def test_slot_rejection_is_not_a_provider_failure():
+    llm = caller(max_retries=0, concurrency=1, breaker=CircuitBreaker(failures=1, cooldown=10))
+    llm.slots.acquire()
+    with pytest.raises(LLMUnavailable):
+        llm.call('test', ok, timeout=0.01)
+    assert llm.breaker.state == CLOSED
+    assert llm.stats()['rejected'] == 1
+
+
+def test_retryable_errors_are_retried_up_to_max_retries():
+    llm = caller(max_retries=2, breaker=CircuitBreaker(failures=10))
+    create = failing(StatusError(503))
+    with pytest.raises(StatusError):
+        llm.call('test', create)
+    assert len(create.calls) == 3
+    assert llm.stats()['retries'] == 2
+
+
+def test_client_errors_are_not_retried_or_counted_against_the_breaker():
+    llm = caller(max_retries=2, breaker=CircuitBreaker(failures=1))
+    create = failing(StatusError(400))
+    with pytest.raises(StatusError):
+        llm.call('test', create)
+    assert len(create.calls) == 1
+    assert llm.breaker.state == CLOSED
+
+
+def test_retry_budget_bounds_retries():
+    llm = caller(max_retries=5, retry_ratio=0, retry_burst=1, breaker=CircuitBreaker(failures=100))
+    create = failing(StatusError(503))
+    for _ in range(3):
+        with pytest.raises(StatusError):
+            llm.call('test', create)
+    # Three calls, but the budget only ever allowed one retry
+    assert len(create.calls) == 4
+
+
+def test_remaining_deadline_is_passed_as_timeout():
+    llm = caller(max_retries=0)
+    create = failing(StatusError(400))
+    with pytest.raises(StatusError):
+        llm.call('test', create, timeout=5)
+    assert 0 < create.calls[0] <= 5
+
+
+def test_async_call_times_out_at_the_deadline():
+    llm = caller(max_retries=0)
+
+    async def slow(timeout=None, **request):
+        await asyncio.sleep(1)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(llm.call_async('test', slow, timeout=0.05))
+    assert llm.stats()['timeouts'] == 1
@@ -0,0 +1,48 @@
+# tests/test_result_cache.py
+
+import asyncio
+import threading
+
+import pytest
+
+from utils.metrics import CACHE_ERRORS
+from utils.result_cache import ResultCache, SQLiteBackend
+
+
+def accessed_at(backend, key):
+    return backend._connection().execute("SELECT accessed_at FROM result_cache WHERE key = ?", (key,)).fetchone()[0]
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteBackend(100, 60, path=str(tmp_path / 'cache.sqlite3'), touch_interval=60)
+
+
+def test_recent_hit_is_not_written(backend):
+    backend.set('k', 'v1', {'city': 'Paris'})
+    before = accessed_at(backend, 'k')
+    assert backend.get('k', 'v1') == {'city': 'Paris'}
+    assert accessed_at(backend, 'k') == before
+
+
+def test_stale_hit_is_touched(backend):
+    backend.set('k', 'v1', {'city': 'Paris'})
+    backend.touch_interval = 0
+    before = accessed_at(backend, 'k')
+    assert backend.get('k', 'v1') == {'city': 'Paris'}
+    assert accessed_at(backend, 'k') > before
+
+
+def test_errors_are_a_miss_and_a_skipped_write(backend):
+    backend._connection().close()
+    errors = CACHE_ERRORS.value(operation='get'), CACHE_ERRORS.value(operation='set')
+    assert backend.get('k', 'v1') is None
+    backend.set('k', 'v1', {'city': 'Paris'})
+    assert (CACHE_ERRORS.value(operation='get'), CACHE_ERRORS.value(operation='set')) == (errors[0] + 1, errors[1] + 1)
+
+
+def test_async_get_reads_sqlite_off_the_event_loop(backend, monkeypatch):
+    threads = []
+    monkeypatch.setattr(backend, 'get', lambda key, version: threads.append(threading.current_thread()))
+    asyncio.run(ResultCache(backend).get_async('Paris', '', 'France'))
+    assert threads and threads[0] is not threading.main_thread()
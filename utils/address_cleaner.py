@@ -1,184 +1,814 @@
 # utils/address_cleaner.py
 
 import os
-import requests
-import difflib 
-import pycountry
-from neo4j import GraphDatabase
+import time
+import asyncio
 from .ceeymore import CeeyMore  # Import CeeyMore correctly
+from .gazetteer import get_gazetteer
+from .alias_index import get_alias_index
+from .anomaly_store import get_anomaly_store
+from .llm_client import get_llm
+from .graph_backend import get_graph_backend, similarity
+from .result_cache import result_cache
+from .fuzzy import ScopedFuzzyIndex, FUZZY_MIN_SCORE, NEO4J_FUZZY_FALLBACK
+from .metrics import STAGE_DURATION, MATCHES, ANOMALY_ESCALATIONS, DEGRADED
+from .event_log import log_clean
+from .log import get_logger
 
-GEONAMES_USERNAME = 'hvrshchaudhary'  # Replace with your GeoNames username
+logger = get_logger('address_cleaner')
 
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USER = os.getenv("NEO4J_USER")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+def _load_city_names(scope):
+    """
+    Fetch every city name in a ('admin', admin1_code) or ('country', iso_code) scope.
+    """
+    return [(name, name) for name in get_graph_backend().city_names(scope)]
+
+# Resolve city, state and country together in one lookup before the staged pipeline
+JOINT_RESOLVER = os.getenv("JANITOR_JOINT_RESOLVER", "1").lower() in ('1', 'true', 'yes')
+# Minimum joint score (see graph_backend.score_path) to accept a path without CeeyMore
+JOINT_MIN_SCORE = float(os.getenv("JANITOR_JOINT_MIN_SCORE", "0.85"))
+
+# Escalation policy: a fuzzy state or city is accepted without CeeyMore when its
+# score is at least ACCEPT_MIN_SCORE and beats the runner-up by ACCEPT_MIN_MARGIN
+ACCEPT_MIN_SCORE = float(os.getenv("JANITOR_ACCEPT_MIN_SCORE", "0.85"))
+ACCEPT_MIN_MARGIN = float(os.getenv("JANITOR_ACCEPT_MIN_MARGIN", "0.05"))
+# Ranked candidates kept per stage
+TOP_K = int(os.getenv("JANITOR_TOP_K", "3"))
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+# Local fuzzy indexes of city names, one per state (or country when the state is unknown)
+city_fuzzy = ScopedFuzzyIndex(_load_city_names, max_scopes=int(os.getenv("JANITOR_CITY_INDEX_SCOPES", "256")))
 
+def _city_scope(country_code, admin_code):
+    return ('admin', admin_code) if admin_code else ('country', country_code)
+
+def _rank(candidates, key):
+    """
+    Dedupe candidate tuples on candidate[key], keeping the best score, and
+    return the TOP_K best first.
+    """
+    best = {}
+    for candidate in candidates:
+        if candidate[key] not in best or candidate[0] > best[candidate[key]][0]:
+            best[candidate[key]] = candidate
+    return sorted(best.values(), key=lambda candidate: -candidate[0])[:TOP_K]
+
+def confident(candidates):
+    """
+    Apply the escalation policy to ranked (score, ...) candidates.
+    """
+    if not candidates:
+        return False
+    runner_up = candidates[1][0] if len(candidates) > 1 else 0.0
+    return candidates[0][0] >= ACCEPT_MIN_SCORE and candidates[0][0] - runner_up >= ACCEPT_MIN_MARGIN
+
+def _fuzzy_label(candidates):
+    return 'fuzzy' if confident(candidates) else 'uncertain'
+
+@STAGE_DURATION.timed(stage='country')
 def get_country_code(country_name):
     """
-    Convert country name to its ISO code and standardized name using Neo4j.
-    """
-    with driver.session() as session:
-        # Try exact match
-        result = session.run("""
-            MATCH (c:Country)
-            WHERE toLower(c.country_name) = toLower($country_name)
-            RETURN c.country_name AS country_name, c.iso_code AS iso_code
-            LIMIT 1
-        """, country_name=country_name)
-        record = result.single()
-        if record:
-            return record['iso_code'], record['country_name']
-
-        # Fuzzy match using full-text search
-        result = session.run("""
-            CALL db.index.fulltext.queryNodes('countryNameIndex', $country_name + '~')
-            YIELD node, score
-            RETURN node.country_name AS country_name, node.iso_code AS iso_code
-            ORDER BY score DESC
-            LIMIT 1
-        """, country_name=country_name)
-        record = result.single()
-        if record:
-            return record['iso_code'], record['country_name']
-
-        return None, None
+    Convert country name to its ISO code and standardized name using the
+    gazetteer, falling back to the graph backend on a miss.
+
+    Returns:
+        tuple: (iso_code, country_name, candidates), where candidates are the
+        ranked (score, iso_code, country_name) matches.
+    """
+    # Try the in-memory gazetteer (name, ISO2, ISO3 or FIPS code)
+    iso_code, standardized_name = get_gazetteer().find_country(country_name)
+    if iso_code:
+        MATCHES.inc(stage='country', match='exact', source='gazetteer')
+        return iso_code, standardized_name, [(1.0, iso_code, standardized_name)]
+
+    # Try known aliases (codes, abbreviations, previously resolved variants)
+    iso_code, standardized_name = get_alias_index().find_country(country_name)
+    if iso_code:
+        MATCHES.inc(stage='country', match='exact', source='alias')
+        return iso_code, standardized_name, [(1.0, iso_code, standardized_name)]
+
+    graph = get_graph_backend()
+    # Try exact match
+    iso_code, standardized_name = graph.find_country(country_name)
+    if iso_code:
+        MATCHES.inc(stage='country', match='exact', source=graph.name)
+        return iso_code, standardized_name, [(1.0, iso_code, standardized_name)]
+
+    # Fuzzy match using the local engine
+    candidates = get_gazetteer().fuzzy_country(country_name, k=TOP_K)
+    source = 'local'
+    if not (candidates and candidates[0][0] >= FUZZY_MIN_SCORE):
+        if not NEO4J_FUZZY_FALLBACK:
+            MATCHES.inc(stage='country', match='none', source=source)
+            return None, None, candidates
+        # Fuzzy match using the backend's full-text search
+        source = graph.name
+        iso_code, standardized_name = graph.find_country(country_name, fuzzy=True)
+        if not iso_code:
+            MATCHES.inc(stage='country', match='none', source=source)
+            return None, None, candidates
+        candidates = _rank(candidates + [(similarity(country_name, standardized_name), iso_code, standardized_name)], 1)
+
+    MATCHES.inc(stage='country', match=_fuzzy_label(candidates), source=source)
+    return candidates[0][1], candidates[0][2], candidates
 
 ###########################################################################################################################
 
+@STAGE_DURATION.timed(stage='city')
 def validate_city(city_name, country_code, admin_code=None):
     """
-    Validate the city using Neo4j with fuzzy matching.
+    Validate the city using the graph backend, with local fuzzy matching and
+    the backend's full-text search as the fallback.
+
+    Returns:
+        tuple: (city_name, is_valid, candidates), where candidates are the
+        ranked (score, city_name) matches and is_valid means exact or
+        confident enough under the escalation policy.
     """
-    with driver.session() as session:
-        # Try exact match
-        if admin_code:
-            result = session.run("""
-                MATCH (city:City)-[:IN_STATE]->(state:State { admin1_code: $admin_code })
-                WHERE toLower(city.city_name) = toLower($city_name)
-                RETURN city.city_name AS city_name
-                LIMIT 1
-            """, city_name=city_name, admin_code=admin_code)
-        else:
-            result = session.run("""
-                MATCH (city:City)-[:IN_STATE]->(state:State)-[:IN_COUNTRY]->(c:Country { iso_code: $country_code })
-                WHERE toLower(city.city_name) = toLower($city_name)
-                RETURN city.city_name AS city_name
-                LIMIT 1
-            """, city_name=city_name, country_code=country_code)
-        record = result.single()
-        if record:
-            return record['city_name'], True
-
-        # Fuzzy match using full-text search
-        if admin_code:
-            result = session.run("""
-                CALL db.index.fulltext.queryNodes('cityNameIndex', $city_name + '~')
-                YIELD node, score
-                MATCH (node)-[:IN_STATE]->(state:State { admin1_code: $admin_code })
-                RETURN node.city_name AS city_name, score
-                ORDER BY score DESC
-                LIMIT 1
-            """, city_name=city_name, admin_code=admin_code)
-        else:
-            result = session.run("""
-                CALL db.index.fulltext.queryNodes('cityNameIndex', $city_name + '~')
-                YIELD node, score
-                MATCH (node)-[:IN_STATE]->(state:State)-[:IN_COUNTRY]->(c:Country { iso_code: $country_code })
-                RETURN node.city_name AS city_name, score
-                ORDER BY score DESC
-                LIMIT 1
-            """, city_name=city_name, country_code=country_code)
-        record = result.single()
-        if record:
-            return record['city_name'], False
-
-        return city_name, False
+    graph = get_graph_backend()
+    # Try exact match
+    standardized_name = graph.find_city(city_name, country_code, admin_code)
+    if standardized_name:
+        MATCHES.inc(stage='city', match='exact', source=graph.name)
+        return standardized_name, True, [(1.0, standardized_name)]
+
+    # Try known aliases before fuzzy matching
+    standardized_name = get_alias_index().find_city(city_name, country_code, admin_code)
+    if standardized_name:
+        MATCHES.inc(stage='city', match='exact', source='alias')
+        return standardized_name, True, [(1.0, standardized_name)]
+
+    # Fuzzy match using the local engine, scoped to the state or country
+    candidates = city_fuzzy.search(_city_scope(country_code, admin_code), city_name, k=TOP_K)
+    source = 'local'
+    if not (candidates and candidates[0][0] >= FUZZY_MIN_SCORE):
+        if not NEO4J_FUZZY_FALLBACK:
+            MATCHES.inc(stage='city', match='none', source=source)
+            return city_name, False, candidates
+        # Fuzzy match using the backend's full-text search
+        source = graph.name
+        standardized_name = graph.find_city(city_name, country_code, admin_code, fuzzy=True)
+        if not standardized_name:
+            MATCHES.inc(stage='city', match='none', source=source)
+            return city_name, False, candidates
+        candidates = _rank(candidates + [(similarity(city_name, standardized_name), standardized_name)], 1)
+
+    MATCHES.inc(stage='city', match=_fuzzy_label(candidates), source=source)
+    return candidates[0][1], confident(candidates), candidates
 
 #######################################################################################################################################
 
+@STAGE_DURATION.timed(stage='state')
 def validate_state(state_name, country_code):
     """
-    Validate the state using Neo4j with fuzzy matching.
-    """
-    with driver.session() as session:
-        # Try exact match
-        result = session.run("""
-            MATCH (s:State)-[:IN_COUNTRY]->(c:Country { iso_code: $country_code })
-            WHERE toLower(s.admin1_name) = toLower($state_name)
-            RETURN s.admin1_name AS state_name, s.admin1_code AS admin_code
-            LIMIT 1
-        """, country_code=country_code, state_name=state_name)
-        record = result.single()
-        if record:
-            return record['state_name'], True, record['admin_code']
-
-        # Fuzzy match using full-text search
-        result = session.run("""
-            CALL db.index.fulltext.queryNodes('stateNameIndex', $state_name + '~')
-            YIELD node, score
-            MATCH (node)-[:IN_COUNTRY]->(c:Country { iso_code: $country_code })
-            RETURN node.admin1_name AS state_name, node.admin1_code AS admin_code, score
-            ORDER BY score DESC
-            LIMIT 1
-        """, state_name=state_name, country_code=country_code)
-        record = result.single()
-        if record:
-            return record['state_name'], False, record['admin_code']
-
-        return state_name, False, None
+    Validate the state using the gazetteer, falling back to the graph backend
+    with fuzzy matching.
+
+    Returns:
+        tuple: (state_name, is_valid, admin_code, candidates), where candidates
+        are the ranked (score, state_name, admin_code) matches and is_valid
+        means exact or confident enough under the escalation policy.
+    """
+    # Try the in-memory gazetteer (name, ASCII name or admin1 code)
+    standardized_name, admin_code = get_gazetteer().find_state(state_name, country_code)
+    if admin_code:
+        MATCHES.inc(stage='state', match='exact', source='gazetteer')
+        return standardized_name, True, admin_code, [(1.0, standardized_name, admin_code)]
+
+    # Try known aliases (abbreviations, previously resolved variants)
+    standardized_name, admin_code = get_alias_index().find_state(state_name, country_code)
+    if admin_code:
+        MATCHES.inc(stage='state', match='exact', source='alias')
+        return standardized_name, True, admin_code, [(1.0, standardized_name, admin_code)]
+
+    graph = get_graph_backend()
+    # Try exact match
+    standardized_name, admin_code = graph.find_state(state_name, country_code)
+    if admin_code:
+        MATCHES.inc(stage='state', match='exact', source=graph.name)
+        return standardized_name, True, admin_code, [(1.0, standardized_name, admin_code)]
+
+    # Fuzzy match using the local engine, scoped to the country
+    candidates = get_gazetteer().fuzzy_state(state_name, country_code, k=TOP_K)
+    source = 'local'
+    if not (candidates and candidates[0][0] >= FUZZY_MIN_SCORE):
+        if not NEO4J_FUZZY_FALLBACK:
+            MATCHES.inc(stage='state', match='none', source=source)
+            return state_name, False, None, candidates
+        # Fuzzy match using the backend's full-text search
+        source = graph.name
+        standardized_name, admin_code = graph.find_state(state_name, country_code, fuzzy=True)
+        if not admin_code:
+            MATCHES.inc(stage='state', match='none', source=source)
+            return state_name, False, None, candidates
+        candidates = _rank(candidates + [(similarity(state_name, standardized_name), standardized_name, admin_code)], 2)
+
+    MATCHES.inc(stage='state', match=_fuzzy_label(candidates), source=source)
+    return candidates[0][1], confident(candidates), candidates[0][2], candidates
 
 ###########################################################################################################################
 
-def clean_address_fields(city, state, country):
+def _overrides_valid_field(match, state, country):
     """
-    Validate and correct the address fields.
-    
+    Whether a joint match replaces a state or country that is valid on its
+    own: ('Mumbai', 'Gujarat', 'India') scores well as Mumbai, Maharashtra,
+    but Gujarat is a real state, so the input is contradictory rather than
+    misspelled.
+    """
+    gazetteer = get_gazetteer()
+    iso_code, _ = gazetteer.find_country(country)
+    if iso_code and iso_code != match['iso_code']:
+        return True
+    _, admin_code = gazetteer.find_state(state, iso_code or match['iso_code'])
+    return bool(admin_code) and admin_code != match['admin_code']
+
+def _accept_joint(match, state, country):
+    """
+    A joint match is trusted when the whole path scores well, the city itself
+    is at least a good fuzzy match, and it only corrects fields that were
+    missing or invalid; anything else goes down the staged pipeline (and on
+    to CeeyMore if it is still anomalous).
+
     Args:
-        city (str): City name.
-        state (str): State name.
-        country (str): Country name.
-        
+        match (dict): The best path (see graph_backend.score_path), or None.
+        state, country (str): The inputs the path was scored against.
+    """
+    return (bool(match) and match['score'] >= JOINT_MIN_SCORE and match['city_score'] >= FUZZY_MIN_SCORE
+            and not _overrides_valid_field(match, state, country))
+
+def _scores(country_candidates, state_candidates, city_candidates):
+    """
+    Confidence per field and the ranked candidates behind it, for API responses.
+    """
+    return {
+        'confidence': {
+            'city': city_candidates[0][0] if city_candidates else 0.0,
+            'state': state_candidates[0][0] if state_candidates else 0.0,
+            'country': country_candidates[0][0] if country_candidates else 0.0,
+        },
+        'candidates': {
+            'city': [{'name': name, 'score': score} for score, name in city_candidates],
+            'state': [{'name': name, 'admin_code': admin_code, 'score': score}
+                      for score, name, admin_code in state_candidates],
+            'country': [{'name': name, 'iso_code': iso_code, 'score': score}
+                        for score, iso_code, name in country_candidates],
+        },
+    }
+
+def _joint_address(match):
+    return {
+        'corrected_city': match['city_name'],
+        'corrected_state': match['state_name'],
+        'corrected_country': match['country_name'],
+        'country_code': match['iso_code'],
+        'anomaly': False,
+        **_scores([(match['country_score'], match['iso_code'], match['country_name'])],
+                  [(match['state_score'], match['state_name'], match['admin_code'])],
+                  [(match['city_score'], match['city_name'])])
+    }
+
+@STAGE_DURATION.timed(stage='joint')
+def resolve_address(city, state, country):
+    """
+    Resolve all three fields against each other in one graph lookup, after
+    replacing known aliases with their canonical names.
+
     Returns:
-        dict: Corrected address fields.
+        dict: The best path if it is trusted (see _accept_joint), otherwise None.
+    """
+    graph = get_graph_backend()
+    city, state, country = get_alias_index().canonicalize(city, state, country)
+    match = graph.resolve_address(city, state, country)
+    accepted = _accept_joint(match, state, country)
+    MATCHES.inc(stage='joint', match=('exact' if match['score'] == 1.0 else 'fuzzy') if accepted else 'none',
+                source=graph.name)
+    return match if accepted else None
+
+async def resolve_address_async(city, state, country):
+    """
+    resolve_address for the async request path. The alias index can read the
+    anomaly store when it refreshes, so canonicalizing runs on a worker thread.
+    """
+    graph = get_graph_backend()
+    with STAGE_DURATION.time(stage='joint'):
+        city, state, country = await asyncio.to_thread(lambda: get_alias_index().canonicalize(city, state, country))
+        match = await graph.resolve_address_async(city, state, country)
+    accepted = _accept_joint(match, state, country)
+    MATCHES.inc(stage='joint', match=('exact' if match['score'] == 1.0 else 'fuzzy') if accepted else 'none',
+                source=graph.name)
+    return match if accepted else None
+
+@STAGE_DURATION.timed(stage='joint_batch')
+def resolve_addresses(addresses):
+    """
+    Batch version of resolve_address.
+
+    Args:
+        addresses (list): Distinct (city, state, country) triples.
+
+    Returns:
+        dict: (city, state, country) -> trusted path or None.
+    """
+    graph = get_graph_backend()
+    aliases = get_alias_index()
+    canonical = {key: aliases.canonicalize(*key) for key in addresses}
+    matches = graph.resolve_addresses(list(set(canonical.values())))
+    resolved = {}
+    for key in addresses:
+        _, state, country = canonical[key]
+        match = matches.get(canonical[key])
+        accepted = _accept_joint(match, state, country)
+        MATCHES.inc(stage='joint', match=('exact' if match['score'] == 1.0 else 'fuzzy') if accepted else 'none',
+                    source='batch')
+        resolved[key] = match if accepted else None
+    return resolved
+
+###########################################################################################################################
+
+def _lookup_address(city, state, country):
+    """
+    Run the country, state and city stages for one address.
+
+    Returns:
+        dict: The inputs and each stage's result, as consumed by _finish_address.
     """
     # Convert country name to ISO code and get standardized country name
-    country_code, standardized_country = get_country_code(country)
+    country_code, standardized_country, country_candidates = get_country_code(country)
 
     if not country_code:
-        print(f"Proceeding without country code for '{country}'.")
+        logger.info("Proceeding without country code for '%s'.", country)
 
     # Validate and correct the state
-    corrected_state, state_valid, admin_code = validate_state(state.title(), country_code) if country_code else (state.title(), False, None)
+    corrected_state, state_valid, admin_code, state_candidates = validate_state(state.title(), country_code) if country_code else (state.title(), False, None, [])
 
     # Validate and correct the city, passing admin_code to limit the search within the state
-    corrected_city, city_valid = validate_city(city.title(), country_code, admin_code) if country_code else (city.title(), False)
+    corrected_city, city_valid, city_candidates = validate_city(city.title(), country_code, admin_code) if country_code else (city.title(), False, [])
+
+    return {
+        'city': city, 'state': state, 'country': country,
+        'country_code': country_code, 'standardized_country': standardized_country,
+        'country_candidates': country_candidates,
+        'corrected_state': corrected_state, 'state_valid': state_valid, 'admin_code': admin_code,
+        'state_candidates': state_candidates,
+        'corrected_city': corrected_city, 'city_valid': city_valid, 'city_candidates': city_candidates,
+    }
+
+def _is_anomaly(row):
+    # Anomalous unless both city and state are valid (exact, or confident fuzzy matches)
+    return not (row['city_valid'] and row['state_valid'])
+
+def _anomaly_data(row):
+    return {
+        'city_input': row['city'],
+        'state_input': row['state'],
+        'country_input': row['country']
+    }
+
+def _stage(row):
+    # What answered a looked-up address, for the event log
+    if row.get('joint'):
+        return 'joint'
+    if row.get('degraded'):
+        return 'degraded'
+    return 'ceeymore' if _is_anomaly(row) else 'staged'
+
+def _degrade(row):
+    """
+    Answer an anomaly without the LLM while its circuit is open: from an
+    earlier resolution if there is one, otherwise (returning None) with the
+    best graph/fuzzy result, which is not cached.
+    """
+    row['degraded'] = True
+    DEGRADED.inc()
+    return get_anomaly_store().get(_anomaly_data(row))
 
-    # Check if both city and state are valid
-    if city_valid and state_valid:
+def _escalate(row):
+    if not get_llm().available():
+        return _degrade(row)
+    ANOMALY_ESCALATIONS.inc()
+    return CeeyMore().handle_anomaly(_anomaly_data(row))
+
+async def _escalate_async(row):
+    if not get_llm().available():
+        return await asyncio.to_thread(_degrade, row)
+    ANOMALY_ESCALATIONS.inc()
+    return await CeeyMore().handle_anomaly_async(_anomaly_data(row))
+
+def _finish_address(row):
+    """
+    Build the response for a looked-up address (see _lookup_address), using
+    row['joint'] if the joint resolver matched it and row['cleaned_data'] if
+    CeeyMore resolved it, and cache it unless it is an unresolved anomaly.
+    """
+    if row.get('joint'):
+        cleaned_address = _joint_address(row['joint'])
+        result_cache.set(row['city'], row['state'], row['country'], cleaned_address)
+        return cleaned_address
+
+    corrected_city = row['corrected_city']
+    corrected_state = row['corrected_state']
+    anomaly = _is_anomaly(row)
+    resolved = True
+    if not anomaly:
         # Both are valid, proceed as usual
-        cleaned_country = standardized_country if standardized_country else country.title()
+        cleaned_country = row['standardized_country'] if row['standardized_country'] else row['country'].title()
+    elif row.get('cleaned_data'):
+        cleaned_data = row['cleaned_data']
+        corrected_city = cleaned_data.get('city', corrected_city)
+        corrected_state = cleaned_data.get('state', corrected_state)
+        cleaned_country = cleaned_data.get('country', row['country'].title())
     else:
-        # Anomaly detected, delegate to CeeyMore
-        anomaly_data = {
-            'city_input': city,
-            'state_input': state,
-            'country_input': country
-        }
-        cleaned_data = CeeyMore().handle_anomaly(anomaly_data)
-        if cleaned_data:
-            corrected_city = cleaned_data.get('city', corrected_city)
-            corrected_state = cleaned_data.get('state', corrected_state)
-            cleaned_country = cleaned_data.get('country', country.title())
-        else:
-            # If CeeyMore couldn't resolve, proceed with original data
-            cleaned_country = country.title()
+        # If CeeyMore couldn't resolve (or wasn't asked), proceed with the graph/fuzzy result
+        cleaned_country = row['standardized_country'] if row['standardized_country'] else row['country'].title()
+        resolved = False
 
-    driver.close()
-    return {
+    cleaned_address = {
         'corrected_city': corrected_city,
         'corrected_state': corrected_state,
         'corrected_country': cleaned_country,
-        'country_code': country_code if country_code else 'N/A'
+        'country_code': row['country_code'] if row['country_code'] else 'N/A',
+        'anomaly': anomaly,
+        **_scores(row['country_candidates'], row['state_candidates'], row['city_candidates'])
+    }
+    # Unresolved anomalies aren't cached so they are retried next time
+    if resolved:
+        result_cache.set(row['city'], row['state'], row['country'], cleaned_address)
+    return cleaned_address
+
+ADDRESS_FIELDS = ('city', 'state', 'country')
+
+def is_address(value):
+    """
+    Whether a request item is a {city, state, country} object whose fields
+    are strings or null (missing fields count as null).
+    """
+    return isinstance(value, dict) and all(
+        value.get(field) is None or isinstance(value.get(field), str) for field in ADDRESS_FIELDS
+    )
+
+def clean_address_fields(city, state, country):
+    """
+    Validate and correct the address fields.
+    
+    Args:
+        city (str): City name.
+        state (str): State name.
+        country (str): Country name.
+        
+    Returns:
+        dict: Corrected address fields, with an 'anomaly' flag set when the
+        address was delegated to CeeyMore, and the per-field 'confidence'
+        and ranked 'candidates' the graph lookups produced.
+    """
+    start = time.perf_counter()
+    # Repeated inputs are answered from the result cache
+    cached = result_cache.get(city, state, country)
+    if cached is not None:
+        log_clean(city, state, country, cached, 'cache', time.perf_counter() - start)
+        return dict(cached)
+
+    # Find the best consistent city/state/country path in one lookup
+    match = resolve_address(city, state, country) if JOINT_RESOLVER else None
+    if match:
+        row = {'city': city, 'state': state, 'country': country, 'joint': match}
+    else:
+        row = _lookup_address(city, state, country)
+
+    llm_latency = None
+    if not match and _is_anomaly(row):
+        # Anomaly detected, delegate to CeeyMore
+        llm_start = time.perf_counter()
+        row['cleaned_data'] = _escalate(row)
+        llm_latency = time.perf_counter() - llm_start
+    cleaned_address = _finish_address(row)
+    log_clean(city, state, country, cleaned_address, _stage(row), time.perf_counter() - start, llm_latency)
+    return cleaned_address
+
+async def clean_address_fields_async(city, state, country):
+    """
+    clean_address_fields for the async request path (see asgi.py). The joint
+    lookup and the LLM call are awaited, so a worker can hold many requests
+    at once and clean ones don't wait behind anomalies.
+    """
+    start = time.perf_counter()
+    cached = await result_cache.get_async(city, state, country)
+    if cached is not None:
+        log_clean(city, state, country, cached, 'cache', time.perf_counter() - start, mode='async')
+        return dict(cached)
+
+    match = await resolve_address_async(city, state, country) if JOINT_RESOLVER else None
+    if match:
+        row = {'city': city, 'state': state, 'country': country, 'joint': match}
+    else:
+        # The staged lookups use the sync backend API, so run them on a worker thread
+        row = await asyncio.to_thread(_lookup_address, city, state, country)
+
+    llm_latency = None
+    if not match and _is_anomaly(row):
+        llm_start = time.perf_counter()
+        row['cleaned_data'] = await _escalate_async(row)
+        llm_latency = time.perf_counter() - llm_start
+    # Writes the result cache
+    cleaned_address = await asyncio.to_thread(_finish_address, row)
+    log_clean(city, state, country, cleaned_address, _stage(row), time.perf_counter() - start, llm_latency,
+              mode='async')
+    return cleaned_address
+
+###########################################################################################################################
+
+@STAGE_DURATION.timed(stage='country_batch')
+def get_country_codes(country_names):
+    """
+    Batch version of get_country_code.
+
+    Args:
+        country_names (list): Distinct country names.
+
+    Returns:
+        dict: country name -> (iso_code, country_name, candidates), with
+        (None, None, candidates) if unresolved.
+    """
+    gazetteer = get_gazetteer()
+    aliases = get_alias_index()
+    resolved = {}
+    pending = []
+    for name in country_names:
+        iso_code, standardized_name = gazetteer.find_country(name)
+        source = 'gazetteer'
+        if not iso_code:
+            iso_code, standardized_name = aliases.find_country(name)
+            source = 'alias'
+        if iso_code:
+            MATCHES.inc(stage='country', match='exact', source=source)
+            resolved[name] = (iso_code, standardized_name, [(1.0, iso_code, standardized_name)])
+        else:
+            pending.append(name)
+
+    graph = get_graph_backend()
+    # Try exact match
+    exact = graph.find_countries(pending)
+
+    # Fuzzy match the remainder using the local engine
+    candidates = {name: gazetteer.fuzzy_country(name, k=TOP_K) for name in pending if name not in exact}
+    unmatched = [name for name, ranked in candidates.items() if not (ranked and ranked[0][0] >= FUZZY_MIN_SCORE)]
+
+    # Fuzzy match the rest using the backend's full-text search
+    fallback = graph.find_countries(unmatched, fuzzy=True) if NEO4J_FUZZY_FALLBACK else {}
+    for name, (iso_code, standardized_name) in fallback.items():
+        candidates[name] = _rank(candidates[name] + [(similarity(name, standardized_name), iso_code, standardized_name)], 1)
+
+    for name in pending:
+        if name in exact:
+            MATCHES.inc(stage='country', match='exact', source='batch')
+            resolved[name] = exact[name] + ([(1.0,) + exact[name]],)
+        elif name in unmatched and name not in fallback:
+            MATCHES.inc(stage='country', match='none', source='batch')
+            resolved[name] = (None, None, candidates[name])
+        else:
+            MATCHES.inc(stage='country', match=_fuzzy_label(candidates[name]), source='batch')
+            resolved[name] = (candidates[name][0][1], candidates[name][0][2], candidates[name])
+    return resolved
+
+
+@STAGE_DURATION.timed(stage='state_batch')
+def validate_states(states):
+    """
+    Batch version of validate_state.
+
+    Args:
+        states (list): Distinct (state_name, country_code) pairs.
+
+    Returns:
+        dict: (state_name, country_code) -> (state_name, is_valid, admin_code, candidates).
+    """
+    gazetteer = get_gazetteer()
+    aliases = get_alias_index()
+    resolved = {}
+    pending = []
+    for state_name, country_code in states:
+        standardized_name, admin_code = gazetteer.find_state(state_name, country_code)
+        source = 'gazetteer'
+        if not admin_code:
+            standardized_name, admin_code = aliases.find_state(state_name, country_code)
+            source = 'alias'
+        if admin_code:
+            MATCHES.inc(stage='state', match='exact', source=source)
+            resolved[(state_name, country_code)] = (standardized_name, True, admin_code,
+                                                    [(1.0, standardized_name, admin_code)])
+        else:
+            pending.append((state_name, country_code))
+
+    graph = get_graph_backend()
+    # Try exact match
+    exact = graph.find_states(pending)
+
+    # Fuzzy match the remainder using the local engine
+    candidates = {key: gazetteer.fuzzy_state(*key, k=TOP_K) for key in pending if key not in exact}
+    unmatched = [key for key, ranked in candidates.items() if not (ranked and ranked[0][0] >= FUZZY_MIN_SCORE)]
+
+    # Fuzzy match the rest using the backend's full-text search
+    fallback = graph.find_states(unmatched, fuzzy=True) if NEO4J_FUZZY_FALLBACK else {}
+    for key, (standardized_name, admin_code) in fallback.items():
+        candidates[key] = _rank(candidates[key] + [(similarity(key[0], standardized_name), standardized_name, admin_code)], 2)
+
+    for key in pending:
+        if key in exact:
+            MATCHES.inc(stage='state', match='exact', source='batch')
+            resolved[key] = (exact[key][0], True, exact[key][1], [(1.0,) + exact[key]])
+        elif key in unmatched and key not in fallback:
+            MATCHES.inc(stage='state', match='none', source='batch')
+            resolved[key] = (key[0], False, None, candidates[key])
+        else:
+            ranked = candidates[key]
+            MATCHES.inc(stage='state', match=_fuzzy_label(ranked), source='batch')
+            resolved[key] = (ranked[0][1], confident(ranked), ranked[0][2], ranked)
+    return resolved
+
+
+@STAGE_DURATION.timed(stage='city_batch')
+def validate_cities(cities):
+    """
+    Batch version of validate_city.
+
+    Args:
+        cities (list): Distinct (city_name, country_code, admin_code) triples.
+
+    Returns:
+        dict: (city_name, country_code, admin_code) -> (city_name, is_valid, candidates).
+    """
+    graph = get_graph_backend()
+    # Try exact match, scoped by state when it is known, otherwise by country
+    exact = graph.find_cities(cities)
+
+    # Try known aliases before fuzzy matching
+    aliases = get_alias_index()
+    aliased = {}
+    for key in cities:
+        if key not in exact:
+            standardized_name = aliases.find_city(*key)
+            if standardized_name:
+                aliased[key] = standardized_name
+
+    # Fuzzy match the remainder using the local engine, loading the city
+    # names of every scope not indexed yet in one round trip
+    pending = [key for key in cities if key not in exact and key not in aliased]
+    scopes = city_fuzzy.missing(dict.fromkeys(_city_scope(country_code, admin_code) for _, country_code, admin_code in pending))
+    city_fuzzy.preload({
+        scope: [(name, name) for name in names] for scope, names in graph.city_names_many(scopes).items()
+    })
+
+    candidates = {
+        (city_name, country_code, admin_code): city_fuzzy.search(_city_scope(country_code, admin_code), city_name, k=TOP_K)
+        for city_name, country_code, admin_code in pending
     }
+    unmatched = [key for key, ranked in candidates.items() if not (ranked and ranked[0][0] >= FUZZY_MIN_SCORE)]
+
+    # Fuzzy match the rest using the backend's full-text search
+    fallback = graph.find_cities(unmatched, fuzzy=True) if NEO4J_FUZZY_FALLBACK else {}
+    for key, standardized_name in fallback.items():
+        candidates[key] = _rank(candidates[key] + [(similarity(key[0], standardized_name), standardized_name)], 1)
+
+    resolved = {}
+    for key in cities:
+        if key in exact:
+            MATCHES.inc(stage='city', match='exact', source='batch')
+            resolved[key] = (exact[key], True, [(1.0, exact[key])])
+        elif key in aliased:
+            MATCHES.inc(stage='city', match='exact', source='alias')
+            resolved[key] = (aliased[key], True, [(1.0, aliased[key])])
+        elif key in unmatched and key not in fallback:
+            MATCHES.inc(stage='city', match='none', source='batch')
+            resolved[key] = (key[0], False, candidates[key])
+        else:
+            ranked = candidates[key]
+            MATCHES.inc(stage='city', match=_fuzzy_label(ranked), source='batch')
+            resolved[key] = (ranked[0][1], confident(ranked), ranked)
+    return resolved
+
+
+def _lookup_batch(addresses):
+    """
+    Everything clean_address_batch does before CeeyMore.
+
+    Returns:
+        tuple: (results, rows, anomalous), where results holds the cached
+        answers, rows the looked-up addresses (see _lookup_address) and
+        anomalous the rows still needing CeeyMore.
+    """
+    results = [None] * len(addresses)
+    rows = []
+    for i, address in enumerate(addresses):
+        city = (address.get('city') or '').strip()
+        state = (address.get('state') or '').strip()
+        country = (address.get('country') or '').strip()
+        # Repeated inputs are answered from the result cache
+        cached = result_cache.get(city, state, country)
+        if cached is not None:
+            results[i] = dict(cached)
+        else:
+            rows.append({'idx': i, 'city': city, 'state': state, 'country': country})
+    if not rows:
+        return results, rows, []
+
+    # Convert country names to ISO codes and standardized country names
+    countries = get_country_codes(list(dict.fromkeys(row['country'] for row in rows)))
+    for row in rows:
+        row['country_code'], row['standardized_country'], row['country_candidates'] = countries[row['country']]
+
+    # Validate and correct the states
+    state_keys = list(dict.fromkeys(
+        (row['state'].title(), row['country_code']) for row in rows if row['country_code']
+    ))
+    states = validate_states(state_keys)
+    for row in rows:
+        if row['country_code']:
+            row['corrected_state'], row['state_valid'], row['admin_code'], row['state_candidates'] = \
+                states[(row['state'].title(), row['country_code'])]
+        else:
+            row['corrected_state'], row['state_valid'], row['admin_code'], row['state_candidates'] = \
+                row['state'].title(), False, None, []
+
+    # Validate and correct the cities, limiting the search to the state when known
+    city_keys = list(dict.fromkeys(
+        (row['city'].title(), row['country_code'], row['admin_code']) for row in rows if row['country_code']
+    ))
+    cities = validate_cities(city_keys)
+    for row in rows:
+        if row['country_code']:
+            row['corrected_city'], row['city_valid'], row['city_candidates'] = \
+                cities[(row['city'].title(), row['country_code'], row['admin_code'])]
+        else:
+            row['corrected_city'], row['city_valid'], row['city_candidates'] = row['city'].title(), False, []
+
+    # Give the anomalies a second chance with the joint resolver, which can
+    # correct one bad field from the other two
+    anomalous = [row for row in rows if _is_anomaly(row)]
+    if JOINT_RESOLVER and anomalous:
+        joint = resolve_addresses(list(dict.fromkeys((row['city'], row['state'], row['country']) for row in anomalous)))
+        for row in anomalous:
+            row['joint'] = joint[(row['city'], row['state'], row['country'])]
+        anomalous = [row for row in anomalous if not row['joint']]
+    return results, rows, anomalous
+
+
+def _finish_batch(addresses, results, rows, anomalous, anomaly_results, start, llm_latency, mode):
+    for row, cleaned_data in zip(anomalous, anomaly_results):
+        row['cleaned_data'] = cleaned_data
+    for row in rows:
+        results[row['idx']] = _finish_address(row)
+
+    # One event per address, each carrying the whole batch's latency
+    stages = {row['idx']: _stage(row) for row in rows}
+    latency = time.perf_counter() - start
+    for i, (address, cleaned_address) in enumerate(zip(addresses, results)):
+        stage = stages.get(i, 'cache')
+        log_clean((address.get('city') or '').strip(), (address.get('state') or '').strip(),
+                  (address.get('country') or '').strip(), cleaned_address, stage, latency,
+                  llm_latency if stage == 'ceeymore' else None, mode=mode, batch_size=len(addresses))
+    return results
+
+def clean_address_batch(addresses):
+    """
+    Validate and correct a batch of address fields.
+
+    Each stage (country, state, city) is resolved for the distinct values in the
+    whole batch with a fixed number of graph backend calls. Anomalous rows get
+    one joint resolver pass, and the rest are handed to CeeyMore together at
+    the end.
+
+    Args:
+        addresses (list): Dicts with 'city', 'state' and 'country' keys.
+
+    Returns:
+        list: Corrected address fields for each input, in order, as returned
+        by clean_address_fields.
+    """
+    start = time.perf_counter()
+    results, rows, anomalous = _lookup_batch(addresses)
+
+    # Collect the anomalies and delegate them to CeeyMore as a group
+    llm_start = time.perf_counter()
+    if anomalous and not get_llm().available():
+        anomaly_results = [_degrade(row) for row in anomalous]
+    else:
+        ANOMALY_ESCALATIONS.inc(len(anomalous))
+        anomaly_results = CeeyMore().handle_anomalies([_anomaly_data(row) for row in anomalous]) if anomalous else []
+    llm_latency = time.perf_counter() - llm_start
+    return _finish_batch(addresses, results, rows, anomalous, anomaly_results, start, llm_latency, 'batch')
+
+async def clean_address_batch_async(addresses):
+    """
+    clean_address_batch for the async request path: the batched lookups run
+    on a worker thread and the batch's anomalies are resolved concurrently.
+    """
+    start = time.perf_counter()
+    results, rows, anomalous = await asyncio.to_thread(_lookup_batch, addresses)
+
+    llm_start = time.perf_counter()
+    if anomalous and not get_llm().available():
+        anomaly_results = await asyncio.to_thread(lambda: [_degrade(row) for row in anomalous])
+    else:
+        ANOMALY_ESCALATIONS.inc(len(anomalous))
+        anomaly_results = await CeeyMore().handle_anomalies_async([_anomaly_data(row) for row in anomalous]) if anomalous else []
+    llm_latency = time.perf_counter() - llm_start
+    return await asyncio.to_thread(_finish_batch, addresses, results, rows, anomalous, anomaly_results, start, llm_latency,
+                                   'batch_async')
@@ -0,0 +1,284 @@
+# utils/alias_index.py
+
+import os
+import csv
+import time
+import threading
+from .gazetteer import COUNTRIES_CSV, get_gazetteer
+from .graph_backend import get_graph_backend
+from .anomaly_store import get_anomaly_store
+from .fuzzy import normalize
+from .metrics import ALIASES_LEARNED
+from .log import get_logger
+
+logger = get_logger('alias_index')
+
+# How often (seconds) to pick up resolutions other workers added to the anomaly store
+ALIAS_REFRESH_INTERVAL = float(os.getenv("JANITOR_ALIAS_REFRESH_INTERVAL", "5"))
+
+
+def alias_key(value):
+    """
+    normalize() with punctuation and spaces dropped, so that 'U.S.A.', 'usa'
+    and 'U S A' share one key.
+    """
+    return ''.join(ch for ch in normalize(value) if ch.isalnum())
+
+
+def city_scope(country_code, admin_code=None):
+    return f"admin:{admin_code}" if admin_code else f"country:{country_code}"
+
+
+def alias_row(kind, scope, alias, target):
+    """
+    One alias as stored in the graph (see kg_loader.MERGE_ALIASES).
+
+    Args:
+        kind (str): 'country', 'state' or 'city'.
+        scope (str): '' for countries, the ISO code for states, city_scope() for cities.
+        alias (str): The variant as it was written.
+        target (str): ISO code, admin1 code or city name it stands for.
+    """
+    key = alias_key(alias)
+    city_id = f"{scope[len('admin:'):]}|{target}" if kind == 'city' and scope.startswith('admin:') else None
+    return {
+        'alias_id': f"{kind}|{scope}|{key}",
+        'kind': kind,
+        'scope': scope,
+        'key': key,
+        'alias': alias,
+        'target': target,
+        'city_id': city_id,
+    }
+
+
+def reference_aliases(countries_path=COUNTRIES_CSV, gazetteer=None):
+    """
+    Aliases implied by the reference data: country names and ISO2, ISO3 and
+    FIPS codes, and state names and admin1 codes (both 'CA' and 'US.CA').
+    Capital cities are left to the graph, which knows the state each one is in.
+
+    Returns:
+        list: alias_row() dicts, strongest first within each kind.
+    """
+    gazetteer = gazetteer or get_gazetteer()
+    rows = []
+    with open(countries_path, newline='', encoding='utf-8') as f:
+        countries = [row for row in csv.DictReader(f) if row['ISO_Code'].strip()]
+    # Same precedence as the gazetteer: ISO2 'AU' (Australia) beats FIPS 'AU' (Austria)
+    for column in ('Country_Name', 'ISO_Code', 'ISO3_Code', 'FIPS_Code', 'Equivalent_FIPS_Code'):
+        for country in countries:
+            if country.get(column, '').strip():
+                rows.append(alias_row('country', '', country[column].strip(), country['ISO_Code'].strip()))
+    for admin_code, state in gazetteer.states.items():
+        local_code = admin_code.partition('.')[2]
+        for alias in (state['state_name'], state['ascii_name'], local_code, admin_code):
+            if alias:
+                rows.append(alias_row('state', state['iso_code'], alias, admin_code))
+    return rows
+
+
+class AliasIndex:
+    """
+    In-memory map of variant spellings and codes ('USA', 'U.S.', 'CA',
+    'Bombay') to canonical countries, states and cities, consulted before
+    fuzzy search.
+
+    It is built from the reference CSVs, the Alias nodes in the graph, and
+    every resolution in the anomaly store. Resolutions this worker makes are
+    learned through learn(); ones other workers make are picked up from the
+    store at most every ALIAS_REFRESH_INTERVAL seconds.
+    """
+
+    def __init__(self, gazetteer=None, graph=None, anomaly_store=None):
+        self.gazetteer = gazetteer or get_gazetteer()
+        self.graph = graph
+        self.anomaly_store = anomaly_store
+        self.aliases = {}          # (kind, scope) -> {alias key -> target}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.learned = 0
+        self.store_position = 0    # last anomaly store rowid replayed
+        self.refreshed_at = 0.0
+
+        self.add(reference_aliases(gazetteer=self.gazetteer))
+        if graph is not None:
+            try:
+                self.add(graph.aliases())
+            except Exception:
+                logger.warning("Could not load Alias nodes from the graph", exc_info=True)
+        self.refresh(force=True)
+
+    def add(self, rows):
+        """
+        Add alias rows, keeping the existing target for a key that is already known.
+
+        Returns:
+            list: The rows that were new.
+        """
+        added = []
+        with self.lock:
+            for row in rows:
+                if not row['key']:
+                    continue
+                targets = self.aliases.setdefault((row['kind'], row['scope']), {})
+                if row['key'] not in targets:
+                    targets[row['key']] = row['target']
+                    added.append(row)
+        return added
+
+    def _get(self, kind, scope, value):
+        if time.monotonic() - self.refreshed_at >= ALIAS_REFRESH_INTERVAL:
+            self.refresh()
+        target = self.aliases.get((kind, scope), {}).get(alias_key(value))
+        if target is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return target
+
+    def find_country(self, country_name):
+        """
+        Returns:
+            tuple: (iso_code, country_name), or (None, None) if not an alias.
+        """
+        iso_code = self._get('country', '', country_name)
+        country = self.gazetteer.countries.get(iso_code)
+        return (iso_code, country['country_name']) if country else (None, None)
+
+    def find_state(self, state_name, country_code):
+        """
+        Returns:
+            tuple: (state_name, admin_code), or (None, None) if not an alias.
+        """
+        admin_code = self._get('state', country_code or '', state_name)
+        state = self.gazetteer.states.get(admin_code)
+        return (state['state_name'], admin_code) if state else (None, None)
+
+    def find_city(self, city_name, country_code, admin_code=None):
+        """
+        Look in the state if one is given, otherwise anywhere in the country.
+        Like the graph's exact match, an alias learned in another state is
+        not a match: 'Washington' in Texas is not Washington, D.C.
+
+        Returns:
+            str: The canonical city name, or None if not an alias.
+        """
+        return self._get('city', city_scope(country_code, admin_code), city_name)
+
+    def canonicalize(self, city, state, country):
+        """
+        Replace whichever of the three fields are known aliases with their
+        canonical names. A city alias learned anywhere in the country is used
+        here, since the joint resolver still scores the state it ends up in.
+
+        Returns:
+            tuple: (city, state, country)
+        """
+        iso_code, country_name = self.find_country(country)
+        if not iso_code:
+            iso_code, _ = self.gazetteer.find_country(country)
+        if not iso_code:
+            return city, state, country
+        state_name, admin_code = self.find_state(state, iso_code)
+        city_name = (admin_code and self.find_city(city, iso_code, admin_code)) or self.find_city(city, iso_code)
+        return city_name or city, state_name or state, country_name or country
+
+    def alias_rows(self, anomaly_data, cleaned_data):
+        """
+        The aliases a resolved anomaly implies: its inputs as aliases of what
+        they were resolved to. Only resolutions to a known country (and, for
+        the state and city, a known state or city of it) count. Confirming
+        the city takes up to two graph queries, so the rows are stored with
+        the resolution (see AnomalyStore.put) and replayed from there.
+
+        Returns:
+            list: alias_row() dicts.
+        """
+        iso_code, _ = self.gazetteer.find_country(cleaned_data.get('country'))
+        if not iso_code:
+            return []
+        rows = [alias_row('country', '', anomaly_data['country_input'], iso_code)]
+        state_name, admin_code = self.gazetteer.find_state(cleaned_data.get('state'), iso_code)
+        if admin_code:
+            rows.append(alias_row('state', iso_code, anomaly_data['state_input'], admin_code))
+        if cleaned_data.get('city'):
+            # A city alias is an exact, fully trusted match later, so only learn
+            # it for a city the graph knows: under the state, and under the
+            # country for inputs without a usable state
+            graph = get_graph_backend()
+            city_name = graph.find_city(cleaned_data['city'], iso_code, admin_code) if admin_code else None
+            scopes = (city_scope(iso_code, admin_code), city_scope(iso_code)) if city_name else (city_scope(iso_code),)
+            city_name = city_name or graph.find_city(cleaned_data['city'], iso_code)
+            if city_name:
+                for scope in dict.fromkeys(scopes):
+                    rows.append(alias_row('city', scope, anomaly_data['city_input'], city_name))
+        return rows
+
+    def learn(self, anomaly_data, cleaned_data, rows=None):
+        """
+        Record the inputs of a resolved anomaly as aliases of what they were
+        resolved to.
+
+        Args:
+            rows (list): The resolution's alias_rows(), if already known.
+
+        Returns:
+            list: The new alias rows, for persisting to the graph.
+        """
+        if rows is None:
+            rows = self.alias_rows(anomaly_data, cleaned_data)
+        added = self.add(rows)
+        for row in added:
+            ALIASES_LEARNED.inc(kind=row['kind'])
+        self.learned += len(added)
+        return added
+
+    def refresh(self, force=False):
+        """
+        Learn from resolutions added to the anomaly store since the last
+        refresh. Their alias rows are stored with them, so this costs no graph
+        queries except for resolutions stored without them (by an older
+        version, or imported), whose rows are worked out once and saved.
+        """
+        if self.anomaly_store is None:
+            return
+        with self.lock:
+            if not force and time.monotonic() - self.refreshed_at < ALIAS_REFRESH_INTERVAL:
+                return
+            self.refreshed_at = time.monotonic()
+        try:
+            for position, anomaly_data, cleaned_data, rows in self.anomaly_store.resolutions(after=self.store_position):
+                if rows is None:
+                    rows = self.alias_rows(anomaly_data, cleaned_data)
+                    self.anomaly_store.set_aliases(anomaly_data, rows)
+                self.learn(anomaly_data, cleaned_data, rows)
+                self.store_position = max(self.store_position, position)
+        except Exception:
+            logger.warning("Could not read resolutions from the anomaly store", exc_info=True)
+
+    def stats(self):
+        with self.lock:
+            size = sum(len(targets) for targets in self.aliases.values())
+        return {
+            'size': size,
+            'learned': self.learned,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+_alias_index = None
+_lock = threading.Lock()
+
+
+def get_alias_index():
+    """
+    Return the process-wide alias index, building it on first use.
+    """
+    global _alias_index
+    with _lock:
+        if _alias_index is None:
+            _alias_index = AliasIndex(graph=get_graph_backend(), anomaly_store=get_anomaly_store())
+        return _alias_index
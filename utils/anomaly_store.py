@@ -0,0 +1,279 @@
+# utils/anomaly_store.py
+
+import os
+import json
+import time
+import atexit
+import sqlite3
+import argparse
+import threading
+from .paths import TEMP_UPDATES_DIR
+from .result_cache import normalize_key
+from .log import get_logger
+
+logger = get_logger('anomaly_store')
+
+# How often (seconds) the hit counts buffered in memory are written to the store
+HIT_FLUSH_INTERVAL = float(os.getenv("JANITOR_ANOMALY_HIT_FLUSH_INTERVAL", "10"))
+ANOMALY_STORE_PATH = os.getenv("JANITOR_ANOMALY_STORE_PATH", os.path.join(TEMP_UPDATES_DIR, 'anomaly_store.sqlite3'))
+
+
+def anomaly_key(anomaly_data):
+    """
+    Normalized identity of an anomaly, shared by the store and the update queue.
+    """
+    return normalize_key(anomaly_data['city_input'], anomaly_data['state_input'], anomaly_data['country_input'])
+
+
+def _dumps(aliases):
+    return None if aliases is None else json.dumps(aliases)
+
+
+def _loads(aliases):
+    return None if aliases is None else json.loads(aliases)
+
+
+class AnomalyStore:
+    """
+    Durable map of anomalous address inputs to the cleaned data CeeyMore
+    resolved them to, so each distinct anomaly costs at most one LLM call.
+
+    Hits are counted in memory and added to hit_count in one transaction at
+    most every `hit_flush_interval` seconds, so a lookup doesn't cost a write.
+    """
+
+    def __init__(self, path=ANOMALY_STORE_PATH, hit_flush_interval=HIT_FLUSH_INTERVAL):
+        self.path = path
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.hit_flush_interval = hit_flush_interval
+        self.pending_hits = {}     # key -> hits not yet added to hit_count
+        self.hits_lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS anomaly_resolutions (
+                    key TEXT PRIMARY KEY,
+                    city_input TEXT,
+                    state_input TEXT,
+                    country_input TEXT,
+                    cleaned_data TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    hit_count INTEGER NOT NULL DEFAULT 0,
+                    aliases TEXT
+                )
+            """)
+            # Stores written before the aliases column was added
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(anomaly_resolutions)")}
+            if 'aliases' not in columns:
+                conn.execute("ALTER TABLE anomaly_resolutions ADD COLUMN aliases TEXT")
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, anomaly_data):
+        """
+        Return the stored cleaned data for an anomaly, or None if it hasn't been resolved before.
+        """
+        key = anomaly_key(anomaly_data)
+        conn = self._connection()
+        row = conn.execute("SELECT cleaned_data FROM anomaly_resolutions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        with self.hits_lock:
+            self.hits += 1
+            self.pending_hits[key] = self.pending_hits.get(key, 0) + 1
+            flush = time.monotonic() - self.flushed_at >= self.hit_flush_interval
+        if flush:
+            self.flush_hits()
+        return json.loads(row[0])
+
+    def flush_hits(self):
+        """
+        Add the hits counted since the last flush to hit_count.
+        """
+        with self.hits_lock:
+            pending, self.pending_hits = self.pending_hits, {}
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return
+        conn = self._connection()
+        try:
+            with conn:
+                conn.executemany("UPDATE anomaly_resolutions SET hit_count = hit_count + ? WHERE key = ?",
+                                 [(count, key) for key, count in pending.items()])
+        except sqlite3.Error:
+            logger.warning("Could not write %d anomaly hit counts", len(pending), exc_info=True)
+
+    def put(self, anomaly_data, cleaned_data, aliases=None):
+        """
+        Store the cleaned data for an anomaly, replacing any previous resolution.
+
+        Args:
+            anomaly_data (dict): The anomalous inputs.
+            cleaned_data (dict): What they were resolved to.
+            aliases (list): The alias rows the resolution implies (see
+                AliasIndex.alias_rows), so replaying it needs no graph
+                queries; None if they aren't known yet.
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO anomaly_resolutions
+                    (key, city_input, state_input, country_input, cleaned_data, created_at, aliases)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                anomaly_key(anomaly_data),
+                anomaly_data['city_input'],
+                anomaly_data['state_input'],
+                anomaly_data['country_input'],
+                json.dumps(cleaned_data),
+                time.time(),
+                _dumps(aliases)
+            ))
+
+    def set_aliases(self, anomaly_data, aliases):
+        """
+        Record the alias rows of a resolution stored without them.
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute("UPDATE anomaly_resolutions SET aliases = ? WHERE key = ?",
+                         (_dumps(aliases), anomaly_key(anomaly_data)))
+
+    def resolutions(self, after=0):
+        """
+        Yield resolutions in the order they were stored, starting after the
+        given position.
+
+        Yields:
+            tuple: (position, anomaly_data, cleaned_data, aliases), where
+            aliases is None for resolutions stored without them.
+        """
+        rows = self._connection().execute("""
+            SELECT rowid, city_input, state_input, country_input, cleaned_data, aliases
+            FROM anomaly_resolutions WHERE rowid > ? ORDER BY rowid
+        """, (after,)).fetchall()
+        for rowid, city_input, state_input, country_input, cleaned_data, aliases in rows:
+            anomaly_data = {
+                'city_input': city_input,
+                'state_input': state_input,
+                'country_input': country_input
+            }
+            yield rowid, anomaly_data, json.loads(cleaned_data), _loads(aliases)
+
+    def export(self, path):
+        """
+        Write every stored resolution to a JSON Lines file.
+
+        Returns:
+            int: Number of resolutions exported.
+        """
+        count = 0
+        rows = self._connection().execute("""
+            SELECT city_input, state_input, country_input, cleaned_data, created_at, aliases
+            FROM anomaly_resolutions ORDER BY created_at
+        """)
+        with open(path, 'w', encoding='utf-8') as f:
+            for city_input, state_input, country_input, cleaned_data, created_at, aliases in rows:
+                f.write(json.dumps({
+                    'anomaly_data': {
+                        'city_input': city_input,
+                        'state_input': state_input,
+                        'country_input': country_input
+                    },
+                    'cleaned_data': json.loads(cleaned_data),
+                    'created_at': created_at,
+                    'aliases': _loads(aliases)
+                }, ensure_ascii=False) + '\n')
+                count += 1
+        return count
+
+    def import_(self, path, overwrite=False):
+        """
+        Load resolutions from a JSON Lines file written by export.
+
+        Args:
+            path (str): File to read.
+            overwrite (bool): Replace resolutions that already exist locally.
+
+        Returns:
+            int: Number of resolutions imported.
+        """
+        verb = 'INSERT OR REPLACE' if overwrite else 'INSERT OR IGNORE'
+        count = 0
+        conn = self._connection()
+        with open(path, 'r', encoding='utf-8') as f, conn:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                anomaly_data = entry['anomaly_data']
+                cursor = conn.execute(f"""
+                    {verb} INTO anomaly_resolutions
+                        (key, city_input, state_input, country_input, cleaned_data, created_at, aliases)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    anomaly_key(anomaly_data),
+                    anomaly_data['city_input'],
+                    anomaly_data['state_input'],
+                    anomaly_data['country_input'],
+                    json.dumps(entry['cleaned_data']),
+                    entry.get('created_at', time.time()),
+                    _dumps(entry.get('aliases'))
+                ))
+                count += cursor.rowcount
+        return count
+
+    def stats(self):
+        size = self._connection().execute("SELECT COUNT(*) FROM anomaly_resolutions").fetchone()[0]
+        return {
+            'path': self.path,
+            'size': size,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+_anomaly_store = None
+
+
+def get_anomaly_store():
+    """
+    Return the process-wide anomaly store, opening it on first use.
+    """
+    global _anomaly_store
+    if _anomaly_store is None:
+        _anomaly_store = AnomalyStore()
+        atexit.register(_anomaly_store.flush_hits)
+    return _anomaly_store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import the CeeyMore anomaly resolution store.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help="Write the store to a JSONL file.")
+    export_parser.add_argument('path')
+    import_parser = subparsers.add_parser('import', help="Load a JSONL file written by export.")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--overwrite', action='store_true', help="Replace existing resolutions.")
+    args = parser.parse_args(argv)
+
+    store = get_anomaly_store()
+    if args.command == 'export':
+        print(f"Exported {store.export(args.path)} resolutions to {args.path}")
+    else:
+        print(f"Imported {store.import_(args.path, overwrite=args.overwrite)} resolutions from {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+# utils/bulk_clean.py
+
+import os
+import io
+import sys
+import csv
+import json
+import argparse
+from itertools import islice
+from .address_cleaner import clean_address_batch, is_address
+from .log import get_logger
+
+logger = get_logger('bulk_clean')
+
+DEFAULT_CHUNK_SIZE = 500
+CLEANED_FIELDS = ['corrected_city', 'corrected_state', 'corrected_country', 'country_code']
+
+
+def read_csv_rows(lines):
+    """
+    Yield address rows from CSV text with a header containing city, state and country.
+    """
+    for row in csv.DictReader(lines):
+        yield row
+
+
+def read_jsonl_rows(lines):
+    """
+    Yield address rows from JSON Lines text, skipping blank lines and lines
+    that aren't address objects.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as jde:
+            logger.warning("Skipping malformed JSONL line %d: %s", line_number, jde)
+            continue
+        if not is_address(row):
+            logger.warning("Skipping JSONL line %d: expected a {city, state, country} object with string fields", line_number)
+            continue
+        yield row
+
+
+READERS = {'csv': read_csv_rows, 'jsonl': read_jsonl_rows}
+
+
+def chunked(iterable, size):
+    """
+    Yield lists of at most `size` items from an iterable without materializing it.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def clean_rows(rows, chunk_size=DEFAULT_CHUNK_SIZE, flag_anomalies=False):
+    """
+    Clean a stream of address rows in fixed-size chunks.
+
+    Only one chunk is held in memory at a time, and each chunk is resolved with
+    the batched graph lookups of clean_address_batch.
+
+    Args:
+        rows (iterable): Dicts with 'city', 'state' and 'country' keys.
+        chunk_size (int): Number of rows resolved per batch.
+        flag_anomalies (bool): Add 'anomaly' and per-field '<field>_confidence'
+            fields to every output row.
+
+    Yields:
+        dict: The input row extended with the corrected fields.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    for chunk in chunked(rows, chunk_size):
+        for row, cleaned_address in zip(chunk, clean_address_batch(chunk)):
+            cleaned_row = dict(row)
+            for field in CLEANED_FIELDS:
+                cleaned_row[field] = cleaned_address[field]
+            if flag_anomalies:
+                cleaned_row['anomaly'] = cleaned_address['anomaly']
+                for field, score in cleaned_address['confidence'].items():
+                    cleaned_row[f'{field}_confidence'] = score
+            yield cleaned_row
+
+
+def write_csv(rows):
+    """
+    Yield CSV text for cleaned rows, using the first row's keys as the header.
+    """
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row.keys()), extrasaction='ignore')
+            writer.writeheader()
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def write_jsonl(rows):
+    """
+    Yield JSON Lines text for cleaned rows.
+    """
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl}
+
+
+def infer_format(path, default='csv'):
+    """
+    Infer 'csv' or 'jsonl' from a file extension.
+    """
+    extension = os.path.splitext(path or '')[1].lower()
+    if extension in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    if extension == '.csv':
+        return 'csv'
+    return default
+
+
+def clean_stream(lines, input_format='csv', output_format=None, chunk_size=DEFAULT_CHUNK_SIZE, flag_anomalies=False):
+    """
+    Read CSV/JSONL text lines, clean them chunk by chunk and yield output text.
+    """
+    rows = READERS[input_format](lines)
+    cleaned_rows = clean_rows(rows, chunk_size=chunk_size, flag_anomalies=flag_anomalies)
+    return WRITERS[output_format or input_format](cleaned_rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean a CSV or JSONL file of addresses in bounded memory.")
+    parser.add_argument('input', help="Input file path, or '-' for stdin.")
+    parser.add_argument('-o', '--output', default='-', help="Output file path, or '-' for stdout (default).")
+    parser.add_argument('--input-format', choices=sorted(READERS), help="Defaults to the input file extension.")
+    parser.add_argument('--output-format', choices=sorted(WRITERS), help="Defaults to the output file extension, then the input format.")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Rows resolved per batch.")
+    parser.add_argument('--flag-anomalies', action='store_true', help="Add 'anomaly' and per-field confidence columns to every row.")
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    input_format = args.input_format or infer_format(args.input)
+    output_format = args.output_format or infer_format(args.output, default=input_format)
+
+    source = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        for text in clean_stream(source, input_format, output_format, args.chunk_size, args.flag_anomalies):
+            target.write(text)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,35 +3,405 @@
 import os
 import json
 import re
-from openai import OpenAI
-from neo4j import GraphDatabase
+import asyncio
 import tempfile
+import threading
+from contextlib import ExitStack
+from .paths import TEMP_UPDATES_DIR
+from .graph_driver import get_driver
+from .graph_backend import GRAPH_BACKEND, get_graph_backend
+from .alias_index import get_alias_index
+from .anomaly_store import get_anomaly_store, anomaly_key
+from .update_worker import get_update_worker
+from .singleflight import SingleFlight, AsyncSingleFlight, file_lock, async_file_lock
+from .llm_batcher import AnomalyBatcher, LLM_BATCH_SIZE
+from .llm_client import get_llm, LLM_UPDATE_TIMEOUT
+from .metrics import LLM_DURATION, record_llm_usage
+from .code_patch import outline, parse_patch, apply_patch, PatchError
+from .fuzzy import normalize
+from .log import get_logger
+
+logger = get_logger('ceeymore')
+
+# How generate_code_updates asks for code changes: 'patch' sends an outline of
+# address_cleaner.py with only the relevant functions in full and gets back the
+# changed functions; 'full' sends the whole file and gets the whole file back
+CODE_UPDATE_MODE = os.getenv("JANITOR_CODE_UPDATE_MODE", "patch").lower()
+# Knowledge graph update code beyond this many characters is cut from the code update prompt
+PROMPT_KG_CODE_CHARS = int(os.getenv("JANITOR_PROMPT_KG_CODE_CHARS", "6000"))
+
+# Prompts for the update generation calls. The static instructions live in the
+# system prompts, built once here; the per-anomaly user prompts only carry the
+# anomaly, the cleaned data and the code.
+
+_CODE_UPDATE_CONTEXT = (
+    "You are an AI assistant specialized in enhancing a data cleaner's script called 'address_cleaner.py' a.k.a Janitor's python code that uses a neo4j graph for reference to help it clean data. "
+    "When the janitor encounters a data anomaly that it cannot handle, it asks another agent to upgrade it's knowledge graph and to make it famaliar with that anomaly and then It asks you to update it's code to leverage the changes made freshly in the knowledge graph to handdle similar anomalies in the future. "
+    "You will be given the anomalous instance of data, the corrected instance of data along with the code that updated the knowledge graph and the code of the janitor. Your task is to update the janitor's code in a way that it can handle similar types of anomalies (not just that specific instance) in the future. "
+    "Example: Let's say that the user enter the coordinates of the city in the city field, the graph updater would add coordinates of all cities and send that code to you. You will then create a new method and update the logic of the janitor such that it is able to leverage the freshly updated data to infer other city names if coordinates are provided without relying on the generative logic."
+)
 
-# Initialize the OpenAI client
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
+CODE_UPDATE_SYSTEM_PROMPT = _CODE_UPDATE_CONTEXT + (
+    "\n\nProvide the entire updated 'address_cleaner.py' file, make required changes to the existing methods "
+    "and add new methods if necessary but output the entire ready to use file."
 )
 
+CODE_PATCH_SYSTEM_PROMPT = _CODE_UPDATE_CONTEXT + """
+
+You are shown an outline of 'address_cleaner.py': its imports and settings, the signature and summary of every function, and the full source of the functions relevant to this anomaly.
+Answer with only the functions you change or add, as a JSON object and nothing else:
+{
+    "imports": ["import statements to add, if any"],
+    "functions": [
+        {"name": "function_name", "source": "the complete new source of the top-level function"}
+    ]
+}
+- A function whose name already exists replaces it, keeping its decorators if you leave them out; any other name is added to the module.
+- Give each function's complete source, never a fragment or a diff, and keep the signatures of existing functions compatible with their callers.
+- Do not remove functions. If no code change is needed, answer {"imports": [], "functions": []}."""
+
+KG_UPDATE_SYSTEM_PROMPT = """You are an AI assistant specialized in enhancing a Neo4j knowledge graph to improve data validation and anomaly resolution. The graph that you enhance is used by our address cleaning system called janitor which uses the graph to handle anomalous data entered by user. When the janitor cannot handle an anomaly, it asks you to update it's graph and gives you any relevant information. Your goal is to help the Janitor system resolve address anomalies by ensuring the knowledge graph contains all necessary data and relationships to deal with similar anomaly in the future. Add the data and relationships in the knowledge graph such that similar category of anomalous data can be cleaned just using the knowledge graph without relying on you.
+
+You will be given the anomalous data provided by the user and the cleaned data inferred by the system.
+
+Task:
+1. Analyze the differences between the anomalous data and the cleaned data.
+2. Determine what additional data or relationships should be added to the knowledge graph to map the anomalous input to the correct data.
+3. Generate Python code that:
+- Fetches the necessary data for that anomaly category (that helps deal with similar anomalies in the future) from a real external source (e.g., APIs, dont use placeholders for APIs, you have to decide which API to use) to add to the knowledge graph.
+- Updates the knowledge graph by adding nodes and relationships that enable mapping from anomalous data to the correct data.
+- Ensures that the knowledge graph can be queried using different instances of similar type of anomalous data to retrieve the corrected fields.
+4. Generalize the solution to handle various types of anomalies from the received anomaly class, not just this specific case. For example, if the user enters coordinates of a city in place of city
+   then fetch the coordinates of all cities and add them to the graph with a 'belongs to' relationship with their corresponding cities so that the janitor can
+   use the graph to resolve similar anomalies with various different coordinates in future and not just the coordinate received in the
+   current anomaly. You task would be in this case to add data for all the coordinates and not just the given coordinate (but remember this just an example).
+
+Important Notes:
+- The knowledge graph uses nodes like `City`, `State`, `Country`, etc., and relationships such as `IN_STATE`, `IN_COUNTRY`.
+- The code should add enough data and relationships to the graph to handle similar anomalies in future.
+- Think step by step.
+- Use the following connection details to interact with the Neo4j database:
+
+Neo4j Connection Details:
+```python
+import os
+from neo4j import GraphDatabase
+
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USER = os.getenv("NEO4J_USER")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+
+driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+```
+
+Use the above connection details to interact with the Neo4j database.
+Write nodes and relationships in batches rather than one `session.run(MERGE ...)` per row:
+`from utils.kg_loader import BatchWriter`, then `BatchWriter(driver).write(query, rows)` runs
+`query` (Cypher that follows `UNWIND $rows AS row`) over a list of dicts in chunked transactions.
+Cities are keyed by `city_id` (`admin1_code + '|' + city_name`), states by `admin1_code` and
+countries by `iso_code`. Exact lookups match on a `name_key` property, so set `name_key` on every
+City, State or Country node you create to `normalize(name)` (`from utils.fuzzy import normalize`).
+Once the graph has been updated, call `bump_graph_version()` (import it with
+`from utils.result_cache import bump_graph_version`) so cached cleaning results are invalidated.
+The script is run from the repository root as `python -m temp_updates.kg_update`, which is what
+makes `utils` importable; start it with a comment saying so and guard the entry point with
+`if __name__ == "__main__":`."""
+
+_ANOMALY_PROMPT = """The following address data caused an anomaly in the system:
+- City: '{city_input}'
+- State: '{state_input}'
+- Country: '{country_input}'
+
+The cleaned data is:
+- City: '{city_cleaned}'
+- State: '{state_cleaned}'
+- Country: '{country_cleaned}'
+"""
+
+KG_UPDATE_PROMPT = _ANOMALY_PROMPT
+
+CODE_UPDATE_PROMPT = _ANOMALY_PROMPT + """
+Here is the current code for address_cleaner.py:
+```python
+{code}
+```
+
+Additionally, the knowledge graph was updated with the following code:
+```python
+{kg_code}
+```
+"""
+
+# The stage functions each anomalous field goes through, single and batch
+_FIELD_FUNCTIONS = {
+    'country': ('get_country_code', 'get_country_codes'),
+    'state': ('validate_state', 'validate_states'),
+    'city': ('validate_city', 'validate_cities'),
+}
+
+
+def _relevant_functions(anomaly_data, cleaned_data):
+    """
+    The address_cleaner functions a code update for this anomaly is likely to
+    touch: the per-address lookup plus the stages of the fields the LLM had
+    to correct (all of them if the inputs only differ in formatting).
+    """
+    fields = [field for field in _FIELD_FUNCTIONS
+              if normalize(anomaly_data[f'{field}_input']) != normalize(cleaned_data.get(field) or '')]
+    functions = {'_lookup_address'}
+    for field in fields or _FIELD_FUNCTIONS:
+        functions.update(_FIELD_FUNCTIONS[field])
+    return functions
+
+
+def _prompt_fields(anomaly_data, cleaned_data):
+    """
+    The anomaly's inputs and the cleaned fields, for the update prompt
+    templates; the LLM's answer may lack a field.
+    """
+    return {
+        **anomaly_data,
+        **{f'{field}_cleaned': cleaned_data.get(field) or '' for field in _FIELD_FUNCTIONS},
+    }
+
+
+def _truncate(text, limit):
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"\n# ... {len(text) - limit} more characters not shown"
+
+# The OpenAI client is created on first use (see get_client); assign a client
+# here to replace it, e.g. with a stub
+client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Return the process-wide OpenAI client, creating it on first use.
+    """
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                # Importing openai is slow, so workers that never escalate don't pay for it
+                from openai import OpenAI
+                # Retries and timeouts are handled by llm_client, not the SDK
+                client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    max_retries=0,
+                )
+    return client
+
+# The AsyncOpenAI client used by the async request path (see asgi.py); like
+# `client`, assign one here to replace it
+async_client = None
+
+def get_async_client():
+    """
+    Return the process-wide AsyncOpenAI client, creating it on first use.
+    """
+    global async_client
+    if async_client is None:
+        with _client_lock:
+            if async_client is None:
+                from openai import AsyncOpenAI
+                async_client = AsyncOpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    max_retries=0,
+                )
+    return async_client
+
+# Concurrent requests for the same anomaly within this process share one resolution
+anomaly_flights = SingleFlight()
+async_anomaly_flights = AsyncSingleFlight()
+
+_batcher = None
+
+def get_batcher():
+    """
+    Return the process-wide anomaly batcher, or None when JANITOR_LLM_BATCH_SIZE <= 1.
+    """
+    global _batcher
+    if _batcher is None and LLM_BATCH_SIZE > 1:
+        _batcher = AnomalyBatcher(get_client(), fallback=lambda anomaly_data: CeeyMore().analyze_and_clean_data(anomaly_data))
+    return _batcher
+
 class CeeyMore:
     def __init__(self):
-        self.neo4j_uri = os.getenv("NEO4J_URI")
-        self.neo4j_user = os.getenv("NEO4J_USER")
-        self.neo4j_password = os.getenv("NEO4J_PASSWORD")
-        self.driver = GraphDatabase.driver(self.neo4j_uri, auth=(self.neo4j_user, self.neo4j_password))
+        # Reuse the process-wide pooled driver rather than opening one per instance
+        self.driver = get_driver() if GRAPH_BACKEND == 'neo4j' else None
+        self.anomaly_store = get_anomaly_store()
 
     def handle_anomaly(self, anomaly_data):
-        # Step 1: Use LLM to analyze the data and determine how to clean it
-        cleaned_data = self.analyze_and_clean_data(anomaly_data)
-        if not cleaned_data:
-            print("LLM could not clean the data")
-            return None
+        # Step 0: Reuse a previous resolution of the same anomaly; its updates were already generated
+        cleaned_data = self.anomaly_store.get(anomaly_data)
+        if cleaned_data:
+            return cleaned_data
+
+        # Identical anomalies in flight in this worker wait on the same resolution
+        key = anomaly_key(anomaly_data)
+        return anomaly_flights.do(key, self._resolve_anomaly, key, anomaly_data)
+
+    def _resolve_anomaly(self, key, anomaly_data):
+        # Other workers resolving the same anomaly wait on the lock file, then find
+        # the result in the anomaly store instead of calling the LLM again
+        with file_lock(f"anomaly:{key}"):
+            cleaned_data = self.anomaly_store.get(anomaly_data)
+            if cleaned_data:
+                return cleaned_data
+
+            # Step 1: Use LLM to analyze the data and determine how to clean it,
+            # sharing a completion with other pending anomalies when batching is on
+            batcher = get_batcher()
+            if batcher:
+                cleaned_data = batcher.submit(anomaly_data).result()
+            else:
+                cleaned_data = self.analyze_and_clean_data(anomaly_data)
+            if not cleaned_data:
+                logger.warning("LLM could not clean the data for %s", anomaly_data)
+                return None
+            self.remember(key, anomaly_data, cleaned_data)
 
-        # Step 2: Generate code updates and knowledge graph updates
-        self.generate_updates(anomaly_data, cleaned_data)
+        return cleaned_data
+
+    def remember(self, key, anomaly_data, cleaned_data):
+        # The alias rows are stored with the resolution so other workers replay
+        # them without querying the graph
+        try:
+            rows = get_alias_index().alias_rows(anomaly_data, cleaned_data)
+        except Exception:
+            logger.warning("Could not work out the aliases for %s", anomaly_data, exc_info=True)
+            rows = None
+        self.anomaly_store.put(anomaly_data, cleaned_data, aliases=rows)
+        if rows is not None:
+            self.learn_aliases(key, anomaly_data, cleaned_data, rows)
+        # Step 2: Generate code updates and knowledge graph updates in the background;
+        # only the cleaned data is needed to answer the request
+        get_update_worker().submit(key, self.generate_updates, anomaly_data, cleaned_data)
+
+    async def handle_anomaly_async(self, anomaly_data):
+        """
+        handle_anomaly for the async request path: the LLM call is awaited
+        rather than holding a thread, and SQLite access runs on a worker thread.
+        """
+        cleaned_data = await asyncio.to_thread(self.anomaly_store.get, anomaly_data)
+        if cleaned_data:
+            return cleaned_data
+
+        key = anomaly_key(anomaly_data)
+        return await async_anomaly_flights.do(key, self._resolve_anomaly_async, key, anomaly_data)
+
+    async def _resolve_anomaly_async(self, key, anomaly_data):
+        async with async_file_lock(f"anomaly:{key}"):
+            cleaned_data = await asyncio.to_thread(self.anomaly_store.get, anomaly_data)
+            if cleaned_data:
+                return cleaned_data
+
+            batcher = get_batcher()
+            if batcher:
+                cleaned_data = await asyncio.wrap_future(batcher.submit(anomaly_data))
+            else:
+                cleaned_data = await self.analyze_and_clean_data_async(anomaly_data)
+            if not cleaned_data:
+                logger.warning("LLM could not clean the data for %s", anomaly_data)
+                return None
+            await asyncio.to_thread(self.remember, key, anomaly_data, cleaned_data)
 
         return cleaned_data
 
-    def analyze_and_clean_data(self, anomaly_data):
+    async def handle_anomalies_async(self, anomalies):
+        """
+        handle_anomalies for the async request path. With batching on, the
+        concurrent resolutions share completions through the batcher.
+
+        Returns:
+            list: Cleaned data (or None) for each anomaly, in order.
+        """
+        distinct = {anomaly_key(anomaly_data): anomaly_data for anomaly_data in anomalies}
+        results = await asyncio.gather(*(self.handle_anomaly_async(anomaly_data) for anomaly_data in distinct.values()))
+        resolved = dict(zip(distinct, results))
+        return [resolved[anomaly_key(anomaly_data)] for anomaly_data in anomalies]
+
+    def learn_aliases(self, key, anomaly_data, cleaned_data, rows=None):
+        # Later inputs using the same variants resolve from the alias index instead
+        # of the LLM; the graph copy is written in the background for other hosts
+        rows = get_alias_index().learn(anomaly_data, cleaned_data, rows)
+        if rows:
+            get_update_worker().submit(f"alias:{key}", get_graph_backend().add_aliases, rows)
+
+    def handle_anomalies(self, anomalies):
+        """
+        Handle a group of anomalies, resolving each distinct input only once.
+
+        Returns:
+            list: Cleaned data (or None) for each anomaly, in order.
+        """
+        # With batching on, resolve every new anomaly in the group with as few
+        # completions as possible
+        resolved = {}
+        pending = {}
+        batcher = get_batcher()
+        if batcher:
+            for anomaly_data in anomalies:
+                key = anomaly_key(anomaly_data)
+                if key in resolved or key in pending:
+                    continue
+                cleaned_data = self.anomaly_store.get(anomaly_data)
+                if cleaned_data:
+                    resolved[key] = cleaned_data
+                else:
+                    pending[key] = anomaly_data
+            if len(pending) > 1:
+                resolved.update(self._resolve_batch(batcher, pending))
+
+        for anomaly_data in anomalies:
+            key = anomaly_key(anomaly_data)
+            if key in resolved:
+                continue
+            if key in pending:
+                # Already looked up in the store above
+                resolved[key] = anomaly_flights.do(key, self._resolve_anomaly, key, anomaly_data)
+            else:
+                resolved[key] = self.handle_anomaly(anomaly_data)
+        return [resolved[anomaly_key(anomaly_data)] for anomaly_data in anomalies]
+
+    def _resolve_batch(self, batcher, pending):
+        """
+        Resolve several new anomalies through the batcher, one completion's
+        worth (max_batch) at a time. Each chunk's anomaly locks are held
+        like _resolve_anomaly's, so other workers wait for the result instead
+        of paying for the same call, and released once the chunk is resolved.
+
+        Args:
+            pending (dict): anomaly_key -> anomaly data.
+
+        Returns:
+            dict: anomaly_key -> cleaned data (or None) for every pending anomaly.
+        """
+        resolved = {}
+        # Always taken in the same order, so workers with overlapping groups can't deadlock
+        keys = sorted(pending)
+        for start in range(0, len(keys), batcher.max_batch):
+            chunk = keys[start:start + batcher.max_batch]
+            with ExitStack() as stack:
+                for key in chunk:
+                    stack.enter_context(file_lock(f"anomaly:{key}"))
+                new = {}
+                for key in chunk:
+                    cleaned_data = self.anomaly_store.get(pending[key])
+                    if cleaned_data:
+                        resolved[key] = cleaned_data
+                    else:
+                        new[key] = pending[key]
+                for (key, anomaly_data), cleaned_data in zip(new.items(), batcher.resolve_many(list(new.values()))):
+                    if cleaned_data:
+                        self.remember(key, anomaly_data, cleaned_data)
+                    else:
+                        logger.warning("LLM could not clean the data for %s", anomaly_data)
+                    resolved[key] = cleaned_data
+        return resolved
+
+    def _clean_request(self, anomaly_data):
         # Use LLM to figure out what the user intended
         prompt = f"""
                         You are an AI assistant helping to clean address data.
@@ -55,38 +425,54 @@ class CeeyMore:
                         }}
 
                         """
+        return dict(
+            model="gpt-4o",
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.0,
+            stop=None  # Ensure full response is captured
+        )
 
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0,
-                stop=None  # Ensure full response is captured
-            )
-
-            # Get the response content
-            raw_content = response.choices[0].message.content.strip()
-            print(f"Raw response from OpenAI:\n{raw_content}\n")
-
-            # Try to extract JSON from the response
-            json_data = self.extract_json(raw_content)
-
-            if json_data:
-                try:
-                    cleaned_data = json.loads(json_data)
-                    return cleaned_data
-                except json.JSONDecodeError as jde:
-                    print(f"JSON Decode Error in analyze_and_clean_data: {jde}")
-                    print(f"Extracted JSON: {json_data}")
-                    return None
-            else:
-                print("Could not extract JSON from the response.")
+    def _parse_cleaned(self, response):
+        record_llm_usage('clean', response)
+
+        # Get the response content
+        raw_content = response.choices[0].message.content.strip()
+        logger.debug("Raw response from OpenAI:\n%s", raw_content)
+
+        # Try to extract JSON from the response
+        json_data = self.extract_json(raw_content)
+
+        if json_data:
+            try:
+                cleaned_data = json.loads(json_data)
+                return cleaned_data
+            except json.JSONDecodeError as jde:
+                logger.warning("JSON Decode Error in analyze_and_clean_data: %s", jde)
+                logger.debug("Extracted JSON: %s", json_data)
                 return None
+        else:
+            logger.warning("Could not extract JSON from the response.")
+            return None
+
+    def analyze_and_clean_data(self, anomaly_data):
+        try:
+            with LLM_DURATION.time(operation='clean'):
+                response = get_llm().call('clean', get_client().chat.completions.create, **self._clean_request(anomaly_data))
+            return self._parse_cleaned(response)
+        except Exception as e:
+            logger.error("Error in analyze_and_clean_data: %s", e)
+            return None
 
+    async def analyze_and_clean_data_async(self, anomaly_data):
+        try:
+            with LLM_DURATION.time(operation='clean'):
+                response = await get_llm().call_async('clean', get_async_client().chat.completions.create,
+                                                      **self._clean_request(anomaly_data))
+            return self._parse_cleaned(response)
         except Exception as e:
-            print(f"Error in analyze_and_clean_data: {e}")
+            logger.error("Error in analyze_and_clean_data_async: %s", e)
             return None
 
     def extract_json(self, text):
@@ -100,88 +486,96 @@ class CeeyMore:
             json_str = text[start:end]
             return json_str
         except ValueError as ve:
-            print(f"Error extracting JSON: {ve}")
+            logger.warning("Error extracting JSON: %s", ve)
             return None
 
     def generate_updates(self, anomaly_data, cleaned_data):
+        # Only one worker on the host generates and writes updates at a time
+        with file_lock('temp_updates'):
+            self._generate_updates(anomaly_data, cleaned_data)
+
+    def _generate_updates(self, anomaly_data, cleaned_data):
         # Generate knowledge graph updates as Python code
         kg_code = self.generate_kg_updates(anomaly_data, cleaned_data)
         
          # Generate code updates
         code_changes = self.generate_code_updates(anomaly_data, cleaned_data, kg_code)
 
-        # Write code changes to a temporary file
-        self.write_temp_file('code_update.py', code_changes)
+        # Write code changes to a temporary file; a patch may legitimately change nothing
+        if code_changes:
+            self.write_temp_file('code_update.py', code_changes)
 
         # Write knowledge graph update code to a temporary file
         self.write_temp_file('kg_update.py', kg_code)
         
 
     def generate_code_updates(self, anomaly_data, cleaned_data, kg_code):
-        
+        """
+        Ask the LLM to update address_cleaner.py for the anomaly's class.
+
+        In 'patch' mode (JANITOR_CODE_UPDATE_MODE) the model sees an outline
+        of the module with only the functions relevant to the anomaly in full,
+        and answers with the functions it changes (see utils/code_patch.py),
+        which are applied to the current file here; in 'full' mode it gets the
+        whole file and returns the whole file.
+
+        Returns:
+            str: The updated address_cleaner.py, or "" if there is no usable update.
+        """
         # Read the current address_cleaner.py code
         address_cleaner_path = os.path.join(os.path.dirname(__file__), 'address_cleaner.py')
         try:
             with open(address_cleaner_path, 'r', encoding='utf-8') as f:
                 address_cleaner_code = f.read()
         except Exception as e:
-            print(f"Error reading address_cleaner.py: {e}")
+            logger.error("Error reading address_cleaner.py: %s", e)
             address_cleaner_code = ""
-            
-        system_prompt = (
-            "You are an AI assistant specialized in enhancing a data cleaner's script called 'address_cleaner.py' a.k.a Janitor's python code that uses a neo4j graph for reference to help it clean data"
-            "When the janitor encounters a data anomaly that it cannot handle, it asks another agent to upgrade it's knowledge graph and to make it famaliar with that anomaly and then It asks you to update it's code to leverage the changes made freshly in the knowledge graph to handdle similar anomalies in the future."
-            "You will be given the anomalous instance of data, the corrected instance of data along with the code that updated the knowledge graph and the code of the janitor. Your task is to update the janitor's code in a way that it can handle similar types of anomalies (not just that specific instance) in the future."
-            "Example: Let's say that the user enter the coordinates of the city in the city field, the graph updater would add coordinates of all cities and send that code to you. You will then create a new method and update the logic of the janitor such that it is able to leverage the freshly updated data to infer other city names if coordinates are provided without relying on the generative logic."
+
+        patch_mode = CODE_UPDATE_MODE == 'patch' and address_cleaner_code
+        if patch_mode:
+            system_prompt = CODE_PATCH_SYSTEM_PROMPT
+            code = outline(address_cleaner_code, _relevant_functions(anomaly_data, cleaned_data))
+        else:
+            system_prompt = CODE_UPDATE_SYSTEM_PROMPT
+            code = address_cleaner_code
+        prompt = CODE_UPDATE_PROMPT.format(
+            **_prompt_fields(anomaly_data, cleaned_data),
+            code=code, kg_code=_truncate(kg_code, PROMPT_KG_CODE_CHARS),
         )
-            
-        # Use LLM to suggest code changes
-        prompt = f"""
-                    The following address data caused an anomaly in the system:
-                    - City: '{anomaly_data['city_input']}'
-                    - State: '{anomaly_data['state_input']}'
-                    - Country: '{anomaly_data['country_input']}'
-
-                    The cleaned data is:
-                    - City: '{cleaned_data['city']}'
-                    - State: '{cleaned_data['state']}'
-                    - Country: '{cleaned_data['country']}'
-
-                    Here is the current code for address_cleaner.py:
-
-                    ```python
-                    {address_cleaner_code}
-                    ```
-                    
-                    Additionally, the knowledge graph was updated with the following code:
-                    ```python
-                    {kg_code}
-                    ```
-                    
-                    Provide the entire updated 'address_cleaner.py' file, make required changes to the existing methods and add new methods if necessary but output the entire ready to use file.
-                    """
 
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0,
-                stop=None  # Ensure full response is captured
-            )
+            with LLM_DURATION.time(operation='code_update'):
+                response = get_llm().call(
+                    'code_update', get_client().chat.completions.create, timeout=LLM_UPDATE_TIMEOUT,
+                    model="gpt-4o",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.0,
+                    stop=None  # Ensure full response is captured
+                )
+            record_llm_usage('code_update', response)
 
             raw_content = response.choices[0].message.content.strip()
-            print(f"Raw code_changes response from OpenAI:\n{raw_content}\n")
+            logger.debug("Raw code_changes response from OpenAI:\n%s", raw_content)
 
-            # Attempt to extract code block if present
-            code_changes = self.extract_code(raw_content)
+            if not patch_mode:
+                # Attempt to extract code block if present
+                return self.extract_code(raw_content)
 
-            return code_changes
+            patch = parse_patch(raw_content)
+            if not patch['functions'] and not patch['imports']:
+                logger.info("No code changes suggested for %s", anomaly_data)
+                return ""
+            logger.info("Applying code patch to %s", [function['name'] for function in patch['functions']])
+            return apply_patch(address_cleaner_code, patch)
 
+        except PatchError as e:
+            logger.warning("Rejected code patch in generate_code_updates: %s", e)
+            return ""
         except Exception as e:
-            print(f"Error in generate_code_updates: {e}")
+            logger.error("Error in generate_code_updates: %s", e)
             return ""
 
     def extract_code(self, text):
@@ -208,74 +602,28 @@ class CeeyMore:
         Returns:
             str: The Python code that fetches new data and updates the knowledge graph.
         """
-        # Define the system prompt
-        system_prompt = (
-            "You are an AI assistant specialized in enhancing a Neo4j knowledge graph to improve data validation and anomaly resolution."
-            "The graph that you enhance is used by our address cleaning system called janitor which uses the graph to handle anomalous data entered by user"
-            "When the janitor cannot handle an anomaly, it asks you to update it's graph and gives you any relevant information"
-            "Your goal is to help the Janitor system resolve address anomalies by ensuring the knowledge graph contains all necessary data and relationships to deal with similar anomaly in the future. "
-            "Add the data and relationships in the knowledge graph such that similar category of anomalous data can be cleaned just using the knowledge graph without relying on you."
+        # The task and graph conventions are in the system prompt; only the anomaly varies
+        user_prompt = KG_UPDATE_PROMPT.format(
+            **_prompt_fields(anomaly_data, cleaned_data),
         )
 
-        # Construct the user prompt with enhanced context
-        user_prompt = f"""
-        The Janitor system has detected an address anomaly. Below is the anomalous data provided by the user and the cleaned data inferred by the system:
-        - City: '{anomaly_data['city_input']}'
-        - State: '{anomaly_data['state_input']}'
-        - Country: '{anomaly_data['country_input']}'
-
-        The cleaned data inferred is:
-        - City: '{cleaned_data['city']}'
-        - State: '{cleaned_data['state']}'
-        - Country: '{cleaned_data['country']}'
-
-        Task:
-        1. Analyze the differences between the anomalous data and the cleaned data.
-        2. Determine what additional data or relationships should be added to the knowledge graph to map the anomalous input to the correct data.
-        3. Generate Python code that:
-        - Fetches the necessary data for that anomaly category (that helps deal with similar anomalies in the future) from a real external source (e.g., APIs, dont use placeholders for APIs, you have to decide which API to use) to add to the knowledge graph.
-        - Updates the knowledge graph by adding nodes and relationships that enable mapping from anomalous data to the correct data.
-        - Ensures that the knowledge graph can be queried using different instances of similar type of anomalous data to retrieve the corrected fields.
-        4. Generalize the solution to handle various types of anomalies from the received anomaly class, not just this specific case. For example, if the user enters coordinates of a city in place of city
-           then fetch the coordinates of all cities and add them to the graph with a 'belongs to' relationship with their corresponding cities so that the janitor can 
-           use the graph to resolve similar anomalies with various different coordinates in future and not just the coordinate received in the 
-           current anomaly. You task would be in this case to add data for all the coordinates and not just the given coordinate (but remember this just an example).
-
-        Important Notes:
-        - The knowledge graph uses nodes like `City`, `State`, `Country`, etc., and relationships such as `IN_STATE`, `IN_COUNTRY`.
-        - The code should add enough data and relationships to the graph to handle similar anomalies in future.
-        - Think step by step.
-        - Use the following connection details to interact with the Neo4j database:
-
-         Neo4j Connection Details:
-        ```python
-        import os
-        from neo4j import GraphDatabase
-
-        NEO4J_URI = os.getenv("NEO4J_URI")
-        NEO4J_USER = os.getenv("NEO4J_USER")
-        NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
-
-        driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
-        ```
-        
-        Use the above connection details to interact with the Neo4j database.
-        """
-
         try:
             # Call the OpenAI API with the system prompt
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.0,
-            )
+            with LLM_DURATION.time(operation='kg_update'):
+                response = get_llm().call(
+                    'kg_update', get_client().chat.completions.create, timeout=LLM_UPDATE_TIMEOUT,
+                    model="gpt-4o",
+                    messages=[
+                        {"role": "system", "content": KG_UPDATE_SYSTEM_PROMPT},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    temperature=0.0,
+                )
+            record_llm_usage('kg_update', response)
 
             # Extract and log the raw response from OpenAI for debugging
             raw_content = response.choices[0].message.content.strip()
-            print(f"Raw kg_updates code from OpenAI:\n{raw_content}\n")
+            logger.debug("Raw kg_updates code from OpenAI:\n%s", raw_content)
 
             # Extract the Python code from the response
             kg_code = self.extract_code(raw_content)
@@ -283,22 +631,26 @@ class CeeyMore:
             return kg_code
 
         except Exception as e:
-            print(f"Error in generate_kg_updates: {e}")
+            logger.error("Error in generate_kg_updates: %s", e)
             return ""
-
     
 
     def write_temp_file(self, filename, content):
         if not content:
-            print(f"No content to write for {filename}.")
+            logger.warning("No content to write for %s.", filename)
             return
 
-        temp_dir = os.path.join(os.getcwd(), 'temp_updates')
+        temp_dir = TEMP_UPDATES_DIR
         os.makedirs(temp_dir, exist_ok=True)
         file_path = os.path.join(temp_dir, filename)
-        with open(file_path, 'w', encoding='utf-8') as f:
+        # Write to a temporary file and rename so readers never see a partial file
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=temp_dir, delete=False, suffix='.tmp') as f:
             f.write(content)
-        print(f"Generated {filename} and saved to {file_path}")
+        os.replace(f.name, file_path)
+        logger.info("Generated %s and saved to %s", filename, file_path)
 
     def close(self):
-        self.driver.close()
+        """
+        Kept for compatibility; the shared driver is closed by graph_driver.close_driver.
+        """
+        self.driver = None
@@ -0,0 +1,200 @@
+# utils/code_patch.py
+#
+# Compact views of a module for update prompts, and the structured patches
+# the model answers with, applied and validated locally. Instead of the
+# whole of address_cleaner.py going to the model and back, it sees an
+# outline of every top-level definition plus the source of the functions
+# relevant to the anomaly, and returns only the functions it changes:
+#
+#   {"imports": ["import math"],
+#    "functions": [{"name": "validate_city", "source": "def validate_city(...):\n    ..."}]}
+#
+# A function whose name already exists is replaced in place, keeping its
+# decorators if the patch leaves them out; a new name is added at the end of
+# the module.
+
+import ast
+import json
+
+
+class PatchError(ValueError):
+    """
+    The model's patch is malformed or would break the module.
+    """
+
+
+def _definitions(tree):
+    return {node.name: node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))}
+
+
+def _start(node):
+    """
+    First line of a definition, decorators included.
+    """
+    return node.decorator_list[0].lineno if node.decorator_list else node.lineno
+
+
+def _signature(source, node):
+    """
+    The def line(s) of a function or class, with its decorators and the first
+    line of its docstring.
+    """
+    lines = source.splitlines()
+    header = lines[_start(node) - 1:node.body[0].lineno - 1]
+    docstring = ast.get_docstring(node)
+    indent = ' ' * (node.col_offset + 4)
+    if docstring:
+        header.append(f'{indent}"""{docstring.strip().splitlines()[0]}"""')
+    header.append(f'{indent}...')
+    return '\n'.join(header)
+
+
+def outline(source, relevant=()):
+    """
+    Compact view of a module: its imports and module-level settings, the
+    signature of every top-level function and class, and the full source of
+    the `relevant` ones.
+
+    Args:
+        source (str): The module's source.
+        relevant (iterable): Names of the definitions to include in full.
+
+    Returns:
+        str: The view, in source order.
+    """
+    tree = ast.parse(source)
+    relevant = set(relevant)
+    parts = []
+    statements = False
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.Assign, ast.AnnAssign)):
+            statement = ast.get_source_segment(source, node)
+            # Consecutive statements stay together, definitions are set apart
+            if statements:
+                parts[-1] += '\n' + statement
+            else:
+                parts.append(statement)
+            statements = True
+            continue
+        statements = False
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if node.name in relevant:
+                parts.append('\n'.join(source.splitlines()[_start(node) - 1:node.end_lineno]))
+            else:
+                parts.append(_signature(source, node))
+    return '\n\n'.join(parts)
+
+
+def parse_patch(text):
+    """
+    Parse the model's answer into a patch dict.
+
+    Raises:
+        PatchError: If it isn't a JSON object of the expected shape.
+    """
+    try:
+        start = text.index('{')
+        end = text.rindex('}') + 1
+        patch = json.loads(text[start:end])
+    except ValueError as e:
+        raise PatchError(f"patch is not a JSON object: {e}") from None
+    imports = patch.get('imports', [])
+    functions = patch.get('functions', [])
+    if not isinstance(imports, list) or not all(isinstance(line, str) for line in imports):
+        raise PatchError("'imports' must be a list of strings")
+    if not isinstance(functions, list) or not all(
+        isinstance(function, dict) and isinstance(function.get('name'), str) and isinstance(function.get('source'), str)
+        for function in functions
+    ):
+        raise PatchError("'functions' must be a list of {name, source} objects")
+    return {'imports': imports, 'functions': functions}
+
+
+def _check_function(name, source):
+    """
+    Returns:
+        The patched definition's node.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        raise PatchError(f"'{name}' does not parse: {e}") from None
+    definitions = _definitions(tree)
+    if len(tree.body) != 1 or name not in definitions:
+        raise PatchError(f"'{name}' must be exactly one top-level definition named {name}")
+    return definitions[name]
+
+
+def _decorators(source, node):
+    return [ast.get_source_segment(source, decorator) for decorator in node.decorator_list]
+
+
+def apply_patch(source, patch):
+    """
+    Apply a patch (see parse_patch) to a module's source and validate the
+    result: it must compile, and every top-level definition the module had
+    must still be there.
+
+    Returns:
+        str: The patched source.
+
+    Raises:
+        PatchError: If the patch can't be applied or the result is invalid.
+    """
+    tree = ast.parse(source)
+    existing = _definitions(tree)
+    lines = source.splitlines()
+
+    replacements = []
+    additions = []
+    names = set()
+    for function in patch['functions']:
+        name, code = function['name'], function['source'].strip('\n')
+        if name in names:
+            raise PatchError(f"'{name}' is patched more than once")
+        names.add(name)
+        definition = _check_function(name, code)
+        node = existing.get(name)
+        if node is None:
+            additions.append(code)
+        elif not definition.decorator_list:
+            # Keep the original decorators (e.g. the stage timers) unless the patch restates them
+            replacements.append((node.lineno - 1, node.end_lineno, code))
+        else:
+            lost = set(_decorators(source, node)) - set(_decorators(code, definition))
+            if lost:
+                raise PatchError(f"'{name}' drops its decorators {sorted(lost)}")
+            replacements.append((_start(node) - 1, node.end_lineno, code))
+
+    # After the last top-level import of the original module
+    last_import = max((node.end_lineno for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))), default=0)
+    # Replace bottom-up so earlier line numbers stay valid
+    for start, end, code in sorted(replacements, reverse=True):
+        lines[start:end] = code.splitlines()
+        if end <= last_import:
+            last_import += len(code.splitlines()) - (end - start)
+    for code in additions:
+        lines.extend(['', ''] + code.splitlines())
+
+    new_imports = []
+    for line in patch['imports']:
+        line = line.strip()
+        try:
+            statement = ast.parse(line).body
+        except SyntaxError as e:
+            raise PatchError(f"import '{line}' does not parse: {e}") from None
+        if len(statement) != 1 or not isinstance(statement[0], (ast.Import, ast.ImportFrom)):
+            raise PatchError(f"'{line}' is not an import statement")
+        if line not in lines and line not in new_imports:
+            new_imports.append(line)
+    lines[last_import:last_import] = new_imports
+
+    patched = '\n'.join(lines) + '\n'
+    try:
+        compile(patched, 'address_cleaner.py', 'exec')
+    except SyntaxError as e:
+        raise PatchError(f"patched module does not compile: {e}") from None
+    missing = set(existing) - set(_definitions(ast.parse(patched)))
+    if missing:
+        raise PatchError(f"patched module lost {sorted(missing)}")
+    return patched
@@ -0,0 +1,562 @@
+# utils/compact_gazetteer.py
+#
+# The gazetteer and city reference data compiled into one read-only file that
+# workers mmap instead of parsing import/*.csv into dicts. The page cache holds
+# a single copy shared by every gunicorn worker on the host, opening it costs
+# next to nothing, and lookups are binary searches over sorted key arrays.
+#
+#   python -m utils.compact_gazetteer                  # from import/*.csv
+#   python -m utils.compact_gazetteer --from-neo4j     # cities exported from the graph
+#   python -m utils.compact_gazetteer --stats
+#
+# Layout (all integers little-endian uint32):
+#
+#   header    MAGIC, then (offset, length) in bytes for each of SECTIONS
+#   strings   UTF-8 string table; strings are referenced as (offset, length)
+#   countries (iso_code, country_name) records, sorted by ISO code
+#   states    (admin_code, state_name, ascii_name, iso_code) records, sorted by admin1 code
+#   cities    (city_name, admin_code) records
+#   *_index   (key, record) entries sorted bytewise by key; the keys are
+#             precomputed folded or normalized names, see build()
+
+import os
+import sys
+import mmap
+import struct
+import argparse
+import threading
+from array import array
+from collections.abc import Mapping
+from .gazetteer import Gazetteer, COUNTRIES_CSV, STATES_CSV, GAZETTEER_FILE
+from .fuzzy import FuzzyIndex, ScopedFuzzyIndex, normalize
+from .log import get_logger
+
+logger = get_logger('compact_gazetteer')
+
+MAGIC = b'JNTRGAZ1'
+SEP = '\x1f'
+
+SECTIONS = (
+    'strings', 'countries', 'states', 'cities',
+    'country_index',   # folded name/ISO2/ISO3/FIPS -> country, gazetteer precedence applied
+    'state_index',     # iso_code SEP folded name/admin1 code -> state
+    'country_keys',    # normalized country name -> country
+    'state_keys',      # iso_code SEP normalized state name -> state
+    'city_keys',       # scope SEP normalized city name -> city
+    'city_paths',      # normalized city name SEP record number -> city
+)
+# uint32s per entry
+WIDTHS = {'countries': 4, 'states': 8, 'cities': 4}
+INDEX_WIDTH = 3
+HEADER_SIZE = len(MAGIC) + 8 * len(SECTIONS)
+
+
+def _scope_key(scope):
+    return f"{scope[0]}:{scope[1]}"
+
+###########################################################################################################################
+
+
+class _StringTable:
+    def __init__(self):
+        self.data = bytearray()
+        self.refs = {}
+
+    def ref(self, value):
+        value = value or ''
+        if value not in self.refs:
+            encoded = value.encode('utf-8')
+            self.refs[value] = (len(self.data), len(encoded))
+            self.data += encoded
+        return self.refs[value]
+
+
+def _index_section(strings, entries):
+    """
+    Pack (key, record number) pairs sorted bytewise by key. The first entry
+    wins for a repeated key.
+    """
+    packed = array('I')
+    seen = set()
+    for key, record in sorted(entries, key=lambda entry: entry[0].encode('utf-8')):
+        if key in seen:
+            continue
+        seen.add(key)
+        packed.extend((*strings.ref(key), record))
+    return packed
+
+
+def build(output=GAZETTEER_FILE, countries_path=COUNTRIES_CSV, states_path=STATES_CSV, cities=None):
+    """
+    Compile the reference data into a compact gazetteer file. The file is
+    written next to `output` and renamed over it, so running workers keep
+    the mapping they already have.
+
+    Args:
+        output (str): Path of the file to write.
+        countries_path (str): countries.csv path.
+        states_path (str): states.csv path.
+        cities (list): (city_name, admin1_code) pairs; defaults to the cities CSV.
+
+    Returns:
+        dict: Record counts and the file size in bytes.
+    """
+    if cities is None:
+        from .graph_backend import CITIES_CSV, load_cities
+        cities = load_cities(CITIES_CSV) if os.path.exists(CITIES_CSV) else []
+    gazetteer = Gazetteer(countries_path, states_path)
+    strings = _StringTable()
+
+    iso_codes = sorted(gazetteer.countries)
+    country_number = {iso_code: number for number, iso_code in enumerate(iso_codes)}
+    countries = array('I')
+    for iso_code in iso_codes:
+        countries.extend((*strings.ref(iso_code), *strings.ref(gazetteer.countries[iso_code]['country_name'])))
+
+    admin_codes = sorted(gazetteer.states)
+    state_number = {admin_code: number for number, admin_code in enumerate(admin_codes)}
+    states = array('I')
+    for admin_code in admin_codes:
+        state = gazetteer.states[admin_code]
+        states.extend((*strings.ref(admin_code), *strings.ref(state['state_name']),
+                       *strings.ref(state['ascii_name']), *strings.ref(state['iso_code'])))
+
+    cities = sorted(dict.fromkeys((name, admin_code) for name, admin_code in cities if name and admin_code),
+                    key=lambda city: (city[1], city[0]))
+    city_records = array('I')
+    for city_name, admin_code in cities:
+        city_records.extend((*strings.ref(city_name), *strings.ref(admin_code)))
+
+    city_keys = []
+    city_paths = []
+    for number, (city_name, admin_code) in enumerate(cities):
+        name_key = normalize(city_name)
+        for scope in (('admin', admin_code), ('country', admin_code.partition('.')[0])):
+            city_keys.append((f"{_scope_key(scope)}{SEP}{name_key}", number))
+        city_paths.append((f"{name_key}{SEP}{number:08d}", number))
+
+    sections = {
+        'countries': countries,
+        'states': states,
+        'cities': city_records,
+        'country_index': _index_section(strings, (
+            (key, country_number[iso_code]) for key, iso_code in gazetteer.country_index.items()
+        )),
+        'state_index': _index_section(strings, (
+            (f"{iso_code}{SEP}{key}", state_number[admin_code])
+            for iso_code, index in gazetteer.state_index.items() for key, admin_code in index.items()
+        )),
+        'country_keys': _index_section(strings, (
+            (normalize(gazetteer.countries[iso_code]['country_name']), country_number[iso_code]) for iso_code in iso_codes
+        )),
+        'state_keys': _index_section(strings, (
+            (f"{gazetteer.states[code]['iso_code']}{SEP}{normalize(gazetteer.states[code]['state_name'])}", state_number[code])
+            for code in admin_codes
+        )),
+        'city_keys': _index_section(strings, city_keys),
+        'city_paths': _index_section(strings, city_paths),
+    }
+    blobs = {'strings': bytes(strings.data)}
+    for name, packed in sections.items():
+        if sys.byteorder != 'little':
+            packed.byteswap()
+        blobs[name] = packed.tobytes()
+
+    header = bytearray(MAGIC)
+    offset = HEADER_SIZE
+    for name in SECTIONS:
+        # Keep the uint32 arrays aligned
+        offset += -offset % 4
+        header += struct.pack('<II', offset, len(blobs[name]))
+        offset += len(blobs[name])
+
+    temp_path = f"{output}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        for name in SECTIONS:
+            f.write(b'\0' * (-f.tell() % 4))
+            f.write(blobs[name])
+    os.replace(temp_path, output)
+
+    counts = {'countries': len(iso_codes), 'states': len(admin_codes), 'cities': len(cities),
+              'bytes': os.path.getsize(output)}
+    logger.info("Wrote %s: %s", output, counts)
+    return counts
+
+
+def export_cities(driver):
+    """
+    Read every (city_name, admin1_code) pair from the knowledge graph,
+    including cities added by CeeyMore updates since the last CSV import.
+    """
+    with driver.session() as session:
+        result = session.run("""
+            MATCH (city:City)-[:IN_STATE]->(state:State)
+            RETURN city.city_name AS city_name, state.admin1_code AS admin_code
+        """)
+        return [(record['city_name'], record['admin_code']) for record in result]
+
+###########################################################################################################################
+
+
+class _Entries:
+    """
+    Sequence view of the keys of a sorted section (an index, or the country
+    or state records), searched by bisection. The key is the first string
+    of each entry.
+    """
+
+    def __init__(self, gazetteer, section, width=INDEX_WIDTH):
+        self.mm = gazetteer.mm
+        self.strings = gazetteer.sections['strings'][0]
+        self.section = gazetteer._array(section)
+        self.width = width
+        self.size = len(self.section) // width
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, position):
+        base = position * self.width
+        start = self.strings + self.section[base]
+        return self.mm[start:start + self.section[base + 1]]
+
+    def record(self, position):
+        return self.section[position * self.width + 2]
+
+    def _bisect(self, key):
+        # bisect.bisect_left over this view, inlined: it sits under every exact lookup
+        mm, strings, section, width = self.mm, self.strings, self.section, self.width
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            base = middle * width
+            start = strings + section[base]
+            if mm[start:start + section[base + 1]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def position(self, key):
+        """
+        Returns:
+            int: The position of `key`, or None if it isn't in the section.
+        """
+        key = key.encode('utf-8')
+        position = self._bisect(key)
+        if position < self.size and self[position] == key:
+            return position
+        return None
+
+    def get(self, key):
+        position = self.position(key)
+        return None if position is None else self.record(position)
+
+    def prefix(self, prefix):
+        """
+        Yield (key, record number) for every key starting with `prefix`, in key order.
+        """
+        prefix = prefix.encode('utf-8')
+        position = self._bisect(prefix)
+        while position < self.size:
+            key = self[position]
+            if not key.startswith(prefix):
+                break
+            yield key.decode('utf-8'), self.record(position)
+            position += 1
+
+
+class _Records(Mapping):
+    """
+    Read-only dict view of the country or state records, keyed by ISO or
+    admin1 code, so callers written against Gazetteer.countries/.states work
+    unchanged.
+    """
+
+    def __init__(self, gazetteer, section, fields):
+        self.gazetteer = gazetteer
+        self.fields = fields
+        self.width = 2 * len(fields)
+        self.entries = _Entries(gazetteer, section, self.width)
+        self.section = self.entries.section
+
+    def __len__(self):
+        return len(self.entries)
+
+    def code(self, number):
+        return self.entries[number].decode('utf-8')
+
+    def record(self, number):
+        base = number * self.width
+        return {
+            field: self.gazetteer._string(self.section[base + 2 * i], self.section[base + 2 * i + 1])
+            for i, field in enumerate(self.fields)
+        }
+
+    def number(self, key):
+        return self.entries.position(key) if isinstance(key, str) else None
+
+    def __getitem__(self, key):
+        number = self.number(key)
+        if number is None:
+            raise KeyError(key)
+        return self.record(number)
+
+    def __contains__(self, key):
+        return self.number(key) is not None
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self.code(number)
+
+
+class _Index(Mapping):
+    """
+    Read-only dict view of country_index: folded key -> ISO code.
+    """
+
+    def __init__(self, gazetteer, entries):
+        self.gazetteer = gazetteer
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, key):
+        number = self.entries.get(key) if isinstance(key, str) else None
+        if number is None:
+            raise KeyError(key)
+        return self.gazetteer._country_code(number)
+
+    def __iter__(self):
+        for position in range(len(self.entries)):
+            yield self.entries[position].decode('utf-8')
+
+
+class CompactGazetteer:
+    """
+    Gazetteer backed by a file written by build(), with the same lookups as
+    Gazetteer plus the city tables MemoryBackend needs. Nothing is parsed at
+    open; the fuzzy indexes are built per worker on first use.
+    """
+
+    def __init__(self, path=GAZETTEER_FILE):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a compact gazetteer file (rebuild it with python -m utils.compact_gazetteer).")
+        if sys.byteorder != 'little':
+            raise ValueError("Compact gazetteer files can only be mapped on little-endian hosts.")
+        self.view = memoryview(self.mm)
+        header = self.view[len(MAGIC):HEADER_SIZE].cast('I')
+        self.sections = {name: (header[2 * i], header[2 * i + 1]) for i, name in enumerate(SECTIONS)}
+
+        self.countries = _Records(self, 'countries', ('iso_code', 'country_name'))
+        self.states = _Records(self, 'states', ('admin_code', 'state_name', 'ascii_name', 'iso_code'))
+        self.country_entries = _Entries(self, 'country_index')
+        self.state_entries = _Entries(self, 'state_index')
+        self.country_keys = _Entries(self, 'country_keys')
+        self.state_keys = _Entries(self, 'state_keys')
+        self.city_keys = _Entries(self, 'city_keys')
+        self.city_entries = _Entries(self, 'city_paths')
+        self.cities = self._array('cities')
+        self.country_index = _Index(self, self.country_entries)
+        self.state_fuzzy = ScopedFuzzyIndex(self._state_entries, max_scopes=len(self.countries) or 1)
+        self._country_fuzzy = None
+        self.lock = threading.Lock()
+
+    def _array(self, section):
+        offset, length = self.sections[section]
+        return self.view[offset:offset + length].cast('I')
+
+    def _bytes(self, offset, length):
+        start = self.sections['strings'][0] + offset
+        return self.mm[start:start + length]
+
+    def _string(self, offset, length):
+        return self._bytes(offset, length).decode('utf-8')
+
+    def _country_code(self, number):
+        return self.countries.code(number)
+
+    def _admin_code(self, number):
+        return self.states.code(number)
+
+    def _city(self, number):
+        base = number * WIDTHS['cities']
+        return (self._string(self.cities[base], self.cities[base + 1]),
+                self._string(self.cities[base + 2], self.cities[base + 3]))
+
+    def close(self):
+        """
+        Release the mapping. Views handed out earlier must not be used afterwards.
+        """
+        for name in ('countries', 'states'):
+            getattr(self, name).section.release()
+        for entries in (self.country_entries, self.state_entries, self.country_keys, self.state_keys,
+                        self.city_keys, self.city_entries):
+            entries.section.release()
+        self.cities.release()
+        self.view.release()
+        self.mm.close()
+
+    @staticmethod
+    def _fold(value):
+        return value.strip().casefold() if value else ''
+
+    @property
+    def country_fuzzy(self):
+        with self.lock:
+            if self._country_fuzzy is None:
+                self._country_fuzzy = FuzzyIndex(
+                    (country['country_name'], iso_code) for iso_code, country in self.countries.items()
+                )
+            return self._country_fuzzy
+
+    def find_country(self, country_name):
+        """
+        Look up a country by name, ISO2, ISO3 or FIPS code.
+
+        Returns:
+            tuple: (iso_code, country_name), or (None, None) if not found.
+        """
+        number = self.country_entries.get(self._fold(country_name))
+        if number is None:
+            return None, None
+        country = self.countries.record(number)
+        return country['iso_code'], country['country_name']
+
+    def find_state(self, state_name, country_code):
+        """
+        Look up a state within a country by name, ASCII name or admin1 code.
+
+        Returns:
+            tuple: (state_name, admin_code), or (None, None) if not found.
+        """
+        number = self.state_entries.get(f"{country_code}{SEP}{self._fold(state_name)}") if country_code else None
+        if number is None:
+            return None, None
+        state = self.states.record(number)
+        return state['state_name'], state['admin_code']
+
+    def _state_entries(self, country_code):
+        for admin_code in self.state_codes(country_code):
+            state = self.states[admin_code]
+            yield state['state_name'], admin_code
+            yield state['ascii_name'], admin_code
+
+    def fuzzy_country(self, country_name, k=5, min_score=0.0):
+        """
+        Approximate country name search.
+
+        Returns:
+            list: Up to k (score, iso_code, country_name) tuples, best first.
+        """
+        return [
+            (score, iso_code, self.countries[iso_code]['country_name'])
+            for score, iso_code in self.country_fuzzy.search(country_name, k=k, min_score=min_score)
+        ]
+
+    def fuzzy_state(self, state_name, country_code, k=5, min_score=0.0):
+        """
+        Approximate state name search within one country.
+
+        Returns:
+            list: Up to k (score, state_name, admin_code) tuples, best first.
+        """
+        return [
+            (score, self.states[admin_code]['state_name'], admin_code)
+            for score, admin_code in self.state_fuzzy.search(country_code, state_name, k=k, min_score=min_score)
+        ]
+
+    # Exact lookups on the normalized name (see fuzzy.normalize), as used by MemoryBackend
+
+    def country_by_key(self, name_key):
+        number = self.country_keys.get(name_key)
+        return None if number is None else self._country_code(number)
+
+    def state_by_key(self, country_code, name_key):
+        number = self.state_keys.get(f"{country_code}{SEP}{name_key}")
+        return None if number is None else self._admin_code(number)
+
+    def state_codes(self, country_code):
+        """
+        Admin1 codes of every state in a country.
+        """
+        if not country_code:
+            return []
+        return list(dict.fromkeys(
+            self._admin_code(number) for _, number in self.state_entries.prefix(f"{country_code}{SEP}")
+        ))
+
+    def city_by_key(self, scope, name_key):
+        number = self.city_keys.get(f"{_scope_key(scope)}{SEP}{name_key}")
+        return None if number is None else self._city(number)[0]
+
+    def cities_in(self, scope):
+        """
+        City names in an ('admin', admin1_code) or ('country', iso_code) scope.
+        """
+        return [self._city(number)[0] for _, number in self.city_keys.prefix(f"{_scope_key(scope)}{SEP}")]
+
+    def city_paths(self, name_key):
+        """
+        Returns:
+            list: (city_name, admin1_code) for every city with this normalized name.
+        """
+        return [self._city(number) for _, number in self.city_entries.prefix(f"{name_key}{SEP}")]
+
+    def distinct_cities(self):
+        """
+        Yield (city_name, normalized name) once per distinct normalized name.
+        """
+        previous = None
+        for position in range(len(self.city_entries)):
+            name_key = self.city_entries[position].decode('utf-8').partition(SEP)[0]
+            if name_key != previous:
+                previous = name_key
+                yield self._city(self.city_entries.record(position))[0], name_key
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'bytes': len(self.mm),
+            'countries': len(self.countries),
+            'states': len(self.states),
+            'cities': len(self.cities) // WIDTHS['cities'],
+        }
+
+###########################################################################################################################
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the reference data into a compact, mmap-able gazetteer file.")
+    parser.add_argument('-o', '--output', default=GAZETTEER_FILE, help=f"File to write (default: {GAZETTEER_FILE}).")
+    parser.add_argument('--countries', default=COUNTRIES_CSV)
+    parser.add_argument('--states', default=STATES_CSV)
+    parser.add_argument('--cities', help="City_Name,Admin1_Code CSV (default: JANITOR_CITIES_CSV).")
+    parser.add_argument('--from-neo4j', action='store_true', help="Take the cities from the knowledge graph instead of a CSV.")
+    parser.add_argument('--stats', action='store_true', help="Print the contents of an existing file and exit.")
+    args = parser.parse_args(argv)
+
+    if args.stats:
+        print(CompactGazetteer(args.output).stats())
+        return
+
+    cities = None
+    if args.from_neo4j:
+        from .graph_driver import get_driver, close_driver
+        try:
+            cities = export_cities(get_driver())
+        finally:
+            close_driver()
+    elif args.cities:
+        from .graph_backend import load_cities
+        cities = load_cities(args.cities)
+    print(build(args.output, args.countries, args.states, cities))
+
+
+if __name__ == '__main__':
+    main()
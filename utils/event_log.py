@@ -0,0 +1,285 @@
+# utils/event_log.py
+#
+# Structured JSONL log of every cleaning call: the inputs, the response, the
+# stage that answered it, whether it escalated to CeeyMore, and how long it
+# took. Request threads only put the event on an in-memory queue; a
+# background thread serializes and appends it, and rotates the file by size.
+# The log is also a replay corpus for the benchmark:
+#
+#   python -m bench.run --corpus 'temp_updates/events.jsonl*'
+
+import os
+import time
+import gzip
+import json
+import queue
+import atexit
+import shutil
+import threading
+from .paths import TEMP_UPDATES_DIR
+from .singleflight import file_lock
+from .metrics import EVENTS
+from .log import get_logger
+
+logger = get_logger('event_log')
+
+# Where to write the log; set it to an empty string to turn the log off
+EVENT_LOG_PATH = os.getenv("JANITOR_EVENT_LOG", os.path.join(TEMP_UPDATES_DIR, 'events.jsonl'))
+# Rotate once the file reaches this size, keeping this many older files
+EVENT_LOG_MAX_BYTES = int(os.getenv("JANITOR_EVENT_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+EVENT_LOG_BACKUPS = int(os.getenv("JANITOR_EVENT_LOG_BACKUPS", "5"))
+# gzip rotated files
+EVENT_LOG_COMPRESS = os.getenv("JANITOR_EVENT_LOG_COMPRESS", "1").lower() in ('1', 'true', 'yes')
+# Events held in memory before new ones are dropped
+EVENT_LOG_QUEUE_SIZE = int(os.getenv("JANITOR_EVENT_LOG_QUEUE_SIZE", "10000"))
+# Seconds the writer waits to fill a batch before writing what it has
+EVENT_LOG_FLUSH_INTERVAL = float(os.getenv("JANITOR_EVENT_LOG_FLUSH_INTERVAL", "1"))
+# Most events written per batch
+EVENT_LOG_BATCH_SIZE = 1000
+
+
+class EventLog:
+    """
+    Append-only JSONL file written by a background thread.
+
+    Every worker process on the host may append to the same file. Each batch
+    is written under a file_lock, after reopening the file if another process
+    rotated it, so no process writes into a file that is being rotated or
+    compressed. When the queue is full, events are dropped and counted rather
+    than blocking the request.
+    """
+
+    def __init__(self, path=EVENT_LOG_PATH, max_bytes=EVENT_LOG_MAX_BYTES, backups=EVENT_LOG_BACKUPS,
+                 compress=EVENT_LOG_COMPRESS, queue_size=EVENT_LOG_QUEUE_SIZE, flush_interval=EVENT_LOG_FLUSH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.fd = None
+        self.counters = {'written': 0, 'dropped': 0, 'rotations': 0, 'errors': 0}
+
+    def _start(self):
+        # A forked worker inherits neither the thread nor a usable queue
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=self.queue_size)
+            self.fd = None
+            self.thread = threading.Thread(target=self._run, name='janitor-event-log', daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+
+    def emit(self, event):
+        """
+        Queue an event (a JSON-serializable dict) for writing.
+
+        Returns:
+            bool: False if the queue was full and the event was dropped.
+        """
+        if self.pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.counters['dropped'] += 1
+            EVENTS.inc(outcome='dropped')
+            return False
+
+    def flush(self, timeout=5.0):
+        """
+        Wait until every event queued so far has been written.
+        """
+        if self.pid != os.getpid():
+            return True
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _run(self):
+        pending = self.queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < EVENT_LOG_BATCH_SIZE and not isinstance(batch[-1], threading.Event):
+                try:
+                    batch.append(pending.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            events = [event for event in batch if not isinstance(event, threading.Event)]
+            if events:
+                try:
+                    data = ''.join(json.dumps(event, ensure_ascii=False, default=str) + '\n' for event in events)
+                    self._write(data.encode('utf-8'))
+                    self.counters['written'] += len(events)
+                    EVENTS.inc(len(events), outcome='written')
+                except Exception:
+                    self.counters['errors'] += 1
+                    EVENTS.inc(len(events), outcome='failed')
+                    logger.warning("Could not write %d events to %s", len(events), self.path, exc_info=True)
+            for marker in batch:
+                if isinstance(marker, threading.Event):
+                    marker.set()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _lock(self):
+        return file_lock(f"event_log:{os.path.abspath(self.path)}")
+
+    def _write(self, data):
+        rotated = None
+        with self._lock():
+            # Follow a rotation done by another process
+            try:
+                current = os.stat(self.path)
+            except FileNotFoundError:
+                current = None
+            if self.fd is None or current is None or current.st_ino != os.fstat(self.fd).st_ino:
+                self._open()
+                current = os.fstat(self.fd)
+            if current.st_size and current.st_size + len(data) > self.max_bytes:
+                rotated = self._rotate()
+            os.write(self.fd, data)
+        if rotated is not None:
+            self._compress(rotated)
+
+    def _backups(self, number):
+        # A rotated file stays uncompressed until its writer has compressed it,
+        # so backup N may exist in either form
+        path = f"{self.path}.{number}"
+        return f"{path}.gz", path
+
+    def _rotate(self):
+        """
+        Shift path.1 .. path.N up by one, dropping the oldest, and move the
+        current file to path.1. Called with the file lock held.
+
+        Returns:
+            int: A read-only descriptor of the rotated file if it is to be
+            compressed, else None.
+        """
+        self.counters['rotations'] += 1
+        if self.backups <= 0:
+            os.remove(self.path)
+            self._open()
+            return None
+        for oldest in self._backups(self.backups):
+            if os.path.exists(oldest):
+                os.remove(oldest)
+        for number in range(self.backups - 1, 0, -1):
+            for source, target in zip(self._backups(number), self._backups(number + 1)):
+                if os.path.exists(source):
+                    os.replace(source, target)
+        rotated = f"{self.path}.1"
+        os.replace(self.path, rotated)
+        self._open()
+        # Opened under the lock: later rotations may rename the file, but the
+        # descriptor keeps reading the same segment
+        return os.open(rotated, os.O_RDONLY) if self.compress else None
+
+    def _compress(self, fd):
+        """
+        gzip a rotated file outside the lock, then, under it, swap the result
+        in for the uncompressed file at whatever number later rotations have
+        shifted it to (or discard it if it has been dropped meanwhile).
+        """
+        inode = os.fstat(fd).st_ino
+        directory, name = os.path.split(os.path.abspath(self.path))
+        # Hidden, so an 'events.jsonl*' corpus glob doesn't pick it up half-written
+        temp = os.path.join(directory, f".{name}.{os.getpid()}.{inode}.gz")
+        try:
+            with os.fdopen(fd, 'rb') as source, gzip.open(temp, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            with self._lock():
+                for number in range(1, self.backups + 1):
+                    compressed, uncompressed = self._backups(number)
+                    try:
+                        if os.stat(uncompressed).st_ino != inode:
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    os.replace(temp, compressed)
+                    os.remove(uncompressed)
+                    return
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def close(self):
+        if self.pid == os.getpid():
+            self.flush()
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            **self.counters,
+        }
+
+
+_event_log = None
+_lock = threading.Lock()
+
+
+def get_event_log():
+    """
+    Return the process-wide event log, or None if JANITOR_EVENT_LOG is empty.
+    """
+    global _event_log
+    if not EVENT_LOG_PATH:
+        return None
+    with _lock:
+        if _event_log is None:
+            _event_log = EventLog()
+            atexit.register(_event_log.close)
+        return _event_log
+
+
+def log_clean(city, state, country, cleaned_address, stage, latency, llm_latency=None, mode='sync', batch_size=None):
+    """
+    Record one cleaned address.
+
+    Args:
+        city, state, country (str): The inputs as received.
+        cleaned_address (dict): The response, as returned by clean_address_fields.
+        stage (str): What answered it: 'cache', 'joint', 'staged' or 'ceeymore'.
+        latency (float): Seconds spent on the call (on the whole batch for batches).
+        llm_latency (float): Seconds spent waiting on CeeyMore, if it escalated.
+        mode (str): 'sync', 'async', 'batch' or 'batch_async'.
+        batch_size (int): Number of addresses in the batch, for batches.
+    """
+    event_log = get_event_log()
+    if event_log is None:
+        return
+    event = {
+        'ts': round(time.time(), 3),
+        'event': 'clean',
+        'mode': mode,
+        'city': city,
+        'state': state,
+        'country': country,
+        'stage': stage,
+        'escalated': stage == 'ceeymore',
+        'latency_ms': round(1000 * latency, 3),
+        # Candidate lists are left out to keep the log small
+        'output': {key: value for key, value in cleaned_address.items() if key != 'candidates'},
+    }
+    if llm_latency is not None:
+        event['llm_ms'] = round(1000 * llm_latency, 3)
+    if batch_size is not None:
+        event['batch_size'] = batch_size
+    event_log.emit(event)
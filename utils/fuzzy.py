@@ -0,0 +1,145 @@
+# utils/fuzzy.py
+
+import os
+import difflib
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+# Minimum similarity (0-1) for a local fuzzy match to be accepted
+FUZZY_MIN_SCORE = float(os.getenv("JANITOR_FUZZY_MIN_SCORE", "0.75"))
+# Fall back to Neo4j full-text (Lucene '~') search when the local engine has no match
+NEO4J_FUZZY_FALLBACK = os.getenv("JANITOR_NEO4J_FUZZY_FALLBACK", "1").lower() in ('1', 'true', 'yes')
+
+
+def normalize(value):
+    """
+    Case-fold, strip accents and collapse whitespace so that 'São  Paulo' and
+    'sao paulo' compare equal.
+    """
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return ' '.join(value.casefold().split())
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyIndex:
+    """
+    Trigram index over a fixed set of names.
+
+    A query is pre-filtered to the names sharing the most trigrams with it,
+    and those candidates are ranked by difflib similarity.
+
+    Args:
+        entries (iterable): (name, value) pairs; several names may map to the same value.
+    """
+
+    def __init__(self, entries):
+        self.keys = []
+        self.values = []
+        self.exact = {}
+        self.postings = defaultdict(list)
+        for name, value in entries:
+            key = normalize(name)
+            if not key or key in self.exact:
+                continue
+            position = len(self.keys)
+            self.keys.append(key)
+            self.values.append(value)
+            self.exact[key] = position
+            for gram in trigrams(key):
+                self.postings[gram].append(position)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, query, k=5, min_score=0.0, max_candidates=20):
+        """
+        Return up to k (score, value) pairs, best first, with score in [0, 1].
+        Each value appears at most once.
+        """
+        key = normalize(query)
+        if not key:
+            return []
+        if key in self.exact:
+            position = self.exact[key]
+            return [(1.0, self.values[position])]
+
+        overlap = defaultdict(int)
+        for gram in trigrams(key):
+            for position in self.postings.get(gram, ()):
+                overlap[position] += 1
+        candidates = sorted(overlap, key=overlap.get, reverse=True)[:max_candidates]
+
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        matcher.set_seq2(key)
+        scored = []
+        for position in candidates:
+            matcher.set_seq1(self.keys[position])
+            if matcher.real_quick_ratio() < min_score or matcher.quick_ratio() < min_score:
+                continue
+            score = matcher.ratio()
+            if score >= min_score:
+                scored.append((score, position))
+        scored.sort(key=lambda item: (-item[0], self.keys[item[1]]))
+
+        results = []
+        seen = set()
+        for score, position in scored:
+            value = self.values[position]
+            marker = repr(value)
+            if marker in seen:
+                continue
+            seen.add(marker)
+            results.append((round(score, 4), value))
+            if len(results) == k:
+                break
+        return results
+
+
+class ScopedFuzzyIndex:
+    """
+    One FuzzyIndex per scope (e.g. a country code or admin1 code), built on
+    first use from `loader(scope)` and kept in a bounded LRU.
+    """
+
+    def __init__(self, loader, max_scopes=256):
+        self.loader = loader
+        self.max_scopes = max_scopes
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _store(self, scope, index):
+        with self.lock:
+            self.indexes[scope] = index
+            self.indexes.move_to_end(scope)
+            while len(self.indexes) > self.max_scopes:
+                self.indexes.popitem(last=False)
+
+    def get(self, scope):
+        with self.lock:
+            index = self.indexes.get(scope)
+            if index is not None:
+                self.indexes.move_to_end(scope)
+                return index
+        index = FuzzyIndex(self.loader(scope))
+        self._store(scope, index)
+        return index
+
+    def missing(self, scopes):
+        with self.lock:
+            return [scope for scope in scopes if scope not in self.indexes]
+
+    def preload(self, entries_by_scope):
+        """
+        Build indexes for several scopes from already-fetched entries.
+        """
+        for scope, entries in entries_by_scope.items():
+            self._store(scope, FuzzyIndex(entries))
+
+    def search(self, scope, query, k=5, min_score=0.0):
+        return self.get(scope).search(query, k=k, min_score=min_score)
@@ -0,0 +1,148 @@
+# utils/gazetteer.py
+
+import os
+import csv
+from .paths import IMPORT_DIR
+from .fuzzy import FuzzyIndex, ScopedFuzzyIndex
+
+COUNTRIES_CSV = os.path.join(IMPORT_DIR, 'countries.csv')
+STATES_CSV = os.path.join(IMPORT_DIR, 'states.csv')
+# Compiled by `python -m utils.compact_gazetteer`; used instead of the CSVs when present
+GAZETTEER_FILE = os.getenv("JANITOR_GAZETTEER_FILE", os.path.join(IMPORT_DIR, 'gazetteer.bin'))
+
+
+class Gazetteer:
+    """
+    In-memory index of the static country and admin1 (state) reference data.
+
+    Countries are indexed by name, ISO2, ISO3 and FIPS code; states are indexed
+    per country by name, ASCII name and admin1 code. All keys are case-folded so
+    lookups answer both exact and case-insensitive matches.
+    """
+
+    def __init__(self, countries_path=COUNTRIES_CSV, states_path=STATES_CSV):
+        self.countries = {}        # iso_code -> country row
+        self.country_index = {}    # folded name/ISO2/ISO3/FIPS -> iso_code
+        self.states = {}           # admin1_code -> state row
+        self.state_index = {}      # iso_code -> {folded name/admin1 code -> admin1_code}
+        self._load_countries(countries_path)
+        self._load_states(states_path)
+        self.country_fuzzy = FuzzyIndex(
+            (country['country_name'], iso_code) for iso_code, country in self.countries.items()
+        )
+        self.state_fuzzy = ScopedFuzzyIndex(self._state_entries, max_scopes=len(self.state_index) or 1)
+
+    @staticmethod
+    def _fold(value):
+        return value.strip().casefold() if value else ''
+
+    def _load_countries(self, path):
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = [row for row in csv.DictReader(f) if row['ISO_Code'].strip()]
+
+        for row in rows:
+            iso_code = row['ISO_Code'].strip()
+            self.countries[iso_code] = {
+                'iso_code': iso_code,
+                'country_name': row['Country_Name'].strip(),
+            }
+
+        # Index the weakest key type first so that, e.g., the ISO2 code 'AU'
+        # (Australia) wins over the FIPS code 'AU' (Austria)
+        for column in ('FIPS_Code', 'ISO3_Code', 'ISO_Code', 'Country_Name'):
+            for row in rows:
+                key = self._fold(row[column])
+                if key:
+                    self.country_index[key] = row['ISO_Code'].strip()
+
+    def _load_states(self, path):
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                admin_code = row['Admin1_Code'].strip()
+                iso_code, _, local_code = admin_code.partition('.')
+                if not local_code:
+                    continue
+                self.states[admin_code] = {
+                    'admin_code': admin_code,
+                    'state_name': row['Admin1_Name'].strip(),
+                    'iso_code': iso_code,
+                }
+                self.states[admin_code]['ascii_name'] = row['Admin1_ASCII_Name'].strip()
+                index = self.state_index.setdefault(iso_code, {})
+                for key in (local_code, admin_code, row['Admin1_ASCII_Name'], row['Admin1_Name']):
+                    key = self._fold(key)
+                    if key:
+                        index[key] = admin_code
+
+    def find_country(self, country_name):
+        """
+        Look up a country by name, ISO2, ISO3 or FIPS code.
+
+        Returns:
+            tuple: (iso_code, country_name), or (None, None) if not found.
+        """
+        iso_code = self.country_index.get(self._fold(country_name))
+        if iso_code is None:
+            return None, None
+        country = self.countries[iso_code]
+        return country['iso_code'], country['country_name']
+
+    def find_state(self, state_name, country_code):
+        """
+        Look up a state within a country by name, ASCII name or admin1 code.
+
+        Returns:
+            tuple: (state_name, admin_code), or (None, None) if not found.
+        """
+        admin_code = self.state_index.get(country_code, {}).get(self._fold(state_name))
+        if admin_code is None:
+            return None, None
+        return self.states[admin_code]['state_name'], admin_code
+
+    def _state_entries(self, country_code):
+        for admin_code in set(self.state_index.get(country_code, {}).values()):
+            state = self.states[admin_code]
+            yield state['state_name'], admin_code
+            yield state['ascii_name'], admin_code
+
+    def fuzzy_country(self, country_name, k=5, min_score=0.0):
+        """
+        Approximate country name search.
+
+        Returns:
+            list: Up to k (score, iso_code, country_name) tuples, best first.
+        """
+        return [
+            (score, iso_code, self.countries[iso_code]['country_name'])
+            for score, iso_code in self.country_fuzzy.search(country_name, k=k, min_score=min_score)
+        ]
+
+    def fuzzy_state(self, state_name, country_code, k=5, min_score=0.0):
+        """
+        Approximate state name search within one country.
+
+        Returns:
+            list: Up to k (score, state_name, admin_code) tuples, best first.
+        """
+        return [
+            (score, self.states[admin_code]['state_name'], admin_code)
+            for score, admin_code in self.state_fuzzy.search(country_code, state_name, k=k, min_score=min_score)
+        ]
+
+
+_gazetteer = None
+
+
+def get_gazetteer():
+    """
+    Return the process-wide gazetteer: the compact file at GAZETTEER_FILE,
+    mapped read-only, if it has been built, else loaded from import/*.csv.
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        if os.path.exists(GAZETTEER_FILE):
+            from .compact_gazetteer import CompactGazetteer
+            _gazetteer = CompactGazetteer(GAZETTEER_FILE)
+        else:
+            _gazetteer = Gazetteer()
+    return _gazetteer
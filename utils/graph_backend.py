@@ -0,0 +1,747 @@
+# utils/graph_backend.py
+
+import os
+import csv
+import asyncio
+import difflib
+import threading
+from .gazetteer import get_gazetteer, IMPORT_DIR
+from .compact_gazetteer import CompactGazetteer
+from .fuzzy import FuzzyIndex, normalize
+from .graph_driver import get_driver, get_async_driver
+from .metrics import GRAPH_QUERY_DURATION
+
+# 'neo4j' queries the knowledge graph; 'memory' answers from import/*.csv without any network
+GRAPH_BACKEND = os.getenv("JANITOR_GRAPH_BACKEND", "neo4j").lower()
+CITIES_CSV = os.getenv("JANITOR_CITIES_CSV", os.path.join(IMPORT_DIR, 'cities.csv'))
+# Minimum similarity for the memory backend's stand-in for full-text ('~') search
+MEMORY_FUZZY_MIN_SCORE = 0.6
+# How much each field counts towards a joint city/state/country match score
+JOINT_WEIGHTS = {'city': 0.5, 'state': 0.25, 'country': 0.25}
+# Candidate cities considered per address by the joint resolver
+JOINT_CANDIDATES = 10
+
+
+def similarity(value, candidate):
+    """
+    Similarity in [0, 1] of two names after normalization.
+    """
+    value, candidate = normalize(value), normalize(candidate)
+    if not value or not candidate:
+        return 0.0
+    if value == candidate:
+        return 1.0
+    return difflib.SequenceMatcher(None, value, candidate, autojunk=False).ratio()
+
+
+def score_path(path, city_name, state_name, country_name, gazetteer=None):
+    """
+    Score how well a City-[:IN_STATE]->State-[:IN_COUNTRY]->Country path
+    explains the three raw fields. A state or country given by any name or
+    code the gazetteer knows counts as an exact match.
+
+    Returns:
+        dict: The path with 'score' and per-field 'city_score', 'state_score'
+        and 'country_score', all in [0, 1].
+    """
+    gazetteer = gazetteer or get_gazetteer()
+    city_score = similarity(city_name, path['city_name'])
+
+    if gazetteer.find_state(state_name, path['iso_code'])[1] == path['admin_code']:
+        state_score = 1.0
+    else:
+        ascii_name = gazetteer.states.get(path['admin_code'], {}).get('ascii_name')
+        state_score = max(similarity(state_name, path['state_name']), similarity(state_name, ascii_name))
+
+    if gazetteer.find_country(country_name)[0] == path['iso_code']:
+        country_score = 1.0
+    else:
+        country_score = similarity(country_name, path['country_name'])
+
+    score = (JOINT_WEIGHTS['city'] * city_score + JOINT_WEIGHTS['state'] * state_score
+             + JOINT_WEIGHTS['country'] * country_score)
+    return dict(path, score=round(score, 4), city_score=round(city_score, 4),
+                state_score=round(state_score, 4), country_score=round(country_score, 4))
+
+
+def best_path(paths, city_name, state_name, country_name):
+    """
+    Return the highest scoring candidate path, or None if there are none.
+    """
+    scored = [score_path(path, city_name, state_name, country_name) for path in paths]
+    return max(scored, key=lambda path: (path['score'], path['city_score']), default=None)
+
+
+def load_cities(path=CITIES_CSV):
+    """
+    Read (city_name, admin1_code) pairs from a City_Name,Admin1_Code CSV.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        return [(row['City_Name'].strip(), row['Admin1_Code'].strip()) for row in csv.DictReader(f)]
+
+
+class GraphBackend:
+    """
+    Lookups the address cleaner needs from the reference graph.
+
+    Scopes are ('admin', admin1_code) or ('country', iso_code). `fuzzy=False`
+    is an exact match on the normalized name (see fuzzy.normalize); `fuzzy=True` returns the best approximate
+    match. The batch methods take distinct keys and return only the keys that
+    matched; by default they loop over the single lookups.
+    """
+
+    name = None
+
+    def find_country(self, country_name, fuzzy=False):
+        """
+        Returns:
+            tuple: (iso_code, country_name), or (None, None) if not found.
+        """
+        raise NotImplementedError
+
+    def find_state(self, state_name, country_code, fuzzy=False):
+        """
+        Returns:
+            tuple: (state_name, admin_code), or (None, None) if not found.
+        """
+        raise NotImplementedError
+
+    def find_city(self, city_name, country_code, admin_code=None, fuzzy=False):
+        """
+        Find a city within the state when admin_code is given, else within the country.
+
+        Returns:
+            str: The city name, or None if not found.
+        """
+        raise NotImplementedError
+
+    def city_names(self, scope):
+        """
+        Returns:
+            list: Every city name in the scope.
+        """
+        raise NotImplementedError
+
+    def find_countries(self, country_names, fuzzy=False):
+        """
+        Returns:
+            dict: country_name -> (iso_code, country_name).
+        """
+        found = {}
+        for name in country_names:
+            iso_code, standardized_name = self.find_country(name, fuzzy=fuzzy)
+            if iso_code:
+                found[name] = (iso_code, standardized_name)
+        return found
+
+    def find_states(self, states, fuzzy=False):
+        """
+        Args:
+            states (list): (state_name, country_code) pairs.
+
+        Returns:
+            dict: (state_name, country_code) -> (state_name, admin_code).
+        """
+        found = {}
+        for key in states:
+            state_name, admin_code = self.find_state(*key, fuzzy=fuzzy)
+            if admin_code:
+                found[key] = (state_name, admin_code)
+        return found
+
+    def find_cities(self, cities, fuzzy=False):
+        """
+        Args:
+            cities (list): (city_name, country_code, admin_code) triples.
+
+        Returns:
+            dict: (city_name, country_code, admin_code) -> city_name.
+        """
+        found = {}
+        for key in cities:
+            city_name = self.find_city(*key, fuzzy=fuzzy)
+            if city_name:
+                found[key] = city_name
+        return found
+
+    def city_names_many(self, scopes):
+        """
+        Returns:
+            dict: scope -> list of city names.
+        """
+        return {scope: self.city_names(scope) for scope in scopes}
+
+    def address_candidates(self, city_name, state_name, country_name):
+        """
+        Candidate paths for an address, found from the city name alone so a bad
+        state or country doesn't hide the right city.
+
+        Returns:
+            list: Dicts with city_name, admin_code, state_name, iso_code and country_name.
+        """
+        raise NotImplementedError
+
+    def address_candidates_many(self, addresses):
+        """
+        Args:
+            addresses (list): Distinct (city_name, state_name, country_name) triples.
+
+        Returns:
+            dict: (city_name, state_name, country_name) -> list of candidate paths.
+        """
+        return {key: self.address_candidates(*key) for key in addresses}
+
+    def resolve_address(self, city_name, state_name, country_name):
+        """
+        Resolve the three fields together, using each to disambiguate the others.
+
+        Returns:
+            dict: The best scoring path (see score_path), or None.
+        """
+        return best_path(self.address_candidates(city_name, state_name, country_name), city_name, state_name, country_name)
+
+    async def resolve_address_async(self, city_name, state_name, country_name):
+        """
+        resolve_address for the async request path. Backends without an async
+        client run the lookup on a worker thread.
+        """
+        return await asyncio.to_thread(self.resolve_address, city_name, state_name, country_name)
+
+    def resolve_addresses(self, addresses):
+        """
+        Batch version of resolve_address.
+
+        Returns:
+            dict: (city_name, state_name, country_name) -> best path or None.
+        """
+        return {key: best_path(paths, *key) for key, paths in self.address_candidates_many(addresses).items()}
+
+    def aliases(self):
+        """
+        Every alias stored in the graph, as alias_index.alias_row dicts.
+        """
+        return []
+
+    def add_aliases(self, rows):
+        """
+        Persist learned aliases (alias_index.alias_row dicts) so other
+        processes load them; backends without storage keep nothing.
+        """
+        pass
+
+    def warm_up(self):
+        """
+        Build whatever the backend would otherwise build on its first lookup
+        (see utils.warmup).
+        """
+        pass
+
+    def close(self):
+        pass
+
+###########################################################################################################################
+
+class Neo4jBackend(GraphBackend):
+    """
+    Answers lookups with Cypher against the shared, pooled Neo4j driver. Exact
+    lookups are indexed equality on the precomputed name_key property (see
+    kg_loader.migrate_name_keys), fuzzy lookups use the countryNameIndex,
+    stateNameIndex and cityNameIndex full-text indexes, and batches run as one
+    UNWIND query per lookup kind.
+    """
+
+    name = 'neo4j'
+
+    def warm_up(self):
+        # Create the driver and open a pooled connection
+        get_driver().verify_connectivity()
+
+    def aliases(self):
+        with get_driver().session() as session, GRAPH_QUERY_DURATION.time(stage='alias', kind='load'):
+            result = session.run("""
+                MATCH (a:Alias)
+                RETURN a.alias_id AS alias_id, a.kind AS kind, a.scope AS scope, a.key AS key,
+                       a.alias AS alias, a.target AS target
+            """)
+            return [record.data() for record in result]
+
+    def add_aliases(self, rows):
+        # Imported here because kg_loader imports this module
+        from .kg_loader import BatchWriter
+        with GRAPH_QUERY_DURATION.time(stage='alias', kind='write'):
+            BatchWriter().merge_aliases(rows)
+
+    @staticmethod
+    def _single(session, stage, kind, query, **params):
+        with GRAPH_QUERY_DURATION.time(stage=stage, kind=kind):
+            return session.run(query, **params).single()
+
+    @staticmethod
+    def _batch(session, stage, kind, query, rows, **params):
+        """
+        Run an UNWIND query over rows and return {idx: record} for the rows that matched.
+        """
+        if not rows:
+            return {}
+        with GRAPH_QUERY_DURATION.time(stage=stage, kind=kind):
+            return {record['idx']: record for record in session.run(query, rows=rows, **params)}
+
+    @staticmethod
+    def _fulltext_query(value):
+        """
+        Escape Lucene syntax and make every term fuzzy.
+        """
+        terms = []
+        for term in (value or '').split():
+            term = ''.join('\\' + ch if ch in '+-&|!(){}[]^"~*?:\\/' else ch for ch in term)
+            terms.append(term + '~')
+        return ' '.join(terms)
+
+    @staticmethod
+    def _searchable(rows):
+        # An empty full-text query fails the whole UNWIND, so those rows can only miss
+        return [row for row in rows if row['query']]
+
+    def find_country(self, country_name, fuzzy=False):
+        query = self._fulltext_query(country_name) if fuzzy else None
+        if fuzzy and not query:
+            return None, None
+        with get_driver().session() as session:
+            if fuzzy:
+                record = self._single(session, 'country', 'fuzzy', """
+                    CALL db.index.fulltext.queryNodes('countryNameIndex', $query)
+                    YIELD node, score
+                    RETURN node.country_name AS country_name, node.iso_code AS iso_code
+                    ORDER BY score DESC
+                    LIMIT 1
+                """, query=query)
+            else:
+                record = self._single(session, 'country', 'exact', """
+                    MATCH (c:Country { name_key: $name_key })
+                    RETURN c.country_name AS country_name, c.iso_code AS iso_code
+                    LIMIT 1
+                """, name_key=normalize(country_name))
+        return (record['iso_code'], record['country_name']) if record else (None, None)
+
+    def find_state(self, state_name, country_code, fuzzy=False):
+        query = self._fulltext_query(state_name) if fuzzy else None
+        if fuzzy and not query:
+            return None, None
+        with get_driver().session() as session:
+            if fuzzy:
+                record = self._single(session, 'state', 'fuzzy', """
+                    CALL db.index.fulltext.queryNodes('stateNameIndex', $query)
+                    YIELD node, score
+                    MATCH (node)-[:IN_COUNTRY]->(c:Country { iso_code: $country_code })
+                    RETURN node.admin1_name AS state_name, node.admin1_code AS admin_code, score
+                    ORDER BY score DESC
+                    LIMIT 1
+                """, query=query, country_code=country_code)
+            else:
+                record = self._single(session, 'state', 'exact', """
+                    MATCH (s:State { name_key: $name_key })-[:IN_COUNTRY]->(c:Country { iso_code: $country_code })
+                    RETURN s.admin1_name AS state_name, s.admin1_code AS admin_code
+                    LIMIT 1
+                """, country_code=country_code, name_key=normalize(state_name))
+        return (record['state_name'], record['admin_code']) if record else (None, None)
+
+    def find_city(self, city_name, country_code, admin_code=None, fuzzy=False):
+        query = self._fulltext_query(city_name) if fuzzy else None
+        if fuzzy and not query:
+            return None
+        with get_driver().session() as session:
+            if fuzzy and admin_code:
+                record = self._single(session, 'city', 'fuzzy', """
+                    CALL db.index.fulltext.queryNodes('cityNameIndex', $query)
+                    YIELD node, score
+                    MATCH (node)-[:IN_STATE]->(state:State { admin1_code: $admin_code })
+                    RETURN node.city_name AS city_name, score
+                    ORDER BY score DESC
+                    LIMIT 1
+                """, query=query, admin_code=admin_code)
+            elif fuzzy:
+                record = self._single(session, 'city', 'fuzzy', """
+                    CALL db.index.fulltext.queryNodes('cityNameIndex', $query)
+                    YIELD node, score
+                    MATCH (node)-[:IN_STATE]->(state:State)-[:IN_COUNTRY]->(c:Country { iso_code: $country_code })
+                    RETURN node.city_name AS city_name, score
+                    ORDER BY score DESC
+                    LIMIT 1
+                """, query=query, country_code=country_code)
+            elif admin_code:
+                record = self._single(session, 'city', 'exact', """
+                    MATCH (city:City { name_key: $name_key })-[:IN_STATE]->(state:State { admin1_code: $admin_code })
+                    RETURN city.city_name AS city_name
+                    LIMIT 1
+                """, name_key=normalize(city_name), admin_code=admin_code)
+            else:
+                record = self._single(session, 'city', 'exact', """
+                    MATCH (city:City { name_key: $name_key })-[:IN_STATE]->(state:State)-[:IN_COUNTRY]->(c:Country { iso_code: $country_code })
+                    RETURN city.city_name AS city_name
+                    LIMIT 1
+                """, name_key=normalize(city_name), country_code=country_code)
+        return record['city_name'] if record else None
+
+    def city_names(self, scope):
+        kind, code = scope
+        with get_driver().session() as session, GRAPH_QUERY_DURATION.time(stage='city', kind='scope'):
+            if kind == 'admin':
+                result = session.run("""
+                    MATCH (city:City)-[:IN_STATE]->(state:State { admin1_code: $code })
+                    RETURN DISTINCT city.city_name AS city_name
+                """, code=code)
+            else:
+                result = session.run("""
+                    MATCH (city:City)-[:IN_STATE]->(state:State)-[:IN_COUNTRY]->(c:Country { iso_code: $code })
+                    RETURN DISTINCT city.city_name AS city_name
+                """, code=code)
+            return [record['city_name'] for record in result]
+
+    def find_countries(self, country_names, fuzzy=False):
+        if not country_names:
+            return {}
+        rows = [{'idx': i, 'name_key': normalize(name), 'query': self._fulltext_query(name)}
+                for i, name in enumerate(country_names)]
+        with get_driver().session() as session:
+            if fuzzy:
+                matches = self._batch(session, 'country', 'fuzzy', """
+                    UNWIND $rows AS row
+                    CALL {
+                        WITH row
+                        CALL db.index.fulltext.queryNodes('countryNameIndex', row.query)
+                        YIELD node, score
+                        RETURN node
+                        ORDER BY score DESC
+                        LIMIT 1
+                    }
+                    RETURN row.idx AS idx, node.country_name AS country_name, node.iso_code AS iso_code
+                """, self._searchable(rows))
+            else:
+                matches = self._batch(session, 'country', 'exact', """
+                    UNWIND $rows AS row
+                    MATCH (c:Country { name_key: row.name_key })
+                    WITH row, head(collect(c)) AS c
+                    RETURN row.idx AS idx, c.country_name AS country_name, c.iso_code AS iso_code
+                """, rows)
+        return {country_names[i]: (record['iso_code'], record['country_name']) for i, record in matches.items()}
+
+    def find_states(self, states, fuzzy=False):
+        if not states:
+            return {}
+        rows = [{'idx': i, 'name_key': normalize(state_name), 'query': self._fulltext_query(state_name),
+                 'country_code': country_code}
+                for i, (state_name, country_code) in enumerate(states)]
+        with get_driver().session() as session:
+            if fuzzy:
+                matches = self._batch(session, 'state', 'fuzzy', """
+                    UNWIND $rows AS row
+                    CALL {
+                        WITH row
+                        CALL db.index.fulltext.queryNodes('stateNameIndex', row.query)
+                        YIELD node, score
+                        MATCH (node)-[:IN_COUNTRY]->(c:Country { iso_code: row.country_code })
+                        RETURN node
+                        ORDER BY score DESC
+                        LIMIT 1
+                    }
+                    RETURN row.idx AS idx, node.admin1_name AS state_name, node.admin1_code AS admin_code
+                """, self._searchable(rows))
+            else:
+                matches = self._batch(session, 'state', 'exact', """
+                    UNWIND $rows AS row
+                    MATCH (s:State { name_key: row.name_key })-[:IN_COUNTRY]->(c:Country { iso_code: row.country_code })
+                    WITH row, head(collect(s)) AS s
+                    RETURN row.idx AS idx, s.admin1_name AS state_name, s.admin1_code AS admin_code
+                """, rows)
+        return {states[i]: (record['state_name'], record['admin_code']) for i, record in matches.items()}
+
+    def find_cities(self, cities, fuzzy=False):
+        if not cities:
+            return {}
+        rows = [{'idx': i, 'name_key': normalize(city_name), 'query': self._fulltext_query(city_name),
+                 'country_code': country_code, 'admin_code': admin_code}
+                for i, (city_name, country_code, admin_code) in enumerate(cities)]
+        # Scope by state when it is known, otherwise by country
+        state_rows = [row for row in rows if row['admin_code']]
+        country_rows = [row for row in rows if not row['admin_code']]
+        with get_driver().session() as session:
+            if fuzzy:
+                state_rows = self._searchable(state_rows)
+                country_rows = self._searchable(country_rows)
+                matches = self._batch(session, 'city', 'fuzzy', """
+                    UNWIND $rows AS row
+                    CALL {
+                        WITH row
+                        CALL db.index.fulltext.queryNodes('cityNameIndex', row.query)
+                        YIELD node, score
+                        MATCH (node)-[:IN_STATE]->(state:State { admin1_code: row.admin_code })
+                        RETURN node
+                        ORDER BY score DESC
+                        LIMIT 1
+                    }
+                    RETURN row.idx AS idx, node.city_name AS city_name
+                """, state_rows)
+                matches.update(self._batch(session, 'city', 'fuzzy', """
+                    UNWIND $rows AS row
+                    CALL {
+                        WITH row
+                        CALL db.index.fulltext.queryNodes('cityNameIndex', row.query)
+                        YIELD node, score
+                        MATCH (node)-[:IN_STATE]->(state:State)-[:IN_COUNTRY]->(c:Country { iso_code: row.country_code })
+                        RETURN node
+                        ORDER BY score DESC
+                        LIMIT 1
+                    }
+                    RETURN row.idx AS idx, node.city_name AS city_name
+                """, country_rows))
+            else:
+                matches = self._batch(session, 'city', 'exact', """
+                    UNWIND $rows AS row
+                    MATCH (city:City { name_key: row.name_key })-[:IN_STATE]->(state:State { admin1_code: row.admin_code })
+                    WITH row, head(collect(city)) AS city
+                    RETURN row.idx AS idx, city.city_name AS city_name
+                """, state_rows)
+                matches.update(self._batch(session, 'city', 'exact', """
+                    UNWIND $rows AS row
+                    MATCH (city:City { name_key: row.name_key })-[:IN_STATE]->(state:State)-[:IN_COUNTRY]->(c:Country { iso_code: row.country_code })
+                    WITH row, head(collect(city)) AS city
+                    RETURN row.idx AS idx, city.city_name AS city_name
+                """, country_rows))
+        return {cities[i]: record['city_name'] for i, record in matches.items()}
+
+    # Cities matching the name exactly or approximately, with the path above each
+    JOINT_PATHS_QUERY = """
+        UNWIND $rows AS row
+        CALL {
+            WITH row
+            CALL {
+                WITH row
+                MATCH (city:City { name_key: row.city_key })
+                RETURN city
+                UNION
+                WITH row
+                WITH row WHERE row.city_query <> ''
+                CALL db.index.fulltext.queryNodes('cityNameIndex', row.city_query)
+                YIELD node
+                RETURN node AS city
+                LIMIT $limit
+            }
+            MATCH (city)-[:IN_STATE]->(s:State)-[:IN_COUNTRY]->(c:Country)
+            RETURN collect(DISTINCT {
+                city_name: city.city_name, admin_code: s.admin1_code, state_name: s.admin1_name,
+                iso_code: c.iso_code, country_name: c.country_name
+            }) AS paths
+        }
+        RETURN row.idx AS idx, paths
+    """
+
+    def _joint_rows(self, addresses):
+        return [{'idx': i, 'city_key': normalize(city_name), 'city_query': self._fulltext_query(city_name)}
+                for i, (city_name, _, _) in enumerate(addresses)]
+
+    def address_candidates(self, city_name, state_name, country_name):
+        key = (city_name, state_name, country_name)
+        return self.address_candidates_many([key])[key]
+
+    async def resolve_address_async(self, city_name, state_name, country_name):
+        # Same query as address_candidates, on the async driver
+        rows = self._joint_rows([(city_name, state_name, country_name)])
+        async with get_async_driver().session() as session:
+            with GRAPH_QUERY_DURATION.time(stage='joint', kind='paths'):
+                result = await session.run(self.JOINT_PATHS_QUERY, rows=rows, limit=JOINT_CANDIDATES)
+                record = await result.single()
+        paths = [dict(path) for path in record['paths']] if record else []
+        return best_path(paths, city_name, state_name, country_name)
+
+    def address_candidates_many(self, addresses):
+        if not addresses:
+            return {}
+        rows = self._joint_rows(addresses)
+        with get_driver().session() as session:
+            matches = self._batch(session, 'joint', 'paths', self.JOINT_PATHS_QUERY, rows, limit=JOINT_CANDIDATES)
+        return {key: [dict(path) for path in matches[i]['paths']] if i in matches else []
+                for i, key in enumerate(addresses)}
+
+    def city_names_many(self, scopes):
+        scopes = list(scopes)
+        if not scopes:
+            return {}
+        rows = [{'idx': i, 'kind': kind, 'code': code} for i, (kind, code) in enumerate(scopes)]
+        names = {scope: [] for scope in scopes}
+        with get_driver().session() as session:
+            for i, record in self._batch(session, 'city', 'scope', """
+                UNWIND $rows AS row
+                MATCH (city:City)-[:IN_STATE]->(state:State)-[:IN_COUNTRY]->(c:Country)
+                WHERE (row.kind = 'admin' AND state.admin1_code = row.code)
+                   OR (row.kind = 'country' AND c.iso_code = row.code)
+                RETURN row.idx AS idx, collect(DISTINCT city.city_name) AS city_names
+            """, rows).items():
+                names[scopes[i]] = list(record['city_names'])
+        return names
+
+###########################################################################################################################
+
+class ReferenceTables:
+    """
+    MemoryBackend's name-key lookups built as dicts from a Gazetteer and a
+    City_Name,Admin1_Code file. CompactGazetteer answers the same methods
+    from its mapped file.
+    """
+
+    def __init__(self, gazetteer, cities_path=CITIES_CSV):
+        self.gazetteer = gazetteer
+        self.country_names = {}    # name key -> iso_code
+        self.state_names = {}      # iso_code -> {name key -> admin1_code}
+        self.scopes = {}           # scope -> {name key -> city_name}
+        self.city_admins = {}      # name key -> [(city_name, admin1_code)]
+        for iso_code, country in gazetteer.countries.items():
+            self.country_names.setdefault(normalize(country['country_name']), iso_code)
+        for admin_code, state in gazetteer.states.items():
+            self.state_names.setdefault(state['iso_code'], {}).setdefault(normalize(state['state_name']), admin_code)
+        for city_name, admin_code in load_cities(cities_path) if os.path.exists(cities_path) else ():
+            for scope in (('admin', admin_code), ('country', admin_code.partition('.')[0])):
+                self.scopes.setdefault(scope, {}).setdefault(normalize(city_name), city_name)
+            self.city_admins.setdefault(normalize(city_name), []).append((city_name, admin_code))
+
+    def country_by_key(self, name_key):
+        return self.country_names.get(name_key)
+
+    def state_by_key(self, country_code, name_key):
+        return self.state_names.get(country_code, {}).get(name_key)
+
+    def state_codes(self, country_code):
+        return list(self.state_names.get(country_code, {}).values())
+
+    def city_by_key(self, scope, name_key):
+        return self.scopes.get(scope, {}).get(name_key)
+
+    def cities_in(self, scope):
+        return list(self.scopes.get(scope, {}).values())
+
+    def city_paths(self, name_key):
+        return self.city_admins.get(name_key, [])
+
+    def distinct_cities(self):
+        return ((paths[0][0], key) for key, paths in self.city_admins.items())
+
+
+class MemoryBackend(GraphBackend):
+    """
+    Embedded backend answered from import/countries.csv, import/states.csv and
+    a City_Name,Admin1_Code city file, for single-node deployments, tests and
+    benchmarks. Exact lookups are dict hits on the normalized name, or binary
+    searches when the gazetteer is a compact file; fuzzy lookups stand in for
+    full-text search with the trigram index.
+    """
+
+    name = 'memory'
+
+    def __init__(self, cities_path=CITIES_CSV, gazetteer=None):
+        self.gazetteer = gazetteer or get_gazetteer()
+        # A compact gazetteer file carries its own city tables, shared between workers
+        if isinstance(self.gazetteer, CompactGazetteer):
+            self.tables = self.gazetteer
+        else:
+            self.tables = ReferenceTables(self.gazetteer, cities_path)
+        self.country_fuzzy = self.gazetteer.country_fuzzy
+        self.state_fuzzy = {}
+        self.city_fuzzy = {}
+        self.lock = threading.Lock()
+
+    def _fuzzy_index(self, indexes, scope, entries):
+        with self.lock:
+            index = indexes.get(scope)
+            if index is None:
+                index = indexes[scope] = FuzzyIndex(entries())
+            return index
+
+    def find_country(self, country_name, fuzzy=False):
+        if fuzzy:
+            matches = self.country_fuzzy.search(country_name, k=1, min_score=MEMORY_FUZZY_MIN_SCORE)
+            iso_code = matches[0][1] if matches else None
+        else:
+            iso_code = self.tables.country_by_key(normalize(country_name))
+        if iso_code is None:
+            return None, None
+        return iso_code, self.gazetteer.countries[iso_code]['country_name']
+
+    def find_state(self, state_name, country_code, fuzzy=False):
+        if fuzzy:
+            index = self._fuzzy_index(self.state_fuzzy, country_code,
+                                      lambda: ((self.gazetteer.states[code]['state_name'], code)
+                                               for code in self.tables.state_codes(country_code)))
+            matches = index.search(state_name, k=1, min_score=MEMORY_FUZZY_MIN_SCORE)
+            admin_code = matches[0][1] if matches else None
+        else:
+            admin_code = self.tables.state_by_key(country_code, normalize(state_name))
+        if admin_code is None:
+            return None, None
+        return self.gazetteer.states[admin_code]['state_name'], admin_code
+
+    def find_city(self, city_name, country_code, admin_code=None, fuzzy=False):
+        scope = ('admin', admin_code) if admin_code else ('country', country_code)
+        if fuzzy:
+            index = self._fuzzy_index(self.city_fuzzy, scope, lambda: ((name, name) for name in self.tables.cities_in(scope)))
+            matches = index.search(city_name, k=1, min_score=MEMORY_FUZZY_MIN_SCORE)
+            return matches[0][1] if matches else None
+        return self.tables.city_by_key(scope, normalize(city_name))
+
+    def city_names(self, scope):
+        return self.tables.cities_in(scope)
+
+    def _city_index(self):
+        """
+        Fuzzy index over every city name, for joint lookups.
+        """
+        return self._fuzzy_index(self.city_fuzzy, None, self.tables.distinct_cities)
+
+    def warm_up(self):
+        self._city_index()
+
+    async def resolve_address_async(self, city_name, state_name, country_name):
+        # In-memory and quick, so not worth a thread hop
+        return self.resolve_address(city_name, state_name, country_name)
+
+    def address_candidates(self, city_name, state_name, country_name):
+        index = self._city_index()
+        paths = []
+        for _, key in index.search(city_name, k=JOINT_CANDIDATES, min_score=MEMORY_FUZZY_MIN_SCORE):
+            for name, admin_code in self.tables.city_paths(key):
+                state = self.gazetteer.states.get(admin_code)
+                if state is None:
+                    continue
+                paths.append({
+                    'city_name': name, 'admin_code': admin_code, 'state_name': state['state_name'],
+                    'iso_code': state['iso_code'],
+                    'country_name': self.gazetteer.countries[state['iso_code']]['country_name'],
+                })
+        return paths
+
+###########################################################################################################################
+
+BACKENDS = {'neo4j': Neo4jBackend, 'memory': MemoryBackend}
+
+_backend = None
+_lock = threading.Lock()
+
+
+def get_graph_backend():
+    """
+    Return the process-wide graph backend selected by JANITOR_GRAPH_BACKEND.
+    """
+    global _backend
+    with _lock:
+        if _backend is None:
+            if GRAPH_BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown JANITOR_GRAPH_BACKEND '{GRAPH_BACKEND}', expected one of {sorted(BACKENDS)}.")
+            _backend = BACKENDS[GRAPH_BACKEND]()
+        return _backend
+
+
+def set_graph_backend(backend):
+    """
+    Replace the process-wide graph backend, e.g. with a MemoryBackend in tests.
+    """
+    global _backend
+    with _lock:
+        _backend = backend
@@ -0,0 +1,139 @@
+# utils/graph_driver.py
+
+import os
+import time
+import atexit
+import threading
+
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USER = os.getenv("NEO4J_USER")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+
+# Connection pool settings, see the neo4j driver's configuration docs
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", "60"))
+
+_driver = None
+_driver_pid = None
+_driver_created_at = None
+_lock = threading.Lock()
+
+# The async driver used by the ASGI app (see asgi.py); it belongs to the event loop that created it
+_async_driver = None
+_async_driver_pid = None
+
+
+def init_driver():
+    """
+    Create the shared Neo4j driver for this process if it doesn't exist yet.
+
+    The driver is tied to the process that created it, so a forked gunicorn
+    worker builds its own pool instead of sharing the parent's sockets.
+    """
+    global _driver, _driver_pid, _driver_created_at
+    with _lock:
+        if _driver is not None and _driver_pid == os.getpid():
+            return _driver
+        # Imported here so processes that never talk to Neo4j don't pay for it
+        from neo4j import GraphDatabase
+        _driver = GraphDatabase.driver(os.getenv("NEO4J_URI", NEO4J_URI), **_driver_config())
+        _driver_pid = os.getpid()
+        _driver_created_at = time.time()
+        return _driver
+
+
+def get_driver():
+    """
+    Return the shared Neo4j driver, creating it on first use.
+    """
+    if _driver is not None and _driver_pid == os.getpid():
+        return _driver
+    return init_driver()
+
+
+def _driver_config():
+    return dict(
+        auth=(os.getenv("NEO4J_USER", NEO4J_USER), os.getenv("NEO4J_PASSWORD", NEO4J_PASSWORD)),
+        max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+        max_connection_lifetime=NEO4J_MAX_CONNECTION_LIFETIME,
+        connection_acquisition_timeout=NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+    )
+
+
+def get_async_driver():
+    """
+    Return the shared neo4j.AsyncDriver, creating it on first use. It has its
+    own pool, configured like the sync driver's.
+    """
+    global _async_driver, _async_driver_pid
+    with _lock:
+        if _async_driver is None or _async_driver_pid != os.getpid():
+            from neo4j import AsyncGraphDatabase
+            _async_driver = AsyncGraphDatabase.driver(os.getenv("NEO4J_URI", NEO4J_URI), **_driver_config())
+            _async_driver_pid = os.getpid()
+        return _async_driver
+
+
+async def close_async_driver():
+    """
+    Close the shared async driver and its connection pool.
+    """
+    global _async_driver, _async_driver_pid
+    driver = _async_driver if _async_driver_pid == os.getpid() else None
+    _async_driver = None
+    _async_driver_pid = None
+    if driver is not None:
+        await driver.close()
+
+
+def close_driver():
+    """
+    Close the shared Neo4j driver and its connection pool.
+    """
+    global _driver, _driver_pid, _driver_created_at
+    with _lock:
+        if _driver is not None and _driver_pid == os.getpid():
+            _driver.close()
+        _driver = None
+        _driver_pid = None
+        _driver_created_at = None
+
+
+def pool_stats():
+    """
+    Return the pool configuration and per-server connection counts.
+    """
+    stats = {
+        'pid': os.getpid(),
+        'initialized': _driver is not None and _driver_pid == os.getpid(),
+        'async_initialized': _async_driver is not None and _async_driver_pid == os.getpid(),
+        'created_at': _driver_created_at,
+        'max_pool_size': NEO4J_MAX_POOL_SIZE,
+        'max_connection_lifetime': NEO4J_MAX_CONNECTION_LIFETIME,
+        'connection_acquisition_timeout': NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+        'servers': {},
+    }
+    if not stats['initialized']:
+        return stats
+
+    # The driver doesn't expose pool metrics publicly, so read them defensively
+    connections = getattr(getattr(_driver, '_pool', None), 'connections', None) or {}
+    for address, pool in list(connections.items()):
+        pool = list(pool)
+        in_use = sum(1 for connection in pool if getattr(connection, 'in_use', False))
+        stats['servers'][str(address)] = {
+            'in_use': in_use,
+            'idle': len(pool) - in_use,
+        }
+    return stats
+
+
+def init_app(app):
+    """
+    Wire the shared driver into a Flask app. The driver is created on first
+    use (or by utils.warmup before the worker accepts traffic) and closed
+    when the process exits; app.extensions['neo4j_driver'] returns it.
+    """
+    app.extensions['neo4j_driver'] = get_driver
+    atexit.register(close_driver)
@@ -0,0 +1,336 @@
+# utils/kg_loader.py
+#
+# Loads the reference CSVs into Neo4j and creates the schema the cleaner queries:
+#
+#   python -m utils.kg_loader                       # schema + countries, states, cities
+#   python -m utils.kg_loader --chunk-size 5000 --skip-schema
+#   python -m utils.kg_loader --migrate             # schema + name_key and city_id backfill only
+
+import os
+import csv
+import time
+import argparse
+from .gazetteer import COUNTRIES_CSV, STATES_CSV
+from .graph_backend import CITIES_CSV
+from .alias_index import reference_aliases
+from .fuzzy import normalize
+from .graph_driver import get_driver, close_driver
+from .result_cache import bump_graph_version
+
+KG_CHUNK_SIZE = int(os.getenv("JANITOR_KG_CHUNK_SIZE", "1000"))
+
+SCHEMA = [
+    "CREATE CONSTRAINT country_iso_code IF NOT EXISTS FOR (c:Country) REQUIRE c.iso_code IS UNIQUE",
+    "CREATE CONSTRAINT state_admin1_code IF NOT EXISTS FOR (s:State) REQUIRE s.admin1_code IS UNIQUE",
+    "CREATE CONSTRAINT city_id IF NOT EXISTS FOR (c:City) REQUIRE c.city_id IS UNIQUE",
+    "CREATE CONSTRAINT alias_id IF NOT EXISTS FOR (a:Alias) REQUIRE a.alias_id IS UNIQUE",
+    # Range indexes for the exact-match lookups on the normalized name
+    "CREATE INDEX country_name_key IF NOT EXISTS FOR (c:Country) ON (c.name_key)",
+    "CREATE INDEX state_name_key IF NOT EXISTS FOR (s:State) ON (s.name_key)",
+    "CREATE INDEX city_name_key IF NOT EXISTS FOR (c:City) ON (c.name_key)",
+    "CREATE FULLTEXT INDEX countryNameIndex IF NOT EXISTS FOR (c:Country) ON EACH [c.country_name]",
+    "CREATE FULLTEXT INDEX stateNameIndex IF NOT EXISTS FOR (s:State) ON EACH [s.admin1_name]",
+    "CREATE FULLTEXT INDEX cityNameIndex IF NOT EXISTS FOR (c:City) ON EACH [c.city_name]",
+]
+
+MERGE_COUNTRIES = """
+    MERGE (c:Country { iso_code: row.iso_code })
+    SET c.country_name = row.country_name, c.name_key = row.name_key, c.iso3_code = row.iso3_code, c.fips_code = row.fips_code
+"""
+
+MERGE_STATES = """
+    MATCH (c:Country { iso_code: row.iso_code })
+    MERGE (s:State { admin1_code: row.admin1_code })
+    SET s.admin1_name = row.admin1_name, s.name_key = row.name_key, s.admin1_ascii_name = row.admin1_ascii_name
+    MERGE (s)-[:IN_COUNTRY]->(c)
+"""
+
+MERGE_CITIES = """
+    MATCH (s:State { admin1_code: row.admin1_code })
+    MERGE (city:City { city_id: row.admin1_code + '|' + row.city_name })
+    SET city.city_name = row.city_name, city.name_key = row.name_key
+    MERGE (city)-[:IN_STATE]->(s)
+"""
+
+# Rows from alias_index.alias_row; the alias is kept even when its target
+# (e.g. a city the graph doesn't have yet) can't be linked
+MERGE_ALIASES = """
+    MERGE (a:Alias { alias_id: row.alias_id })
+    SET a.kind = row.kind, a.scope = row.scope, a.key = row.key, a.alias = row.alias, a.target = row.target
+    WITH a, row
+    OPTIONAL MATCH (c:Country { iso_code: row.target }) WHERE row.kind = 'country'
+    OPTIONAL MATCH (s:State { admin1_code: row.target }) WHERE row.kind = 'state'
+    OPTIONAL MATCH (city:City { city_id: row.city_id }) WHERE row.kind = 'city'
+    WITH a, coalesce(c, s, city) AS target
+    WHERE target IS NOT NULL
+    MERGE (a)-[:ALIAS_OF]->(target)
+"""
+
+
+class BatchWriter:
+    """
+    Writes rows to Neo4j with one `UNWIND $rows AS row` query per chunk, each
+    chunk in its own explicit write transaction.
+
+    Generated knowledge graph update scripts should use this instead of one
+    session.run(MERGE ...) per row:
+
+        writer = BatchWriter()
+        writer.write('''
+            MERGE (city:City { city_id: row.admin1_code + '|' + row.city_name })
+            SET city.latitude = row.lat, city.longitude = row.lng
+        ''', rows)
+
+    Args:
+        driver: Neo4j driver; defaults to the shared pooled driver.
+        chunk_size (int): Rows per transaction.
+    """
+
+    def __init__(self, driver=None, chunk_size=KG_CHUNK_SIZE):
+        self.driver = driver or get_driver()
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.seconds = 0.0
+
+    @staticmethod
+    def _run_chunk(tx, query, chunk):
+        tx.run(query, rows=chunk).consume()
+
+    def write(self, query, rows):
+        """
+        Run `query` once per chunk of rows, with each row bound to `row`.
+
+        Args:
+            query (str): Cypher body that follows `UNWIND $rows AS row`.
+            rows (iterable): Dicts of query parameters.
+
+        Returns:
+            int: Number of rows written.
+        """
+        query = "UNWIND $rows AS row\n" + query
+        written = 0
+        start = time.perf_counter()
+        with self.driver.session() as session:
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == self.chunk_size:
+                    session.execute_write(self._run_chunk, query, chunk)
+                    written += len(chunk)
+                    chunk = []
+            if chunk:
+                session.execute_write(self._run_chunk, query, chunk)
+                written += len(chunk)
+        self.seconds += time.perf_counter() - start
+        self.rows += written
+        return written
+
+    def merge_countries(self, rows):
+        return self.write(MERGE_COUNTRIES, rows)
+
+    def merge_states(self, rows):
+        return self.write(MERGE_STATES, rows)
+
+    def merge_cities(self, rows):
+        return self.write(MERGE_CITIES, rows)
+
+    def merge_aliases(self, rows):
+        return self.write(MERGE_ALIASES, rows)
+
+    def rate(self):
+        """
+        Returns:
+            float: Rows written per second so far.
+        """
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def create_schema(driver=None):
+    """
+    Create the uniqueness constraints, name_key range indexes and full-text
+    indexes if they don't exist.
+    """
+    with (driver or get_driver()).session() as session:
+        for statement in SCHEMA:
+            session.run(statement).consume()
+
+
+def read_countries(path=COUNTRIES_CSV):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row['ISO_Code'].strip():
+                yield {
+                    'iso_code': row['ISO_Code'].strip(),
+                    'country_name': row['Country_Name'].strip(),
+                    'name_key': normalize(row['Country_Name']),
+                    'iso3_code': row['ISO3_Code'].strip(),
+                    'fips_code': row['FIPS_Code'].strip(),
+                }
+
+
+def read_states(path=STATES_CSV):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            admin1_code = row['Admin1_Code'].strip()
+            iso_code, _, local_code = admin1_code.partition('.')
+            if local_code:
+                yield {
+                    'iso_code': iso_code,
+                    'admin1_code': admin1_code,
+                    'admin1_name': row['Admin1_Name'].strip(),
+                    'name_key': normalize(row['Admin1_Name']),
+                    'admin1_ascii_name': row['Admin1_ASCII_Name'].strip(),
+                }
+
+
+def read_cities(path=CITIES_CSV):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield {
+                'city_name': row['City_Name'].strip(),
+                'name_key': normalize(row['City_Name']),
+                'admin1_code': row['Admin1_Code'].strip(),
+            }
+
+
+def migrate_name_keys(driver=None, chunk_size=KG_CHUNK_SIZE):
+    """
+    Backfill name_key (fuzzy.normalize of the display name) on every Country,
+    State and City node, so exact lookups can use the name_key range indexes
+    instead of comparing toLower() of every candidate. Safe to re-run.
+
+    Returns:
+        dict: label -> nodes updated.
+    """
+    driver = driver or get_driver()
+    report = {}
+    for label, prop in (('Country', 'country_name'), ('State', 'admin1_name'), ('City', 'city_name')):
+        with driver.session() as session:
+            rows = [
+                {'id': record['id'], 'name_key': normalize(record['name'])}
+                for record in session.run(
+                    f"MATCH (n:{label}) WHERE n.{prop} IS NOT NULL RETURN elementId(n) AS id, n.{prop} AS name"
+                )
+            ]
+        report[label] = BatchWriter(driver, chunk_size).write("""
+            MATCH (n) WHERE elementId(n) = row.id
+            SET n.name_key = row.name_key
+        """, rows)
+    bump_graph_version()
+    return report
+
+
+def migrate_city_ids(driver=None, chunk_size=KG_CHUNK_SIZE):
+    """
+    Backfill city_id (admin1_code + '|' + city_name, what MERGE_CITIES keys
+    on) on City nodes created before it existed, from their
+    (:City)-[:IN_STATE]->(:State) path. Without it, loading the CSVs would
+    create a second node for every such city. Safe to re-run.
+
+    Nodes that are in no state or several, or whose city_id another node
+    already has, are left as they are for a manual fix.
+
+    Returns:
+        tuple: (nodes updated, nodes left without a city_id)
+    """
+    driver = driver or get_driver()
+    with driver.session() as session:
+        records = list(session.run("""
+            MATCH (n:City) WHERE n.city_id IS NULL
+            OPTIONAL MATCH (n)-[:IN_STATE]->(s:State)
+            RETURN elementId(n) AS id, coalesce(n.city_name, n.name) AS name, collect(s.admin1_code) AS admin1_codes
+        """))
+    rows = {}
+    for record in records:
+        if record['name'] and len(record['admin1_codes']) == 1:
+            city_id = f"{record['admin1_codes'][0]}|{record['name']}"
+            rows.setdefault(city_id, {'id': record['id'], 'city_id': city_id,
+                                      'city_name': record['name'], 'name_key': normalize(record['name'])})
+    BatchWriter(driver, chunk_size).write("""
+        MATCH (n) WHERE elementId(n) = row.id AND NOT EXISTS { MATCH (:City { city_id: row.city_id }) }
+        SET n.city_id = row.city_id, n.city_name = row.city_name, n.name_key = row.name_key
+    """, list(rows.values()))
+    remaining = unmigrated_cities(driver)
+    bump_graph_version()
+    return len(records) - remaining, remaining
+
+
+def unmigrated_cities(driver=None):
+    """
+    Returns:
+        int: Number of City nodes without a city_id.
+    """
+    with (driver or get_driver()).session() as session:
+        return session.run("MATCH (n:City) WHERE n.city_id IS NULL RETURN count(n) AS count").single()['count']
+
+
+def load(countries_path=COUNTRIES_CSV, states_path=STATES_CSV, cities_path=CITIES_CSV,
+         chunk_size=KG_CHUNK_SIZE, schema=True, driver=None):
+    """
+    Load countries, then states, then cities (each needs its parent loaded),
+    then the aliases implied by the reference data.
+
+    Returns:
+        dict: label -> (rows written, rows per second).
+
+    Raises:
+        RuntimeError: If the graph has City nodes without a city_id, which
+            the load would duplicate; run --migrate first.
+    """
+    unmigrated = unmigrated_cities(driver)
+    if unmigrated:
+        raise RuntimeError(f"{unmigrated} City nodes have no city_id; run `python -m utils.kg_loader --migrate` first")
+    if schema:
+        create_schema(driver)
+    report = {}
+    for label, method, reader, path in (
+        ('countries', 'merge_countries', read_countries, countries_path),
+        ('states', 'merge_states', read_states, states_path),
+        ('cities', 'merge_cities', read_cities, cities_path),
+    ):
+        if not path or not os.path.exists(path):
+            continue
+        writer = BatchWriter(driver, chunk_size)
+        getattr(writer, method)(reader(path))
+        report[label] = (writer.rows, writer.rate())
+    if countries_path and os.path.exists(countries_path):
+        writer = BatchWriter(driver, chunk_size)
+        writer.merge_aliases(reference_aliases(countries_path))
+        report['aliases'] = (writer.rows, writer.rate())
+    bump_graph_version()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load import/*.csv into the Neo4j knowledge graph.")
+    parser.add_argument('--countries', default=COUNTRIES_CSV)
+    parser.add_argument('--states', default=STATES_CSV)
+    parser.add_argument('--cities', default=CITIES_CSV)
+    parser.add_argument('--chunk-size', type=int, default=KG_CHUNK_SIZE, help="Rows per UNWIND transaction.")
+    parser.add_argument('--skip-schema', action='store_true', help="Don't create constraints and indexes.")
+    parser.add_argument('--migrate', action='store_true',
+                        help="Create the schema and backfill name_key and city_id on existing nodes instead of loading the CSVs.")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.migrate:
+            create_schema()
+            for label, count in migrate_name_keys(chunk_size=args.chunk_size).items():
+                print(f"Set name_key on {count} {label} nodes")
+            updated, remaining = migrate_city_ids(chunk_size=args.chunk_size)
+            print(f"Set city_id on {updated} City nodes")
+            if remaining:
+                print(f"{remaining} City nodes are in no state or several, or duplicate another city; "
+                      f"fix them by hand before loading")
+            return
+        report = load(args.countries, args.states, args.cities, chunk_size=args.chunk_size, schema=not args.skip_schema)
+    except RuntimeError as e:
+        parser.error(str(e))
+    finally:
+        close_driver()
+    for label, (rows, rate) in report.items():
+        print(f"Loaded {rows} {label} ({rate:,.0f} rows/sec)")
+
+
+if __name__ == '__main__':
+    main()
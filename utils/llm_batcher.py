@@ -0,0 +1,206 @@
+# utils/llm_batcher.py
+
+import os
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from .llm_client import get_llm, is_timeout, LLMUnavailable
+from .metrics import LLM_DURATION, record_llm_usage
+from .log import get_logger
+
+logger = get_logger('llm_batcher')
+
+# Batching is off (one completion per anomaly) unless the batch size is above 1
+LLM_BATCH_SIZE = int(os.getenv("JANITOR_LLM_BATCH_SIZE", "1"))
+LLM_BATCH_WINDOW = float(os.getenv("JANITOR_LLM_BATCH_WINDOW", "0.05"))
+LLM_BATCH_CONCURRENCY = int(os.getenv("JANITOR_LLM_BATCH_CONCURRENCY", "4"))
+
+CLEANED_FIELDS = ('city', 'state', 'country')
+
+
+def extract_json_array(text):
+    """
+    Extracts the outermost JSON array from a string and parses it.
+    """
+    try:
+        start = text.index('[')
+        end = text.rindex(']') + 1
+        parsed = json.loads(text[start:end])
+    except ValueError as ve:  # json.JSONDecodeError is a ValueError
+        logger.warning("Error extracting JSON array: %s", ve)
+        return None
+    return parsed if isinstance(parsed, list) else None
+
+
+def is_cleaned_data(data):
+    return isinstance(data, dict) and all(isinstance(data.get(field), str) for field in CLEANED_FIELDS)
+
+
+class AnomalyBatcher:
+    """
+    Resolves many anomalies with one chat completion.
+
+    Callers either pass a whole group to resolve_many, or submit single
+    anomalies which are collected for up to `window` seconds or `max_batch`
+    items and then sent together. Every item the model doesn't answer with a
+    well-formed object is retried through `fallback`, the single-anomaly path,
+    unless the batch call timed out or the LLM is unavailable.
+
+    Args:
+        client: Anything with the OpenAI client's chat.completions.create
+            interface, so a local stub can stand in for the API.
+        fallback (callable): anomaly_data -> cleaned data or None.
+    """
+
+    def __init__(self, client, fallback, max_batch=LLM_BATCH_SIZE, window=LLM_BATCH_WINDOW,
+                 concurrency=LLM_BATCH_CONCURRENCY, model="gpt-4o"):
+        self.client = client
+        self.fallback = fallback
+        self.max_batch = max(1, max_batch)
+        self.window = window
+        self.model = model
+        self.queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='janitor-llm-batch')
+        self.collector = None
+        self.lock = threading.Lock()
+        self.counters = {'batches': 0, 'batched_items': 0, 'fallbacks': 0}
+
+    def submit(self, anomaly_data):
+        """
+        Queue one anomaly for the next batch.
+
+        Returns:
+            Future: Resolves to the cleaned data, or None.
+        """
+        with self.lock:
+            if self.collector is None:
+                self.collector = threading.Thread(target=self._collect, name='janitor-llm-batcher', daemon=True)
+                self.collector.start()
+        future = Future()
+        self.queue.put((anomaly_data, future))
+        return future
+
+    def _collect(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        try:
+            results = self.resolve_many([anomaly_data for anomaly_data, _ in batch])
+        except Exception as e:
+            logger.error("Error in batched anomaly resolution: %s", e)
+            results = [None] * len(batch)
+        for (_, future), cleaned_data in zip(batch, results):
+            future.set_result(cleaned_data)
+
+    def resolve_many(self, anomalies):
+        """
+        Resolve a list of anomalies, max_batch per completion.
+
+        Returns:
+            list: Cleaned data (or None) for each anomaly, in order.
+        """
+        results = []
+        for start in range(0, len(anomalies), self.max_batch):
+            chunk = anomalies[start:start + self.max_batch]
+            try:
+                answers = self._complete_batch(chunk) if len(chunk) > 1 else {}
+            except Exception as e:
+                # The LLM is unavailable or the deadline passed waiting for it;
+                # one call per item now would only wait again
+                logger.warning("Not resolving %d anomalies one by one: %s", len(chunk), e)
+                results.extend([None] * len(chunk))
+                continue
+            for i, anomaly_data in enumerate(chunk):
+                cleaned_data = answers.get(i)
+                if not is_cleaned_data(cleaned_data):
+                    with self.lock:
+                        self.counters['fallbacks'] += 1
+                    cleaned_data = self.fallback(anomaly_data)
+                results.append(cleaned_data)
+        return results
+
+    def _complete_batch(self, anomalies):
+        """
+        Send one structured prompt for several anomalies.
+
+        Returns:
+            dict: index -> parsed object for every item the model answered.
+
+        Raises:
+            LLMUnavailable: If the call was rejected or timed out, and the
+            provider's own timeout error likewise.
+        """
+        records = [
+            {
+                'id': i,
+                'city': anomaly_data['city_input'],
+                'state': anomaly_data['state_input'],
+                'country': anomaly_data['country_input']
+            }
+            for i, anomaly_data in enumerate(anomalies)
+        ]
+        prompt = f"""
+                        You are an AI assistant helping to clean address data.
+
+                        The system couldn't process the following address records. Each record has an id and the
+                        city, state and country fields the user entered. For each record, determine what the user
+                        might have meant. If some fields are valid, infer the invalid ones from them as they are all
+                        related; the invalid field itself may also contain information that helps.
+
+                        Records:
+                        {json.dumps(records, ensure_ascii=False)}
+
+                        Provide only a JSON array with exactly one object per record, in any order, of the form:
+                        [
+                            {{"id": 0, "city": "cleaned city name", "state": "cleaned state name", "country": "cleaned country name"}}
+                        ]
+
+                        """
+        with self.lock:
+            self.counters['batches'] += 1
+            self.counters['batched_items'] += len(anomalies)
+        try:
+            with LLM_DURATION.time(operation='clean_batch'):
+                response = get_llm().call(
+                    'clean_batch', self.client.chat.completions.create,
+                    model=self.model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.0,
+                )
+            record_llm_usage('clean_batch', response)
+            raw_content = response.choices[0].message.content.strip()
+        except Exception as e:
+            logger.error("Error in batched analyze_and_clean_data: %s", e)
+            if isinstance(e, LLMUnavailable) or is_timeout(e):
+                raise
+            return {}
+
+        answers = {}
+        for item in extract_json_array(raw_content) or []:
+            if isinstance(item, dict) and isinstance(item.get('id'), int) and 0 <= item['id'] < len(anomalies):
+                answers[item['id']] = {field: item.get(field) for field in CLEANED_FIELDS}
+        return answers
+
+    def stats(self):
+        with self.lock:
+            return {
+                'max_batch': self.max_batch,
+                'window': self.window,
+                'pending': self.queue.qsize(),
+                **self.counters,
+            }
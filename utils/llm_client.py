@@ -0,0 +1,357 @@
+# utils/llm_client.py
+#
+# Every chat completion CeeyMore and the anomaly batcher make goes through
+# get_llm().call (or call_async). The layer bounds each call with a
+# deadline, caps the calls in flight per process, retries transient
+# failures with jittered backoff within a retry budget, and opens a circuit
+# breaker after repeated failures. While the circuit is open the cleaner
+# answers anomalies with its graph/fuzzy result instead of escalating (see
+# address_cleaner._escalate), so a slow provider can't tie up every worker.
+
+import os
+import time
+import random
+import asyncio
+import threading
+from .metrics import LLM_CALLS, LLM_IN_FLIGHT, LLM_CIRCUIT_STATE
+from .log import get_logger
+
+logger = get_logger('llm_client')
+
+# Deadline (seconds) for an anomaly resolution, retries included, and for
+# the background update generation calls, which produce whole files
+LLM_TIMEOUT = float(os.getenv("JANITOR_LLM_TIMEOUT", "20"))
+LLM_UPDATE_TIMEOUT = float(os.getenv("JANITOR_LLM_UPDATE_TIMEOUT", "120"))
+# LLM calls in flight per worker process
+LLM_CONCURRENCY = int(os.getenv("JANITOR_LLM_CONCURRENCY", "8"))
+# Retries per call, with full-jitter exponential backoff from LLM_RETRY_BASE_DELAY
+LLM_MAX_RETRIES = int(os.getenv("JANITOR_LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("JANITOR_LLM_RETRY_BASE_DELAY", "0.25"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("JANITOR_LLM_RETRY_MAX_DELAY", "4"))
+# Retry budget: each call earns LLM_RETRY_RATIO retry tokens, up to
+# LLM_RETRY_BURST, and each retry spends one, so retries stay a bounded
+# fraction of traffic when the provider is failing
+LLM_RETRY_RATIO = float(os.getenv("JANITOR_LLM_RETRY_RATIO", "0.2"))
+LLM_RETRY_BURST = float(os.getenv("JANITOR_LLM_RETRY_BURST", "10"))
+# The circuit opens after this many consecutive failed calls and lets a
+# probe call through after LLM_BREAKER_COOLDOWN seconds
+LLM_BREAKER_FAILURES = int(os.getenv("JANITOR_LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("JANITOR_LLM_BREAKER_COOLDOWN", "30"))
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class LLMUnavailable(Exception):
+    """
+    The call was not made or did not complete: the circuit is open, no
+    concurrency slot freed up, the deadline passed, or the retries ran out.
+    """
+
+
+class CircuitOpen(LLMUnavailable):
+    pass
+
+
+def is_retryable(error):
+    """
+    Timeouts, connection errors, rate limiting and server errors are worth
+    retrying; other client errors (bad request, authentication) are not.
+    """
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        return True
+    return status in (408, 409, 429) or status >= 500
+
+
+def is_timeout(error):
+    return isinstance(error, TimeoutError) or 'timeout' in type(error).__name__.lower()
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker. Closed, it lets every call through;
+    after `failures` consecutive failures it opens and rejects calls for
+    `cooldown` seconds, then half-opens and lets a single probe through,
+    closing again if the probe succeeds.
+    """
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.counters = {'opened': 0}
+        LLM_CIRCUIT_STATE.set(0)
+
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning("LLM circuit %s -> %s", self.state, state)
+        self.state = state
+        LLM_CIRCUIT_STATE.set(_STATE_VALUES[state])
+
+    def available(self):
+        """
+        Whether a call would be let through now, without claiming the probe.
+        """
+        with self.lock:
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= self.cooldown
+            return not (self.state == HALF_OPEN and self.probing)
+
+    def allow(self):
+        """
+        Claim permission for one call.
+        """
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self._set_state(HALF_OPEN)
+                self.probing = False
+            if self.state == HALF_OPEN:
+                if self.probing:
+                    return False
+                self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.probing = False
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failures:
+                if self.state != OPEN:
+                    self.counters['opened'] += 1
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release(self):
+        """
+        Give the probe back without a verdict, e.g. on a non-retryable client error.
+        """
+        with self.lock:
+            self.probing = False
+
+
+class LLMCaller:
+    """
+    Deadlines, a concurrency limit, retries and circuit breaking around
+    chat.completions.create-style callables, for both the sync client and
+    AsyncOpenAI. The callable gets the remaining time as `timeout`, which the
+    OpenAI clients enforce per request; async calls are also cancelled at
+    the deadline.
+    """
+
+    def __init__(self, concurrency=LLM_CONCURRENCY, timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                 base_delay=LLM_RETRY_BASE_DELAY, max_delay=LLM_RETRY_MAX_DELAY, retry_ratio=LLM_RETRY_RATIO,
+                 retry_burst=LLM_RETRY_BURST, breaker=None, seed=None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_ratio = retry_ratio
+        self.retry_burst = retry_burst
+        self.retry_tokens = retry_burst
+        self.breaker = breaker or CircuitBreaker()
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {'calls': 0, 'ok': 0, 'failed': 0, 'retries': 0, 'timeouts': 0, 'rejected': 0, 'circuit_open': 0}
+
+    def available(self):
+        """
+        False while the circuit is open; callers should degrade instead of calling.
+        """
+        return self.breaker.available()
+
+    def _count(self, operation, outcome, counter=None):
+        LLM_CALLS.inc(operation=operation, outcome=outcome)
+        if counter:
+            with self.lock:
+                self.counters[counter] += 1
+
+    def _start(self, operation, timeout):
+        with self.lock:
+            self.counters['calls'] += 1
+            self.retry_tokens = min(self.retry_burst, self.retry_tokens + self.retry_ratio)
+        if not self.breaker.allow():
+            self._count(operation, 'circuit_open', 'circuit_open')
+            raise CircuitOpen(f"LLM circuit is open, not calling {operation}")
+        return time.monotonic() + (self.timeout if timeout is None else timeout)
+
+    def _backoff(self, operation, attempt, error, deadline):
+        """
+        Decide whether to retry after a failed attempt.
+
+        Returns:
+            float: Seconds to sleep before retrying, or None to give up.
+        """
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = self.random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            return None
+        with self.lock:
+            if self.retry_tokens < 1:
+                logger.info("LLM retry budget exhausted, not retrying %s", operation)
+                return None
+            self.retry_tokens -= 1
+        self._count(operation, 'retry', 'retries')
+        return delay
+
+    def _finish(self, operation, error):
+        if error is None:
+            self.breaker.record_success()
+            self._count(operation, 'ok', 'ok')
+            return
+        if isinstance(error, LLMUnavailable):
+            # No free slot in this worker says nothing about the provider
+            self.breaker.release()
+        elif is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+        # Rejections were counted when they happened
+        if not isinstance(error, LLMUnavailable):
+            timed_out = is_timeout(error)
+            self._count(operation, 'timeout' if timed_out else 'error', 'timeouts' if timed_out else 'failed')
+
+    def _end(self, operation, error, interrupted):
+        if interrupted:
+            # Cancelled or interrupted: give a half-open probe back without a verdict
+            self.breaker.release()
+        else:
+            self._finish(operation, error)
+
+    def call(self, operation, create, timeout=None, **request):
+        """
+        Call create(**request, timeout=<remaining seconds>) under the deadline,
+        concurrency limit, retry policy and circuit breaker.
+
+        Args:
+            operation (str): Label for metrics, e.g. 'clean' or 'code_update'.
+            create (callable): e.g. client.chat.completions.create.
+            timeout (float): Deadline in seconds for all attempts; LLM_TIMEOUT by default.
+
+        Returns:
+            The response.
+
+        Raises:
+            LLMUnavailable: If the call was rejected or timed out; otherwise
+            the last attempt's error.
+        """
+        deadline = self._start(operation, timeout)
+        error = None
+        interrupted = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.slots.acquire(timeout=remaining):
+                    self._count(operation, 'rejected', 'rejected')
+                    error = LLMUnavailable(f"No LLM slot for {operation} before the deadline")
+                    raise error
+                LLM_IN_FLIGHT.inc()
+                try:
+                    response = create(**request, timeout=max(0.001, deadline - time.monotonic()))
+                    error = None
+                    return response
+                except Exception as e:
+                    error = e
+                finally:
+                    LLM_IN_FLIGHT.dec()
+                    self.slots.release()
+                delay = self._backoff(operation, attempt, error, deadline)
+                if delay is None:
+                    break
+                time.sleep(delay)
+            raise error
+        except BaseException as e:
+            if not isinstance(e, Exception):
+                interrupted = True
+            raise
+        finally:
+            self._end(operation, error, interrupted)
+
+    async def call_async(self, operation, create, timeout=None, **request):
+        """
+        call() for coroutine callables such as AsyncOpenAI's create. Waiting
+        for a slot doesn't block the event loop, and each attempt is cancelled
+        at the deadline.
+        """
+        deadline = self._start(operation, timeout)
+        error = None
+        interrupted = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                # Poll for a slot, like singleflight.async_file_lock, so the
+                # semaphore stays shared with the sync callers
+                while not self.slots.acquire(blocking=False):
+                    if time.monotonic() >= deadline:
+                        self._count(operation, 'rejected', 'rejected')
+                        error = LLMUnavailable(f"No LLM slot for {operation} before the deadline")
+                        raise error
+                    await asyncio.sleep(0.01)
+                LLM_IN_FLIGHT.inc()
+                try:
+                    remaining = max(0.001, deadline - time.monotonic())
+                    response = await asyncio.wait_for(create(**request, timeout=remaining), remaining)
+                    error = None
+                    return response
+                except asyncio.TimeoutError:
+                    error = TimeoutError(f"{operation} timed out")
+                except Exception as e:
+                    error = e
+                finally:
+                    LLM_IN_FLIGHT.dec()
+                    self.slots.release()
+                delay = self._backoff(operation, attempt, error, deadline)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+            raise error
+        except BaseException as e:
+            # Cancellation is a BaseException, and not the provider's doing
+            if not isinstance(e, Exception):
+                interrupted = True
+            raise
+        finally:
+            self._end(operation, error, interrupted)
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            retry_tokens = self.retry_tokens
+        return {
+            'state': self.breaker.state,
+            'concurrency': self.concurrency,
+            'timeout': self.timeout,
+            'retry_tokens': round(retry_tokens, 2),
+            'circuit_opened': self.breaker.counters['opened'],
+            **counters,
+        }
+
+
+_llm = None
+_lock = threading.Lock()
+
+
+def get_llm():
+    """
+    Return the process-wide LLM call layer.
+    """
+    global _llm
+    if _llm is None:
+        with _lock:
+            if _llm is None:
+                _llm = LLMCaller()
+    return _llm
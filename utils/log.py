@@ -0,0 +1,60 @@
+# utils/log.py
+
+import os
+import sys
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("JANITOR_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"
+
+_listener = None
+_queue = None
+_handler = None
+
+
+def _start_listener():
+    global _listener
+    _listener = QueueListener(_queue, _handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _configure():
+    """
+    Route every 'janitor' logger through an in-memory queue to a background
+    thread that writes to stderr, so request threads never block on output.
+    """
+    global _queue, _handler
+    root = logging.getLogger('janitor')
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+    _queue = queue.SimpleQueue()
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _start_listener()
+    atexit.register(_stop_listener)
+    # Threads don't survive a fork, so a forked child (e.g. a gunicorn worker
+    # of a master that logged) would queue records nobody writes. Drain and
+    # stop the listener before forking, so no lock is held mid-write, and
+    # start one on each side afterwards.
+    os.register_at_fork(before=_stop_listener, after_in_parent=_start_listener, after_in_child=_start_listener)
+    root.addHandler(QueueHandler(_queue))
+
+
+def get_logger(name):
+    """
+    Return a leveled, non-blocking logger under the 'janitor' namespace.
+    """
+    if _queue is None:
+        _configure()
+    return logging.getLogger(f"janitor.{name}")
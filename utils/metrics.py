@@ -0,0 +1,212 @@
+# utils/metrics.py
+
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond lookups to multi-second LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count, optionally split by labels.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down, optionally split by labels.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed durations (seconds) in cumulative buckets.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels):
+        """
+        Decorator that observes the duration of every call.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        with self.lock:
+            items = sorted((key, list(series)) for key, series in self.values.items())
+        lines = []
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', repr(float(bound)))])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Metrics are per worker process; Prometheus aggregates across workers when scraping each one
+
+STAGE_DURATION = registry.register(Histogram(
+    'janitor_stage_duration_seconds', "Time spent in each cleaning stage.", ['stage']))
+GRAPH_QUERY_DURATION = registry.register(Histogram(
+    'janitor_graph_query_duration_seconds', "Time spent in each Neo4j query, by stage and match kind.", ['stage', 'kind']))
+MATCHES = registry.register(Counter(
+    'janitor_matches_total', "Lookup outcomes by stage, match kind and where it was answered.", ['stage', 'match', 'source']))
+ANOMALY_ESCALATIONS = registry.register(Counter(
+    'janitor_anomaly_escalations_total', "Addresses delegated to CeeyMore."))
+ALIASES_LEARNED = registry.register(Counter(
+    'janitor_aliases_learned_total', "Aliases learned from resolved anomalies, by kind.", ['kind']))
+CACHE_ERRORS = registry.register(Counter(
+    'janitor_cache_errors_total', "Result cache reads and writes that failed and were treated as a miss or skipped.", ['operation']))
+EVENTS = registry.register(Counter(
+    'janitor_events_total', "Event log entries, by outcome (written, dropped or failed).", ['outcome']))
+LLM_DURATION = registry.register(Histogram(
+    'janitor_llm_duration_seconds', "Time spent in each CeeyMore LLM operation.", ['operation']))
+LLM_TOKENS = registry.register(Counter(
+    'janitor_llm_tokens_total', "LLM tokens used, by operation and token type.", ['operation', 'type']))
+
+
+LLM_CALLS = registry.register(Counter(
+    'janitor_llm_calls_total', "LLM call attempts by operation and outcome (ok, error, timeout, retry, rejected, circuit_open).",
+    ['operation', 'outcome']))
+LLM_IN_FLIGHT = registry.register(Gauge(
+    'janitor_llm_in_flight', "LLM calls currently holding a concurrency slot."))
+LLM_CIRCUIT_STATE = registry.register(Gauge(
+    'janitor_llm_circuit_state', "LLM circuit breaker state: 0 closed, 1 half-open, 2 open."))
+DEGRADED = registry.register(Counter(
+    'janitor_degraded_total', "Anomalies answered with the graph/fuzzy result because the LLM circuit was open."))
+
+
+def record_llm_usage(operation, response):
+    """
+    Count the prompt and completion tokens of a chat completion response.
+    """
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, 'prompt_tokens', 0) or 0, operation=operation, type='prompt')
+    LLM_TOKENS.inc(getattr(usage, 'completion_tokens', 0) or 0, operation=operation, type='completion')
@@ -0,0 +1,13 @@
+# utils/paths.py
+#
+# Default locations of the files the cleaner shares between processes. They
+# are anchored to the repository, not the working directory, so a KG update
+# or `python -m utils.kg_loader` run from elsewhere bumps the same graph
+# version file and takes the same locks as the web workers.
+
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_DIR = os.path.join(ROOT_DIR, 'import')
+# Generated updates, the anomaly store, caches, locks and the event log
+TEMP_UPDATES_DIR = os.getenv("JANITOR_TEMP_UPDATES_DIR", os.path.join(ROOT_DIR, 'temp_updates'))
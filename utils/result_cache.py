@@ -0,0 +1,290 @@
+# utils/result_cache.py
+
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from .paths import TEMP_UPDATES_DIR
+from .metrics import CACHE_ERRORS
+from .log import get_logger
+
+logger = get_logger('result_cache')
+
+CACHE_BACKEND = os.getenv("JANITOR_CACHE_BACKEND", "memory")  # memory, sqlite or none
+CACHE_SIZE = int(os.getenv("JANITOR_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("JANITOR_CACHE_TTL", "86400"))
+CACHE_PATH = os.getenv("JANITOR_CACHE_PATH", os.path.join(TEMP_UPDATES_DIR, 'result_cache.sqlite3'))
+# A hit refreshes the entry's LRU position only if it was last refreshed longer ago than this (seconds)
+CACHE_TOUCH_INTERVAL = float(os.getenv("JANITOR_CACHE_TOUCH_INTERVAL", "60"))
+GRAPH_VERSION_FILE = os.getenv("JANITOR_GRAPH_VERSION_FILE", os.path.join(TEMP_UPDATES_DIR, 'graph_version'))
+
+# How often (seconds) the graph version file is re-checked
+GRAPH_VERSION_CHECK_INTERVAL = 1.0
+
+
+def normalize_key(city, state, country):
+    """
+    Build the cache key for an address triple: case-folded, whitespace-collapsed.
+    """
+    return '|'.join(' '.join((value or '').split()).casefold() for value in (city, state, country))
+
+###########################################################################################################################
+
+_graph_version = None
+_graph_version_checked_at = 0.0
+
+
+def graph_version():
+    """
+    Return the current knowledge graph version token, re-reading the version
+    file at most once per GRAPH_VERSION_CHECK_INTERVAL.
+    """
+    global _graph_version, _graph_version_checked_at
+    now = time.monotonic()
+    if _graph_version is None or now - _graph_version_checked_at >= GRAPH_VERSION_CHECK_INTERVAL:
+        try:
+            with open(GRAPH_VERSION_FILE, 'r', encoding='utf-8') as f:
+                _graph_version = f.read().strip() or '0'
+        except FileNotFoundError:
+            _graph_version = '0'
+        _graph_version_checked_at = now
+    return _graph_version
+
+
+def bump_graph_version():
+    """
+    Mark the knowledge graph as updated, invalidating every cached result in
+    every worker. Call this after a knowledge graph update (e.g. kg_update.py).
+    """
+    global _graph_version, _graph_version_checked_at
+    version = uuid.uuid4().hex
+    os.makedirs(os.path.dirname(GRAPH_VERSION_FILE), exist_ok=True)
+    temp_path = f"{GRAPH_VERSION_FILE}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(temp_path, GRAPH_VERSION_FILE)
+    _graph_version = version
+    _graph_version_checked_at = time.monotonic()
+    return version
+
+###########################################################################################################################
+
+class MemoryBackend:
+    """
+    Per-process LRU cache with a TTL on every entry.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, version, value)
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, entry_version, value = entry
+            if entry_version != version or expires_at < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, version, value):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteBackend:
+    """
+    LRU+TTL cache in a local SQLite file, shared by every worker on the host.
+
+    Recency is approximate: a hit only writes its accessed_at when the stored
+    one is more than CACHE_TOUCH_INTERVAL old, so hot keys don't cost a write
+    per request. A failing read is a miss and a failing write is skipped, so
+    a locked or broken cache file slows requests down without failing them.
+    """
+
+    # Evict at most once every this many writes to keep sets cheap
+    EVICT_EVERY = 100
+
+    def __init__(self, max_size, ttl, path=CACHE_PATH, touch_interval=CACHE_TOUCH_INTERVAL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.touch_interval = touch_interval
+        self.local = threading.local()
+        self.writes = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    key TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS result_cache_accessed ON result_cache (accessed_at)")
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key, version):
+        try:
+            conn = self._connection()
+            now = time.time()
+            row = conn.execute(
+                "SELECT value, accessed_at FROM result_cache WHERE key = ? AND version = ? AND expires_at >= ?",
+                (key, version, now)
+            ).fetchone()
+            if row is None:
+                return None
+            value, accessed_at = row
+            if now - accessed_at >= self.touch_interval:
+                with conn:
+                    conn.execute("UPDATE result_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return json.loads(value)
+        except (sqlite3.Error, ValueError):
+            CACHE_ERRORS.inc(operation='get')
+            logger.warning("Result cache read failed; treating it as a miss", exc_info=True)
+            return None
+
+    def set(self, key, version, value):
+        try:
+            conn = self._connection()
+            now = time.time()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO result_cache (key, version, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, version, json.dumps(value), now + self.ttl, now)
+                )
+                self.writes += 1
+                if self.writes % self.EVICT_EVERY == 0:
+                    conn.execute("DELETE FROM result_cache WHERE version != ? OR expires_at < ?", (version, now))
+                    conn.execute("""
+                        DELETE FROM result_cache WHERE key IN (
+                            SELECT key FROM result_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                        )
+                    """, (self.max_size,))
+        except sqlite3.Error:
+            CACHE_ERRORS.inc(operation='set')
+            logger.warning("Result cache write failed; not caching the result", exc_info=True)
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM result_cache")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+
+###########################################################################################################################
+
+class ResultCache:
+    """
+    Memoizes cleaned results keyed on the normalized (city, state, country)
+    triple. Entries expire after a TTL, are evicted least-recently-used, and
+    are ignored once the knowledge graph version changes.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.version = graph_version()
+
+    def _current_version(self):
+        version = graph_version()
+        if version != self.version:
+            # The graph changed underneath us; drop everything at once
+            self.version = version
+            if isinstance(self.backend, MemoryBackend):
+                self.backend.clear()
+        return version
+
+    def get(self, city, state, country):
+        if self.backend is None:
+            return None
+        value = self.backend.get(normalize_key(city, state, country), self._current_version())
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def get_async(self, city, state, country):
+        """
+        get for the async request path: the SQLite backend is read on a
+        worker thread, the in-memory one directly.
+        """
+        if isinstance(self.backend, SQLiteBackend):
+            return await asyncio.to_thread(self.get, city, state, country)
+        return self.get(city, state, country)
+
+    def set(self, city, state, country, value):
+        if self.backend is None:
+            return
+        self.backend.set(normalize_key(city, state, country), self._current_version(), value)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        return {
+            'backend': CACHE_BACKEND,
+            'size': len(self.backend) if self.backend is not None else 0,
+            'max_size': CACHE_SIZE,
+            'ttl': CACHE_TTL,
+            'graph_version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+def create_cache(backend=CACHE_BACKEND, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+    """
+    Build a ResultCache for the configured backend ('memory', 'sqlite' or 'none').
+    """
+    if backend == 'sqlite':
+        return ResultCache(SQLiteBackend(max_size, ttl))
+    if backend == 'none':
+        return ResultCache(None)
+    return ResultCache(MemoryBackend(max_size, ttl))
+
+
+result_cache = create_cache()
+
+
+if __name__ == '__main__':
+    # python -m utils.result_cache bump
+    if sys.argv[1:] == ['bump']:
+        print(f"Graph version is now {bump_graph_version()}")
+    else:
+        print("Usage: python -m utils.result_cache bump")
@@ -0,0 +1,146 @@
+# utils/singleflight.py
+
+import os
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager, asynccontextmanager, ExitStack
+from .paths import TEMP_UPDATES_DIR
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; cross-process locking is skipped there
+    fcntl = None
+
+LOCK_DIR = os.getenv("JANITOR_LOCK_DIR", os.path.join(TEMP_UPDATES_DIR, 'locks'))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the
+    function and every caller that arrives while it is in flight waits for and
+    receives the same result (or exception).
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self.calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.calls)
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines running on one event loop.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.coalesced = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        call = self.calls.get(key)
+        if call is not None:
+            self.coalesced += 1
+            # Shielded so a cancelled waiter doesn't cancel the shared call
+            return await asyncio.shield(call)
+
+        call = self.calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                call.set_exception(e)
+                call.exception()  # Retrieved here, so an unawaited call doesn't log a warning
+            else:
+                call.cancel()
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            del self.calls[key]
+        return result
+
+    def in_flight(self):
+        return len(self.calls)
+
+
+@contextmanager
+def file_lock(name, blocking=True):
+    """
+    Exclusive lock shared by every process on the host, backed by flock(2) on a
+    file under LOCK_DIR.
+
+    Yields:
+        bool: True if the lock is held, False if blocking=False and another
+        process already holds it.
+    """
+    if fcntl is None:
+        yield True
+        return
+
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    with open(os.path.join(LOCK_DIR, f"{digest}.lock"), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@asynccontextmanager
+async def async_file_lock(name, poll_interval=0.05):
+    """
+    file_lock for coroutines: polls for the lock instead of blocking the
+    event loop while another process holds it.
+    """
+    while True:
+        with ExitStack() as stack:
+            if stack.enter_context(file_lock(name, blocking=False)):
+                yield True
+                return
+        await asyncio.sleep(poll_interval)
@@ -0,0 +1,167 @@
+# utils/update_worker.py
+
+import os
+import time
+import queue
+import atexit
+import threading
+from collections import OrderedDict
+from .log import get_logger
+
+logger = get_logger('update_worker')
+
+UPDATE_WORKERS = int(os.getenv("JANITOR_UPDATE_WORKERS", "1"))
+UPDATE_QUEUE_SIZE = int(os.getenv("JANITOR_UPDATE_QUEUE_SIZE", "100"))
+# Seconds a request may wait for queue space before the job is rejected (0 = never wait)
+UPDATE_SUBMIT_TIMEOUT = float(os.getenv("JANITOR_UPDATE_SUBMIT_TIMEOUT", "0"))
+# Number of finished jobs kept for the status endpoint
+UPDATE_HISTORY_SIZE = 1000
+
+
+class UpdateWorker:
+    """
+    Bounded background queue for CeeyMore's knowledge graph and code update
+    generation, so anomalous requests return as soon as the cleaned data is known.
+
+    Jobs are de-duplicated by key: submitting a key that is already queued,
+    running or finished is a no-op. When the queue is full, submit waits up to
+    `submit_timeout` seconds and then rejects the job.
+    """
+
+    def __init__(self, num_workers=UPDATE_WORKERS, max_queue=UPDATE_QUEUE_SIZE, submit_timeout=UPDATE_SUBMIT_TIMEOUT):
+        self.num_workers = num_workers
+        self.submit_timeout = submit_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.jobs = OrderedDict()  # key -> status dict
+        self.lock = threading.Lock()
+        self.counters = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, 'succeeded': 0, 'failed': 0}
+        self.threads = []
+        self.stopping = False
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            self.stopping = False
+            for i in range(self.num_workers):
+                thread = threading.Thread(target=self._run, name=f"janitor-update-worker-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Enqueue func(*args, **kwargs) under a de-duplication key.
+
+        Returns:
+            str: 'queued', 'duplicate' or 'rejected'.
+        """
+        self.start()
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job['state'] != 'failed':
+                self.counters['deduplicated'] += 1
+                return 'duplicate'
+            job = {'state': 'queued', 'submitted_at': time.time(), 'started_at': None, 'finished_at': None, 'error': None}
+            self.jobs[key] = job
+            self.jobs.move_to_end(key)
+
+        try:
+            if self.submit_timeout > 0:
+                self.queue.put((key, job, func, args, kwargs), timeout=self.submit_timeout)
+            else:
+                self.queue.put_nowait((key, job, func, args, kwargs))
+        except queue.Full:
+            with self.lock:
+                job['state'] = 'rejected'
+                self.jobs.pop(key, None)
+                self.counters['rejected'] += 1
+            logger.warning("Update queue is full, dropping update job for '%s'.", key)
+            return 'rejected'
+
+        with self.lock:
+            self.counters['submitted'] += 1
+        return 'queued'
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            key, job, func, args, kwargs = item
+            job['state'] = 'running'
+            job['started_at'] = time.time()
+            try:
+                func(*args, **kwargs)
+                job['state'] = 'succeeded'
+                with self.lock:
+                    self.counters['succeeded'] += 1
+            except Exception as e:
+                logger.error("Error in update job for '%s': %s", key, e)
+                job['state'] = 'failed'
+                job['error'] = str(e)
+                with self.lock:
+                    self.counters['failed'] += 1
+            finally:
+                job['finished_at'] = time.time()
+                self._trim_history()
+                self.queue.task_done()
+
+    def _trim_history(self):
+        with self.lock:
+            finished = [key for key, job in self.jobs.items() if job['finished_at'] is not None]
+            for key in finished[:max(0, len(finished) - UPDATE_HISTORY_SIZE)]:
+                del self.jobs[key]
+
+    def shutdown(self, timeout=None):
+        """
+        Let queued jobs finish, then stop the worker threads, waiting at most
+        `timeout` seconds in all.
+        """
+        with self.lock:
+            threads, self.threads = self.threads, []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _ in threads:
+            try:
+                # A full queue must not hold up shutdown past the deadline
+                self.queue.put(None, timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+            except queue.Full:
+                logger.warning("Update queue still full at shutdown, abandoning %d queued jobs.", self.queue.qsize())
+                return
+        for thread in threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+
+    def job_status(self, key):
+        with self.lock:
+            job = self.jobs.get(key)
+            return dict(job) if job else None
+
+    def status(self):
+        with self.lock:
+            states = {}
+            for job in self.jobs.values():
+                states[job['state']] = states.get(job['state'], 0) + 1
+            return {
+                'workers': len(self.threads),
+                'queue_size': self.queue.qsize(),
+                'queue_capacity': self.queue.maxsize,
+                'jobs': states,
+                **self.counters,
+            }
+
+
+_update_worker = None
+_update_worker_lock = threading.Lock()
+
+
+def get_update_worker():
+    """
+    Return the process-wide update worker, starting it on first use.
+    """
+    global _update_worker
+    with _update_worker_lock:
+        if _update_worker is None:
+            _update_worker = UpdateWorker()
+            _update_worker.start()
+            atexit.register(_update_worker.shutdown, 30)
+        return _update_worker
@@ -0,0 +1,80 @@
+# utils/warmup.py
+#
+# Everything the cleaner builds lazily on first use, built up front. Run from
+# gunicorn's post_worker_init when JANITOR_WARMUP is set, so the first
+# requests a worker serves don't pay for index builds, connection setup or
+# the openai import.
+
+import os
+import time
+from .log import get_logger
+
+logger = get_logger('warmup')
+
+WARMUP = os.getenv("JANITOR_WARMUP", "0").lower() in ('1', 'true', 'yes')
+# Also create the OpenAI clients (and import openai) during warm-up
+WARMUP_LLM = os.getenv("JANITOR_WARMUP_LLM", "1").lower() in ('1', 'true', 'yes')
+
+
+def _warm_gazetteer():
+    from .gazetteer import get_gazetteer
+    gazetteer = get_gazetteer()
+    for iso_code in gazetteer.countries:
+        gazetteer.state_fuzzy.get(iso_code)
+
+
+def _warm_graph():
+    from .graph_backend import get_graph_backend
+    get_graph_backend().warm_up()
+
+
+def _warm_anomaly_store():
+    from .anomaly_store import get_anomaly_store
+    get_anomaly_store()
+
+
+def _warm_aliases():
+    from .alias_index import get_alias_index
+    get_alias_index()
+
+
+def _warm_llm():
+    from .ceeymore import get_client, get_async_client
+    get_client()
+    get_async_client()
+
+
+def warm_up(llm=WARMUP_LLM):
+    """
+    Load the gazetteer and its fuzzy indexes, build the graph backend (opening
+    a Neo4j connection or the in-memory city index), open the anomaly store,
+    build the alias index and create the OpenAI clients. A step that fails is
+    logged and skipped; whatever it would have built is created on first use
+    instead.
+
+    Args:
+        llm (bool): Whether to create the OpenAI clients.
+
+    Returns:
+        dict: step -> seconds taken, or None if the step failed.
+    """
+    steps = [('gazetteer', _warm_gazetteer), ('graph', _warm_graph), ('anomaly_store', _warm_anomaly_store),
+             ('aliases', _warm_aliases)]
+    if llm:
+        steps.append(('llm', _warm_llm))
+
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.warning("Warm-up step '%s' failed", name, exc_info=True)
+            timings[name] = None
+            continue
+        timings[name] = time.perf_counter() - start
+    logger.info("Warm-up finished: %s", ', '.join(
+        f"{name}={seconds * 1000:.0f}ms" if seconds is not None else f"{name}=failed"
+        for name, seconds in timings.items()
+    ))
+    return timings